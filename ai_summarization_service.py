@@ -1,13 +1,44 @@
 """AI Summarization service using OpenRouter API with fallback models"""
 
+import contextvars
+import re
 import requests
 import json
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from openai import OpenAI
 from logger_config import setup_logger
-from config import OPENROUTER_API_KEY, OPENROUTER_API_KEY_BACKUP, PRIMARY_MODEL, FALLBACK_MODEL, OPENROUTER_BASE_URL
+from config import (
+    OPENROUTER_API_KEY, OPENROUTER_API_KEY_BACKUP, PRIMARY_MODEL, FALLBACK_MODEL, OPENROUTER_BASE_URL,
+    AI_HEDGE_ENABLED, AI_HEDGE_DELAY_SECONDS, AI_HEDGE_MAX_PARALLEL, COMPLETION_CACHE_ENABLED,
+    LONG_TRANSCRIPT_THRESHOLD_CHARS, TRANSCRIPT_CHUNK_CHARS, TRANSCRIPT_CHUNK_OVERLAP_TURNS,
+    TRANSCRIPT_CHUNK_PARALLELISM
+)
+from completion_cache import CompletionCache, make_cache_key
+from model_health import ModelHealthRegistry
+from metrics import LLM_ATTEMPT_SECONDS, LLM_ATTEMPTS_TOTAL, LLM_FALLBACKS_TOTAL
 
 logger = setup_logger()
 
+# Where a long turn may be cut: after sentence-ending punctuation
+SENTENCE_BOUNDARY = re.compile(r'(?<=[.!?])\s+')
+
+SYSTEM_MESSAGE = "You are an expert medical documentation assistant specializing in clinical notes and medical coding."
+
+# Bump a template's version whenever its prompt text changes so stale cached completions are never served
+PROMPT_TEMPLATE_VERSIONS = {
+    'clinical_summary': 1,
+    'medical_decision_making': 1,
+    'transcript_chunk_findings': 1,
+    'clinical_summary_merge': 1,
+    'patient_health_summary': 1,
+    'patient_health_summary_update': 1,
+    'patient_health_window': 1,
+    'patient_health_reduce': 1,
+    'patient_health_summary_reduce': 1,
+    'chat_assistant': 1,
+}
+
 class AISummarizationService:
     """Generate medical summaries using OpenRouter API with multiple models and backup keys"""
     
@@ -17,6 +48,13 @@ class AISummarizationService:
         self.base_url = OPENROUTER_BASE_URL
         self.primary_model = PRIMARY_MODEL
         self.fallback_model = FALLBACK_MODEL
+        self.hedge_enabled = AI_HEDGE_ENABLED
+        self.hedge_delay = AI_HEDGE_DELAY_SECONDS
+        self.hedge_max_parallel = AI_HEDGE_MAX_PARALLEL
+        self.long_transcript_threshold = LONG_TRANSCRIPT_THRESHOLD_CHARS
+        self.chunk_chars = TRANSCRIPT_CHUNK_CHARS
+        self.chunk_overlap_turns = TRANSCRIPT_CHUNK_OVERLAP_TURNS
+        self.chunk_parallelism = TRANSCRIPT_CHUNK_PARALLELISM
         self.client = OpenAI(
             base_url=self.base_url,
             api_key=self.api_key
@@ -25,20 +63,31 @@ class AISummarizationService:
             base_url=self.base_url,
             api_key=self.api_key_backup
         )
+        self.health = ModelHealthRegistry()
+        self.completion_cache = None
+        if COMPLETION_CACHE_ENABLED:
+            self.completion_cache = CompletionCache()
+            self.completion_cache.purge_stale_versions(PROMPT_TEMPLATE_VERSIONS)
         logger.info("✓ AISummarizationService initialized with OpenRouter and backup key")
     
-    def generate_clinical_summary(self, conversation_text):
+    def generate_clinical_summary(self, conversation_text, use_cache=True):
         """
         Generate clinical summary with Chief Complaint, History, and Assessment/Plan
         
         Args:
             conversation_text: The doctor-patient conversation
+            use_cache: Reuse a cached completion for an identical request
             
         Returns:
-            dict: Contains the clinical summary sections
+            dict: Contains the clinical summary sections (plus transcript_findings
+                  when a long conversation was summarized in chunks)
         """
         logger.info("🏥 Generating clinical summary...")
         
+        chunks = self._transcript_chunks(conversation_text)
+        if chunks:
+            return self._generate_chunked_clinical_summary(conversation_text, chunks, use_cache)
+        
         prompt = f"""You are a medical documentation assistant. Based on the following doctor-patient conversation, create a comprehensive medical note with the following sections:
 
 1. **Chief Complaint**: Brief statement of the main reason for visit (1-2 sentences)
@@ -61,7 +110,9 @@ ASSESSMENT_PLAN:
 
 Be concise, professional, and include all relevant medical details mentioned in the conversation."""
 
-        result = self._call_ai_with_fallback(prompt, "Clinical Summary")
+        result = self._call_ai_with_fallback(
+            prompt, "Clinical Summary", template='clinical_summary', use_cache=use_cache
+        )
         
         if result['success']:
             # Parse the response into sections
@@ -71,23 +122,36 @@ Be concise, professional, and include all relevant medical details mentioned in
         
         return result
     
-    def generate_medical_decision_making(self, conversation_text, clinical_summary):
+    def generate_medical_decision_making(self, conversation_text, clinical_summary, use_cache=True):
         """
         Generate Medical Decision Making summary with ICD-10 and CPT coding
         
         Args:
             conversation_text: The doctor-patient conversation
             clinical_summary: Previously generated clinical summary
+            use_cache: Reuse a cached completion for an identical request
             
         Returns:
             dict: Contains MDM analysis with coding
         """
         logger.info("📊 Generating Medical Decision Making summary...")
         
+        chunks = self._transcript_chunks(conversation_text)
+        if chunks:
+            # Use the findings extracted for the clinical summary instead of repeating the whole conversation
+            findings = clinical_summary.get('transcript_findings')
+            if not findings:
+                extraction = self._extract_transcript_findings(conversation_text, chunks, use_cache)
+                if not extraction['success']:
+                    return extraction
+                findings = extraction['findings']
+            conversation_section = f"FINDINGS FROM THE CONVERSATION (extracted part by part, in order):\n{findings}"
+        else:
+            conversation_section = f"CONVERSATION:\n{conversation_text}"
+        
         prompt = f"""You are a medical coding and documentation specialist. Based on the following clinical information, provide a comprehensive Medical Decision Making (MDM) analysis.
 
-CONVERSATION:
-{conversation_text}
+{conversation_section}
 
 CLINICAL SUMMARY:
 Chief Complaint: {clinical_summary.get('chief_complaint', 'N/A')}
@@ -120,7 +184,9 @@ Provide a detailed MDM analysis with the following structure:
 
 Be specific, accurate, highlight headings and subheadings and follow medical coding guidelines."""
 
-        result = self._call_ai_with_fallback(prompt, "Medical Decision Making")
+        result = self._call_ai_with_fallback(
+            prompt, "Medical Decision Making", template='medical_decision_making', use_cache=use_cache
+        )
         
         if result['success']:
             return {
@@ -131,59 +197,293 @@ Be specific, accurate, highlight headings and subheadings and follow medical cod
         
         return result
     
-    def _call_ai_with_fallback(self, prompt, summary_type):
+    def _transcript_chunks(self, conversation_text):
         """
-        Call AI model with automatic fallback (4 attempts total: 2 models × 2 API keys)
+        Chunks of a conversation too long for one prompt
+        
+        Returns:
+            list or None: Chunk texts, or None when a single prompt should be used
+                          (short conversation, or splitting would not shrink it)
+        """
+        if len(conversation_text) <= self.long_transcript_threshold:
+            return None
+        chunks = split_dialogue(conversation_text, self.chunk_chars, self.chunk_overlap_turns)
+        return chunks if len(chunks) > 1 else None
+    
+    def _generate_chunked_clinical_summary(self, conversation_text, chunks, use_cache=True):
+        """
+        Clinical summary of a conversation too long for one prompt
+        
+        Findings are extracted from overlapping chunks concurrently (map), then
+        merged into the usual CHIEF_COMPLAINT / HISTORY_OF_PRESENT_ILLNESS /
+        ASSESSMENT_PLAN note (reduce).
         
         Args:
-            prompt: The prompt to send
-            summary_type: Type of summary being generated (for logging)
+            conversation_text: The doctor-patient conversation
+            chunks: The conversation split by split_dialogue
+            use_cache: Reuse cached completions for identical requests
             
         Returns:
-            dict: Contains response and metadata
+            dict: Contains the clinical summary sections and transcript_findings
         """
-        # Attempt 1: Primary API key + Primary model (Llama)
-        logger.info(f"🤖 Attempt 1/4: {summary_type} with primary API key + {self.primary_model}")
-        result = self._call_openrouter(prompt, self.primary_model, self.client, "Primary API")
+        extraction = self._extract_transcript_findings(conversation_text, chunks, use_cache)
+        if not extraction['success']:
+            return extraction
+        
+        prompt = f"""You are a medical documentation assistant. The following findings were extracted, part by part and in order, from one long doctor-patient conversation (consecutive parts overlap, so a finding may appear twice). Based on them, create a comprehensive medical note with the following sections:
+
+1. **Chief Complaint**: Brief statement of the main reason for visit (1-2 sentences)
+2. **History of Present Illness**: Detailed description of symptoms, severity, duration, and clinical observations
+3. **Assessment/Plan**: Diagnosis, medications prescribed, and recommendations
+
+Findings:
+{extraction['findings']}
+
+Format your response EXACTLY as follows:
+
+CHIEF_COMPLAINT:
+[content here]
+
+HISTORY_OF_PRESENT_ILLNESS:
+[content here]
+
+ASSESSMENT_PLAN:
+[content here]
+
+Be concise and professional, merge duplicate findings, and when later parts of the conversation revise an earlier statement, keep the later one."""
+
+        result = self._call_ai_with_fallback(
+            prompt, "Clinical Summary", template='clinical_summary_merge', use_cache=use_cache
+        )
         
         if result['success']:
-            logger.info(f"✓ {summary_type} generated successfully (Attempt 1/4)")
-            return result
+            parsed = self._parse_clinical_summary(result['response'])
+            parsed['model_used'] = result['model_used']
+            parsed['transcript_findings'] = extraction['findings']
+            return parsed
         
-        # Attempt 2: Primary API key + Fallback model (DeepSeek)
-        logger.warning(f"⚠️ Attempt 1 failed: {result.get('error', 'Unknown error')}")
-        logger.info(f"🔄 Attempt 2/4: {summary_type} with primary API key + {self.fallback_model}")
+        return result
+    
+    def _extract_transcript_findings(self, conversation_text, chunks, use_cache=True):
+        """
+        Extract clinical findings from each chunk of a long conversation concurrently
         
-        result = self._call_openrouter(prompt, self.fallback_model, self.client, "Primary API")
+        Args:
+            conversation_text: The doctor-patient conversation
+            chunks: The conversation split by split_dialogue
+            use_cache: Reuse cached completions for identical requests
+            
+        Returns:
+            dict: success and findings (the per-chunk findings in conversation order), or an error
+        """
+        logger.info(f"🧩 Long conversation ({len(conversation_text)} characters): extracting findings from {len(chunks)} chunks")
         
-        if result['success']:
-            logger.info(f"✓ {summary_type} generated successfully (Attempt 2/4)")
-            return result
+        def extract(index):
+            prompt = f"""You are a medical documentation assistant. The following is part {index + 1} of {len(chunks)} of a doctor-patient conversation. Its first few turns may repeat the end of the previous part.
+
+Conversation (part {index + 1} of {len(chunks)}):
+{chunks[index]}
+
+List the clinically relevant findings stated in this part under these headings, as short bullet points, writing "None" under a heading with nothing to report:
+
+REASON FOR VISIT:
+SYMPTOMS (onset, duration, severity, modifying factors):
+HISTORY (past conditions, medications, allergies, social/family history):
+EXAMINATION AND RESULTS:
+ASSESSMENT (diagnoses discussed):
+PLAN (medications with doses, tests, referrals, follow-up):
+
+Only include what is said in this part; do not guess about the rest of the conversation."""
+            return self._call_ai_with_fallback(
+                prompt, f"Transcript Findings {index + 1}/{len(chunks)}", max_tokens=600,
+                template='transcript_chunk_findings', use_cache=use_cache
+            )
         
-        # Attempt 3: Backup API key + Primary model (Llama)
-        logger.warning(f"⚠️ Attempt 2 failed: {result.get('error', 'Unknown error')}")
-        logger.info(f"🔄 Attempt 3/4: {summary_type} with backup API key + {self.primary_model}")
+        with ThreadPoolExecutor(max_workers=max(1, min(self.chunk_parallelism, len(chunks))),
+                                thread_name_prefix='aiscribe-transcript-chunk') as executor:
+            # Run each extraction in a copy of this context so its logs keep the job's correlation id
+            futures = [executor.submit(contextvars.copy_context().run, extract, index) for index in range(len(chunks))]
+            results = [future.result() for future in futures]
         
-        result = self._call_openrouter(prompt, self.primary_model, self.client_backup, "Backup API")
+        for result in results:
+            if not result['success']:
+                return result
         
-        if result['success']:
-            logger.info(f"✓ {summary_type} generated successfully (Attempt 3/4)")
-            return result
+        findings = "\n\n".join(
+            f"PART {index + 1} OF {len(chunks)}:\n{result['response'].strip()}" for index, result in enumerate(results)
+        )
+        return {'success': True, 'findings': findings}
+    
+    def _get_attempts(self):
+        """
+        Ordered (model, client, api_key_type) combinations tried for each request
+
+        Returns:
+            list: 4 attempts total: 2 models × 2 API keys
+        """
+        return [
+            (self.primary_model, self.client, "Primary API"),
+            (self.fallback_model, self.client, "Primary API"),
+            (self.primary_model, self.client_backup, "Backup API"),
+            (self.fallback_model, self.client_backup, "Backup API"),
+        ]
+    
+    def _get_healthy_attempts(self, summary_type):
+        """
+        Attempts whose circuit currently lets calls through
         
-        # Attempt 4: Backup API key + Fallback model (DeepSeek)
-        logger.warning(f"⚠️ Attempt 3 failed: {result.get('error', 'Unknown error')}")
-        logger.info(f"🔄 Attempt 4/4: {summary_type} with backup API key + {self.fallback_model}")
+        Returns:
+            tuple: (attempts, whether circuits are enforced). When every circuit
+                is open all attempts are returned and the breaker is bypassed.
+        """
+        attempts = self._get_attempts()
+        healthy = [attempt for attempt in attempts if self.health.is_available(attempt[0], attempt[2])]
         
-        result = self._call_openrouter(prompt, self.fallback_model, self.client_backup, "Backup API")
+        if not healthy:
+            logger.warning(f"⚠️ All model circuits are open, trying every endpoint for {summary_type}")
+            return attempts, False
         
-        if result['success']:
-            logger.info(f"✓ {summary_type} generated successfully (Attempt 4/4)")
-        else:
-            logger.error(f"❌ All 4 attempts failed for {summary_type}")
+        if len(healthy) < len(attempts):
+            logger.info(f"⛔ Skipping {len(attempts) - len(healthy)} endpoint(s) with open circuits for {summary_type}")
+        return healthy, True
+    
+    def _call_ai_with_fallback(self, prompt, summary_type, max_tokens=None, template=None, use_cache=True):
+        """
+        Call AI model with automatic fallback (4 attempts total: 2 models × 2 API keys)
         
+        Returns a cached completion from any of the models when one exists.
+        Otherwise uses hedged requests when enabled, or tries each attempt in order,
+        skipping endpoints whose circuit is open (see ModelHealthRegistry).
+        
+        Args:
+            prompt: The prompt to send
+            summary_type: Type of summary being generated (for logging)
+            max_tokens: Optional maximum tokens for response
+            template: Prompt template name (see PROMPT_TEMPLATE_VERSIONS)
+            use_cache: Reuse and store cached completions
+            
+        Returns:
+            dict: Contains response and metadata
+        """
+        if use_cache:
+            # One cache request covering every model; a hit is counted against the key its model is tried with first
+            first_keys = {}
+            for model, _, api_key_type in self._get_attempts():
+                first_keys.setdefault(model, api_key_type)
+            cached = self._get_cached_completion(prompt, list(first_keys), max_tokens, template)
+            if cached:
+                logger.info(f"♻️ {summary_type} served from completion cache ({cached['model_used']})")
+                LLM_ATTEMPTS_TOTAL.inc(model=cached['model'], key=first_keys[cached['model']], outcome='cache_hit')
+                return cached
+        
+        attempts, check_circuit = self._get_healthy_attempts(summary_type)
+        call_options = {
+            'max_tokens': max_tokens,
+            'template': template,
+            'use_cache': use_cache,
+            'cache_lookup': False,
+            'check_circuit': check_circuit
+        }
+        
+        if self.hedge_enabled and self.hedge_max_parallel > 1:
+            return self._call_ai_hedged(prompt, summary_type, attempts, call_options)
+        
+        total = len(attempts)
+        result = None
+        
+        for index, (model, client, api_key_type) in enumerate(attempts, start=1):
+            if result is not None:
+                logger.warning(f"⚠️ Attempt {index - 1} failed: {result.get('error', 'Unknown error')}")
+                LLM_FALLBACKS_TOTAL.inc(summary_type=_metric_summary_type(template), reason='failure')
+            
+            icon = "🤖" if index == 1 else "🔄"
+            logger.info(f"{icon} Attempt {index}/{total}: {summary_type} with {api_key_type} key + {model}")
+            
+            result = self._call_openrouter(prompt, model, client, api_key_type, **call_options)
+            
+            if result['success']:
+                logger.info(f"✓ {summary_type} generated successfully (Attempt {index}/{total})")
+                return result
+        
+        logger.error(f"❌ All {total} attempts failed for {summary_type}")
         return result
     
-    def _call_openrouter(self, prompt, model, client, api_key_type="Primary API", max_tokens=None):
+    def _call_ai_hedged(self, prompt, summary_type, attempts, call_options=None):
+        """
+        Call AI models with hedged requests
+        
+        Starts the first attempt, then launches the next one whenever the hedge
+        delay passes without an answer or an in-flight attempt fails. The first
+        successful response wins; attempts that have not started are cancelled
+        and the results of slower in-flight attempts are discarded.
+        
+        Args:
+            prompt: The prompt to send
+            summary_type: Type of summary being generated (for logging)
+            attempts: Ordered (model, client, api_key_type) attempts to race
+            call_options: Extra keyword arguments for _call_openrouter
+            
+        Returns:
+            dict: Contains response and metadata of the winning attempt
+        """
+        call_options = call_options or {}
+        total = len(attempts)
+        executor = ThreadPoolExecutor(max_workers=self.hedge_max_parallel, thread_name_prefix='aiscribe-hedge')
+        pending = {}
+        next_index = 0
+        last_result = None
+        
+        def launch(reason):
+            nonlocal next_index
+            model, client, api_key_type = attempts[next_index]
+            next_index += 1
+            if next_index > 1:
+                LLM_FALLBACKS_TOTAL.inc(summary_type=_metric_summary_type(call_options.get('template')), reason=reason)
+            icon = "🤖" if next_index == 1 else "🔄"
+            logger.info(f"{icon} Attempt {next_index}/{total}: {summary_type} with {api_key_type} key + {model}")
+            # Run in a copy of the caller's context so attempt logs keep its correlation id
+            future = executor.submit(contextvars.copy_context().run, self._call_openrouter, prompt, model, client, api_key_type, **call_options)
+            pending[future] = next_index
+        
+        try:
+            launch('first')
+            
+            while pending:
+                can_hedge = next_index < total and len(pending) < self.hedge_max_parallel
+                done, _ = wait(
+                    pending,
+                    timeout=self.hedge_delay if can_hedge else None,
+                    return_when=FIRST_COMPLETED
+                )
+                
+                if not done:
+                    # Hedge delay elapsed with no answer: race the next attempt
+                    logger.info(f"⏱️ No response after {self.hedge_delay}s, hedging {summary_type}")
+                    launch('hedge')
+                    continue
+                
+                for future in done:
+                    attempt_number = pending.pop(future)
+                    result = future.result()
+                    
+                    if result['success']:
+                        logger.info(f"✓ {summary_type} generated successfully (Attempt {attempt_number}/{total})")
+                        return result
+                    
+                    logger.warning(f"⚠️ Attempt {attempt_number} failed: {result.get('error', 'Unknown error')}")
+                    last_result = result
+                
+                # Fast failure: start the next attempts right away
+                while next_index < total and len(pending) < self.hedge_max_parallel:
+                    launch('failure')
+            
+            logger.error(f"❌ All {total} attempts failed for {summary_type}")
+            return last_result
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+    
+    def _call_openrouter(self, prompt, model, client, api_key_type="Primary API", max_tokens=None,
+                         template=None, use_cache=True, cache_lookup=True, check_circuit=True):
         """
         Make API call to OpenRouter
         
@@ -193,10 +493,31 @@ Be specific, accurate, highlight headings and subheadings and follow medical cod
             client: OpenAI client instance to use
             api_key_type: Type of API key being used (for logging)
             max_tokens: Optional maximum tokens for response
+            template: Prompt template name (see PROMPT_TEMPLATE_VERSIONS)
+            use_cache: Reuse and store cached completions
+            cache_lookup: Check the cache before calling (False when the caller already did)
+            check_circuit: Skip the call if the endpoint's circuit is open
             
         Returns:
             dict: Response data
         """
+        if use_cache and cache_lookup:
+            cached = self._get_cached_completion(prompt, [model], max_tokens, template)
+            if cached:
+                logger.info(f"♻️ Served {model} completion from cache")
+                LLM_ATTEMPTS_TOTAL.inc(model=model, key=api_key_type, outcome='cache_hit')
+                return cached
+        
+        if check_circuit and not self.health.allow(model, api_key_type):
+            LLM_ATTEMPTS_TOTAL.inc(model=model, key=api_key_type, outcome='circuit_open')
+            return {
+                'success': False,
+                'error': f'Circuit open for {model} ({api_key_type})',
+                'model': model,
+                'model_used': f"{model} ({api_key_type})"
+            }
+        
+        started = time.monotonic()
         try:
             # Build request parameters
             request_params = {
@@ -208,7 +529,7 @@ Be specific, accurate, highlight headings and subheadings and follow medical cod
                 "messages": [
                     {
                         "role": "system",
-                        "content": "You are an expert medical documentation assistant specializing in clinical notes and medical coding."
+                        "content": SYSTEM_MESSAGE
                     },
                     {
                         "role": "user",
@@ -225,22 +546,91 @@ Be specific, accurate, highlight headings and subheadings and follow medical cod
             completion = client.chat.completions.create(**request_params)
             
             response_text = completion.choices[0].message.content
+            self.health.record_success(model, api_key_type, time.monotonic() - started)
+            self._record_attempt(model, api_key_type, 'success', time.monotonic() - started)
+            
+            if use_cache and response_text:
+                self._store_cached_completion(prompt, model, max_tokens, template, response_text, f"{model} ({api_key_type})")
             
             return {
                 'success': True,
                 'response': response_text,
+                'model': model,
                 'model_used': f"{model} ({api_key_type})"
             }
             
         except Exception as e:
             error_msg = str(e)
             logger.error(f"❌ API call failed for {model} with {api_key_type}: {error_msg}")
+            self.health.record_failure(model, api_key_type, time.monotonic() - started, error_msg)
+            self._record_attempt(model, api_key_type, 'error', time.monotonic() - started)
             
             return {
                 'success': False,
                 'error': error_msg,
+                'model': model,
                 'model_used': f"{model} ({api_key_type})"
             }
+
+    def _record_attempt(self, model, api_key_type, outcome, seconds):
+        """Count an OpenRouter call and record its latency for /api/metrics"""
+        LLM_ATTEMPTS_TOTAL.inc(model=model, key=api_key_type, outcome=outcome)
+        LLM_ATTEMPT_SECONDS.observe(seconds, model=model, key=api_key_type, outcome=outcome)
+
+    def _completion_cache_key(self, prompt, model, max_tokens, template):
+        """Cache key for a request, tied to the current version of its prompt template"""
+        template = template or 'adhoc'
+        return make_cache_key(
+            model, prompt, SYSTEM_MESSAGE, max_tokens, template, PROMPT_TEMPLATE_VERSIONS.get(template, 0)
+        )
+    
+    def _get_cached_completion(self, prompt, models, max_tokens, template):
+        """
+        Look up a cached completion for a request from any of the given models
+        
+        All models are checked in one cache request (counted once in the cache
+        stats); earlier models are preferred.
+        
+        Returns:
+            dict or None: Response data marked as cached
+        """
+        if not self.completion_cache:
+            return None
+        
+        keys = {self._completion_cache_key(prompt, model, max_tokens, template): model for model in models}
+        try:
+            key, entry = self.completion_cache.get_first(list(keys))
+        except Exception as e:
+            logger.warning(f"⚠️ Completion cache lookup failed: {str(e)}")
+            return None
+        
+        if entry is None:
+            return None
+        
+        return {
+            'success': True,
+            'response': entry['response'],
+            'model': keys[key],
+            'model_used': entry['model_used'],
+            'cached': True
+        }
+    
+    def _store_cached_completion(self, prompt, model, max_tokens, template, response_text, model_used):
+        """Store a successful completion (cache failures never fail the request)"""
+        if not self.completion_cache:
+            return
+        
+        template = template or 'adhoc'
+        try:
+            self.completion_cache.put(
+                self._completion_cache_key(prompt, model, max_tokens, template),
+                response_text,
+                model_used,
+                template,
+                PROMPT_TEMPLATE_VERSIONS.get(template, 0)
+            )
+        except Exception as e:
+            logger.warning(f"⚠️ Could not cache completion: {str(e)}")
     
     def _parse_clinical_summary(self, response_text):
         """
@@ -289,3 +679,100 @@ Be specific, accurate, highlight headings and subheadings and follow medical cod
         
         return sections
 
+
+def _metric_summary_type(template):
+    """
+    Metric label for a request's summary type
+    
+    Summary names can carry per-call detail (e.g. chunk numbers), so metrics
+    are labelled by prompt template, which is a fixed set.
+    """
+    return template if template in PROMPT_TEMPLATE_VERSIONS else 'other'
+
+
+def split_dialogue(conversation_text, max_chars, overlap_turns):
+    """
+    Split a formatted conversation into chunks on speaker-turn boundaries
+    
+    Each line of the text ("doctor: ...", "patient: ...") is one turn. A chunk
+    holds whole turns up to max_chars, and each chunk after the first starts
+    with up to overlap_turns turns of the previous one (at most a quarter of
+    max_chars) so statements split across the boundary keep their context.
+    
+    A turn longer than max_chars (e.g. the single "doctor notes:" line of a
+    summary recording) is first cut into pieces of at most a quarter of
+    max_chars on sentence boundaries, or on whitespace inside a very long
+    sentence; each piece keeps the speaker label and counts as a turn.
+    
+    Args:
+        conversation_text: Text from TranscriptionService.format_dialogue_text
+        max_chars: Target maximum chunk length
+        overlap_turns: Turns repeated at the start of the next chunk
+        
+    Returns:
+        list: Chunk texts in conversation order
+    """
+    piece_chars = max(max_chars // 4, 1)
+    turns = []
+    for line in conversation_text.split("\n"):
+        if not line.strip():
+            continue
+        if len(line) <= max_chars:
+            turns.append(line)
+            continue
+        speaker, separator, text = line.partition(': ')
+        label = f"{speaker}: " if separator and len(speaker) < 40 else ''
+        if not label:
+            text = line
+        turns.extend(label + piece for piece in _split_text(text, max(piece_chars - len(label), 1)))
+    
+    chunks = []
+    start = 0
+    while start < len(turns):
+        end = start
+        length = 0
+        while end < len(turns) and (end == start or length + len(turns[end]) + 1 <= max_chars):
+            length += len(turns[end]) + 1
+            end += 1
+        chunks.append("\n".join(turns[start:end]))
+        if end >= len(turns):
+            break
+        # Step back for the overlap (bounded in size), but always move forward by at least one turn
+        overlap = 0
+        overlap_length = 0
+        while (overlap < overlap_turns and end - overlap - 1 > start
+               and overlap_length + len(turns[end - overlap - 1]) <= piece_chars):
+            overlap_length += len(turns[end - overlap - 1])
+            overlap += 1
+        start = end - overlap
+    return chunks
+
+
+def _split_text(text, max_chars):
+    """Cut text into pieces of at most max_chars on sentence boundaries, then whitespace"""
+    pieces = []
+    current = ''
+    for sentence in SENTENCE_BOUNDARY.split(text.strip()):
+        # A sentence that is too long on its own is cut between words (or, failing that, anywhere)
+        parts = [sentence]
+        if len(sentence) > max_chars:
+            parts = []
+            for word in sentence.split():
+                while len(word) > max_chars:
+                    parts.append(word[:max_chars])
+                    word = word[max_chars:]
+                if parts and len(parts[-1]) + 1 + len(word) <= max_chars:
+                    parts[-1] += ' ' + word
+                else:
+                    parts.append(word)
+        
+        for part in parts:
+            if current and len(current) + 1 + len(part) <= max_chars:
+                current += ' ' + part
+            else:
+                if current:
+                    pieces.append(current)
+                current = part
+    if current:
+        pieces.append(current)
+    return pieces
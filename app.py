@@ -1,19 +1,37 @@
 """Main Flask application for AIscribe"""
 
+from service_registry import LazyService, startup_report
+startup_report.begin_import_timing()
+
 from flask import Flask, request, jsonify, render_template, send_from_directory, session, redirect, url_for
 from flask_cors import CORS
 import os
 from werkzeug.utils import secure_filename
 from datetime import datetime
 import json
+import re
+import hashlib
+import hmac
+import threading
+import time
 from functools import wraps
 
-from logger_config import setup_logger
-from config import UPLOAD_FOLDER, ALLOWED_EXTENSIONS, MAX_FILE_SIZE, PRIMARY_MODEL, FALLBACK_MODEL, OPENAI_API_KEY
-from transcription_service import TranscriptionService
+from logger_config import setup_logger, correlation_id, new_correlation_id
+from config import (
+    UPLOAD_FOLDER, ALLOWED_EXTENSIONS, MAX_FILE_SIZE, OPENAI_API_KEY,
+    TRANSCRIPTION_WEBHOOK_URL, TRANSCRIPTION_WEBHOOK_SECRET, TRANSCRIPTION_WEBHOOK_FALLBACK_SECONDS,
+    METRICS_TOKEN, SSE_KEEPALIVE_SECONDS, SSE_MAX_STREAM_SECONDS
+)
+from transcription_service import TranscriptionService, WEBHOOK_AUTH_HEADER
 from ai_summarization_service import AISummarizationService
 from auth_service import AuthService
 from email_service import EmailService
+from email_queue import OutboundEmailQueue
+from inbox_sync import InboxSyncDaemon
+from job_queue import JobQueue
+from recording_catalog import RecordingCatalog
+from health_summaries import PatientHealthSummarizer
+from metrics import registry as metrics_registry, FILE_IO_SECONDS
 from openai import OpenAI
 import base64
 
@@ -27,18 +45,40 @@ app.config['SECRET_KEY'] = 'your-secret-key-change-in-production-12345'  # Chang
 # Create upload folder if it doesn't exist
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
-# Initialize services
+# Initialize services lazily: each process builds them on first use (after gunicorn forks)
 logger = setup_logger()
-transcription_service = TranscriptionService()
-ai_service = AISummarizationService()
-auth_service = AuthService()
-email_service = EmailService()
-openai_client = OpenAI(api_key=OPENAI_API_KEY)  # For vision tasks
+transcription_service = LazyService('transcription_service', TranscriptionService)
+ai_service = LazyService('ai_service', AISummarizationService)
+auth_service = LazyService('auth_service', AuthService)
+email_service = LazyService('email_service', EmailService)
+email_queue = LazyService('email_queue', lambda: OutboundEmailQueue(email_service))
+inbox_sync = LazyService('inbox_sync', lambda: InboxSyncDaemon(email_service))
+job_queue = LazyService('job_queue', JobQueue)
+recording_catalog = LazyService('recording_catalog', RecordingCatalog)
+health_summaries = LazyService('health_summaries', lambda: PatientHealthSummarizer(ai_service))
+openai_client = LazyService('openai_client', lambda: OpenAI(api_key=OPENAI_API_KEY))  # For vision tasks
 
 logger.info("=" * 80)
 logger.info("🚀 AIscribe Application Starting")
 logger.info("=" * 80)
 
+# Correlation ids: accept a sane X-Request-ID from the proxy or client, else mint one
+REQUEST_ID_PATTERN = re.compile(r'^[A-Za-z0-9._-]{1,64}$')
+
+@app.before_request
+def assign_correlation_id():
+    """Tag everything this request logs (and the jobs and emails it starts) with one id"""
+    request_id = request.headers.get('X-Request-ID', '')
+    correlation_id.set(request_id if REQUEST_ID_PATTERN.match(request_id) else new_correlation_id())
+
+@app.after_request
+def add_request_id_header(response):
+    """Echo the correlation id so clients can quote it when reporting problems"""
+    request_id = correlation_id.get()
+    if request_id:
+        response.headers['X-Request-ID'] = request_id
+    return response
+
 # Login required decorator
 def login_required(f):
     @wraps(f)
@@ -82,7 +122,7 @@ def view_recording(recording_id):
         if not os.path.exists(results_file):
             return "Recording not found", 404
         
-        with open(results_file, 'r', encoding='utf-8') as f:
+        with FILE_IO_SECONDS.time(operation='results_read'), open(results_file, 'r', encoding='utf-8') as f:
             recording_data = json.load(f)
         
         # Format the data for display
@@ -181,62 +221,17 @@ def api_login():
 def get_recordings():
     """Get list of all recordings organized by patient"""
     try:
-        recordings = []
-        upload_folder = app.config['UPLOAD_FOLDER']
-        
-        # Iterate through patient folders
-        if os.path.exists(upload_folder):
-            for patient_id in os.listdir(upload_folder):
-                patient_path = os.path.join(upload_folder, patient_id)
-                
-                # Skip if not a directory
-                if not os.path.isdir(patient_path):
-                    continue
-                
-                # Look for all *_results.json files in patient folder
-                for filename in os.listdir(patient_path):
-                    if filename.endswith('_results.json'):
-                        results_file = os.path.join(patient_path, filename)
-                        
-                        try:
-                            with open(results_file, 'r', encoding='utf-8') as f:
-                                data = json.load(f)
-                            
-                            # Extract timestamp from filename (YYYYMMDD_HHMMSS_results.json)
-                            timestamp_from_file = filename.replace('_results.json', '')
-                            
-                            # Format timestamp
-                            timestamp_str = data.get('timestamp', '')
-                            try:
-                                dt = datetime.fromisoformat(timestamp_str)
-                                date_formatted = dt.strftime('%B %d')  # e.g., "November 14"
-                                time_formatted = dt.strftime('%m/%d/%Y, %I:%M %p')
-                            except:
-                                date_formatted = 'Unknown Date'
-                                time_formatted = 'N/A'
-                            
-                            # Create recording ID from patient and timestamp
-                            recording_id = f"{patient_id}/{timestamp_from_file}"
-                            
-                            recordings.append({
-                                'id': recording_id,
-                                'title': data.get('filename', patient_id).split('.')[0],
-                                'patient_id': patient_id,
-                                'timestamp': time_formatted,
-                                'date': date_formatted,
-                                'created_at': timestamp_str
-                            })
-                        except Exception as e:
-                            logger.warning(f"Error loading recording {results_file}: {str(e)}")
-                            continue
+        etag = catalog_etag()
+        if request.if_none_match.contains(etag):
+            return not_modified(etag)
         
-        # Sort by newest first
-        recordings.sort(key=lambda x: x['created_at'], reverse=True)
+        # Catalog rows are already sorted newest first
+        recordings = [format_recording(row) for row in recording_catalog.list_recordings()]
         
-        return jsonify({
+        return conditional_json({
             'success': True,
             'recordings': recordings
-        })
+        }, etag)
     except Exception as e:
         logger.error(f"Error getting recordings: {str(e)}")
         return jsonify({
@@ -244,6 +239,124 @@ def get_recordings():
             'error': str(e)
         }), 500
 
+@app.route('/api/patients', methods=['GET'])
+@login_required
+def get_patients():
+    """
+    Get one page of patient folders ordered by latest visit
+    
+    Query params: limit, cursor, sort ('newest', 'oldest' or 'name'), search
+    """
+    try:
+        limit = min(max(request.args.get('limit', 20, type=int), 1), 100)
+        cursor = request.args.get('cursor') or None
+        sort = request.args.get('sort', 'newest')
+        search = request.args.get('search', '').strip() or None
+        
+        if sort not in ('newest', 'oldest', 'name'):
+            return jsonify({
+                'success': False,
+                'error': 'Invalid sort. Use newest, oldest or name'
+            }), 400
+        
+        etag = catalog_etag()
+        if request.if_none_match.contains(etag):
+            return not_modified(etag)
+        
+        patients, next_cursor = recording_catalog.list_patients(limit=limit, cursor=cursor, sort=sort, search=search)
+        
+        return conditional_json({
+            'success': True,
+            'patients': patients,
+            'next_cursor': next_cursor
+        }, etag)
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+    except Exception as e:
+        logger.error(f"Error getting patients: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@app.route('/api/patients/<patient_id>/recordings', methods=['GET'])
+@login_required
+def get_patient_recordings(patient_id):
+    """
+    Get one page of a patient's recordings, newest first
+    
+    Query params: limit, cursor
+    """
+    try:
+        limit = min(max(request.args.get('limit', 20, type=int), 1), 100)
+        cursor = request.args.get('cursor') or None
+        
+        etag = catalog_etag()
+        if request.if_none_match.contains(etag):
+            return not_modified(etag)
+        
+        rows, next_cursor = recording_catalog.list_patient_recordings(patient_id, limit=limit, cursor=cursor)
+        
+        return conditional_json({
+            'success': True,
+            'patient_id': patient_id,
+            'recordings': [format_recording(row) for row in rows],
+            'next_cursor': next_cursor
+        }, etag)
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+    except Exception as e:
+        logger.error(f"Error getting recordings for patient {patient_id}: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+def format_recording(row):
+    """Format a catalog row for the dashboard (id is patient_id/timestamp)"""
+    timestamp_str = row['created_at']
+    try:
+        dt = datetime.fromisoformat(timestamp_str)
+        date_formatted = dt.strftime('%B %d')  # e.g., "November 14"
+        time_formatted = dt.strftime('%m/%d/%Y, %I:%M %p')
+    except:
+        date_formatted = 'Unknown Date'
+        time_formatted = 'N/A'
+    
+    return {
+        'id': row['id'],
+        'title': row['title'],
+        'patient_id': row['patient_id'],
+        'timestamp': time_formatted,
+        'date': date_formatted,
+        'created_at': timestamp_str
+    }
+
+def catalog_etag():
+    """ETag for catalog-backed listings: changes whenever a recording is added or deleted"""
+    digest = hashlib.sha1(f"{recording_catalog.get_version()}|{request.full_path}".encode('utf-8')).hexdigest()
+    return digest[:20]
+
+def not_modified(etag):
+    """Empty 304 response for a matching If-None-Match"""
+    response = app.response_class(status=304)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+def conditional_json(payload, etag):
+    """JSON response the browser must revalidate with If-None-Match"""
+    response = jsonify(payload)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
 @app.route('/api/recording/<path:recording_id>', methods=['DELETE'])
 @login_required
 def delete_recording(recording_id):
@@ -263,18 +376,22 @@ def delete_recording(recording_id):
         deleted = False
         
         if os.path.exists(results_file):
-            os.remove(results_file)
+            with FILE_IO_SECONDS.time(operation='results_delete'):
+                os.remove(results_file)
             deleted = True
             logger.info(f"Deleted results file: {results_file}")
         
         for audio_file in audio_files:
             audio_path = os.path.join(patient_folder, audio_file)
             if os.path.exists(audio_path):
-                os.remove(audio_path)
+                with FILE_IO_SECONDS.time(operation='audio_delete'):
+                    os.remove(audio_path)
                 deleted = True
                 logger.info(f"Deleted audio file: {audio_path}")
         
         if deleted:
+            recording_catalog.delete_recording(patient_id, timestamp)
+            health_summaries.invalidate(secure_filename(patient_id))
             return jsonify({
                 'success': True,
                 'message': 'Recording deleted successfully'
@@ -300,14 +417,76 @@ def health_check():
         'timestamp': datetime.now().isoformat()
     })
 
+@app.route('/api/metrics', methods=['GET'])
+def metrics_view():
+    """Counters and latency histograms for all workers, in the Prometheus text format"""
+    if METRICS_TOKEN and not hmac.compare_digest(
+        request.headers.get('Authorization', ''), f"Bearer {METRICS_TOKEN}"
+    ):
+        return jsonify({'success': False, 'error': 'Unauthorized'}), 401
+    
+    return app.response_class(metrics_registry.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/api/cache-stats', methods=['GET'])
+@login_required
+def cache_stats():
+    """Hit/miss counters (per worker process) and disk usage of the caches"""
+    transcription_cache = transcription_service.cache
+    completion_cache = ai_service.completion_cache
+    return jsonify({
+        'success': True,
+        'transcription': transcription_cache.stats() if transcription_cache else None,
+        'completions': completion_cache.stats() if completion_cache else None
+    })
+
+@app.route('/api/model-health', methods=['GET'])
+@login_required
+def model_health():
+    """Circuit state, failure counts and rolling latency per model / API key (per worker process)"""
+    return jsonify({
+        'success': True,
+        'endpoints': ai_service.health.status()
+    })
+
+@app.route('/api/email-queue', methods=['GET'])
+@login_required
+def email_queue_stats():
+    """Outbound email queue depth and delivery latency"""
+    return jsonify({
+        'success': True,
+        'queue': email_queue.stats(),
+        'smtp_pool': email_service.smtp_pool.stats()
+    })
+
+@app.route('/api/startup-report', methods=['GET'])
+@login_required
+def startup_report_view():
+    """Import and service initialization cost for this worker"""
+    return jsonify({
+        'success': True,
+        'startup': startup_report.snapshot()
+    })
+
+@app.route('/api/inbox-sync', methods=['GET'])
+@login_required
+def inbox_sync_status():
+    """Background inbox sync state"""
+    return jsonify({
+        'success': True,
+        'inbox_sync': inbox_sync.status()
+    })
+
 @app.route('/api/process-audio', methods=['POST'])
 @login_required
 def process_audio():
     """
-    Main endpoint to process audio file:
+    Accept an audio file and queue it for background processing:
     1. Transcribe with speaker diarization
     2. Generate clinical summary
     3. Generate MDM summary
+    4. Queue the patient email for delivery
+
+    Returns immediately with a job id; poll /api/jobs/<job_id> for progress.
     """
     logger.info("\n" + "=" * 80)
     logger.info("📥 New audio processing request received")
@@ -354,152 +533,37 @@ def process_audio():
         filepath = os.path.join(patient_folder, filename_with_timestamp)
         
         logger.info(f"💾 Saving file to: {patient_folder}/{filename_with_timestamp}")
-        file.save(filepath)
+        save_started = time.monotonic()
+        audio_digest = save_upload(file, filepath)
+        save_seconds = time.monotonic() - save_started
         logger.info(f"✓ File saved successfully")
         
-        # Step 1: Transcribe audio (with or without speaker diarization based on recording type)
-        enable_diarization = (recording_type == 'conversation')
-        
-        logger.info("\n" + "-" * 80)
-        if enable_diarization:
-            logger.info("STEP 1: TRANSCRIPTION WITH SPEAKER DIARIZATION")
-        else:
-            logger.info("STEP 1: TRANSCRIPTION (SUMMARY NOTES MODE)")
-        logger.info("-" * 80)
-        
-        transcription_result = transcription_service.transcribe_audio(filepath, enable_diarization=enable_diarization)
-        
-        if not transcription_result['success']:
-            logger.error(f"❌ Transcription failed: {transcription_result.get('error')}")
-            return jsonify(transcription_result), 500
-        
-        dialogue = transcription_result['dialogue']
-        conversation_text = transcription_service.format_dialogue_text(dialogue)
-        
-        logger.info(f"✓ Transcription completed: {len(conversation_text)} characters")
-        
-        # Step 2: Generate clinical summary
-        logger.info("\n" + "-" * 80)
-        logger.info("STEP 2: GENERATING CLINICAL SUMMARY")
-        logger.info("-" * 80)
-        
-        clinical_summary = ai_service.generate_clinical_summary(conversation_text)
-        
-        if not clinical_summary['success']:
-            logger.error(f"❌ Clinical summary generation failed")
-            return jsonify({
-                'success': False,
-                'error': 'Failed to generate clinical summary',
-                'transcription': transcription_result
-            }), 500
-        
-        logger.info(f"✓ Clinical summary generated using: {clinical_summary['model_used']}")
-        
-        # Step 3: Generate Medical Decision Making summary
-        logger.info("\n" + "-" * 80)
-        logger.info("STEP 3: GENERATING MEDICAL DECISION MAKING SUMMARY")
-        logger.info("-" * 80)
-        
-        mdm_summary = ai_service.generate_medical_decision_making(
-            conversation_text,
-            clinical_summary
-        )
-        
-        if not mdm_summary['success']:
-            logger.error(f"❌ MDM summary generation failed")
-            # Still return clinical summary even if MDM fails
-            return jsonify({
-                'success': True,
-                'transcription': transcription_result,
-                'conversation_text': conversation_text,
-                'clinical_summary': clinical_summary,
-                'mdm_summary': {'success': False, 'error': 'MDM generation failed'},
-                'warning': 'MDM summary could not be generated'
-            }), 200
-        
-        logger.info(f"✓ MDM summary generated using: {mdm_summary['model_used']}")
-        
-        # Generate and send patient email
-        logger.info("\n" + "-" * 80)
-        logger.info("STEP 4: GENERATING AND SENDING PATIENT EMAIL")
-        logger.info("-" * 80)
-        
-        generated_email = generate_patient_email(clinical_summary, mdm_summary)
-        logger.info("✓ Patient email generated")
-        
-        # Prepare email data
-        email_data = {
-            'timestamp': datetime.now().isoformat(),
-            'patient_id': patient_id,
-            'to': patient_email if patient_email else f"{patient_id}@patient.email",
-            'subject': generated_email['subject'],
-            'body': generated_email['body'],
-            'direction': 'outbound',
-            'sent': False
-        }
-        
-        # Actually send email if patient email is provided
-        if patient_email and patient_email.strip():
-            logger.info(f"📤 Sending email to: {patient_email}")
-            send_result = email_service.send_email(
-                to_email=patient_email,
-                subject=generated_email['subject'],
-                body_html=generated_email['body'],
-                patient_id=patient_id
-            )
-            
-            if send_result['success']:
-                email_data['sent'] = True
-                email_data['sent_at'] = send_result.get('sent_at')
-                logger.info(f"✅ Email sent successfully to {patient_email}")
-            else:
-                email_data['send_error'] = send_result.get('error')
-                logger.warning(f"⚠️ Email sending failed: {send_result.get('error')}")
-        else:
-            logger.info("ℹ️ No patient email provided, email not sent")
-        
-        # Save email to patient folder
-        email_filename = f"{timestamp}_email.json"
-        email_filepath = os.path.join(patient_folder, email_filename)
-        
-        with open(email_filepath, 'w', encoding='utf-8') as f:
-            json.dump(email_data, f, indent=2, ensure_ascii=False)
-        
-        logger.info(f"💾 Email saved to: {patient_folder}/{email_filename}")
-        
-        # Save results to a JSON file in the patient folder with timestamp
-        results = {
-            'timestamp': datetime.now().isoformat(),
+        # Hand the rest of the pipeline to the background worker pool
+        queued = job_queue.enqueue('process_audio', run_audio_pipeline, {
+            'filepath': filepath,
             'filename': filename,
+            'timestamp': timestamp,
             'patient_id': patient_id,
+            'patient_email': patient_email,
             'recording_type': recording_type,
-            'transcription': transcription_result,
-            'conversation_text': conversation_text,
-            'clinical_summary': clinical_summary,
-            'mdm_summary': mdm_summary
-        }
+            'patient_folder': patient_folder,
+            'audio_digest': audio_digest
+        }, completed_stages={'file_saved': save_seconds})
         
-        results_filename = f"{timestamp}_results.json"
-        results_filepath = os.path.join(patient_folder, results_filename)
+        if not queued['success']:
+            return jsonify(queued), 503
         
-        with open(results_filepath, 'w', encoding='utf-8') as f:
-            json.dump(results, f, indent=2, ensure_ascii=False)
-        
-        logger.info(f"💾 Results saved to: {patient_folder}/{results_filename}")
-        
-        logger.info("\n" + "=" * 80)
-        logger.info("✅ PROCESSING COMPLETED SUCCESSFULLY")
-        logger.info("=" * 80 + "\n")
+        job = queued['job']
         
         return jsonify({
             'success': True,
-            'transcription': transcription_result,
-            'conversation_text': conversation_text,
-            'clinical_summary': clinical_summary,
-            'mdm_summary': mdm_summary,
+            'job_id': job['id'],
+            'status': job['status'],
+            'status_url': url_for('get_job_status', job_id=job['id']),
+            'events_url': url_for('stream_job_events', job_id=job['id']),
             'patient_id': patient_id,
             'recording_id': f"{patient_id}/{timestamp}"
-        })
+        }), 202
     
     except Exception as e:
         logger.error(f"❌ Unexpected error: {str(e)}")
@@ -509,6 +573,455 @@ def process_audio():
             'error': f'Internal server error: {str(e)}'
         }), 500
 
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+@login_required
+def get_job_status(job_id):
+    """Report the stage, timings and (once finished) the result of a background job"""
+    job = job_queue.get_job(job_id)
+    
+    if job is None:
+        return jsonify({
+            'success': False,
+            'error': 'Job not found'
+        }), 404
+    
+    return jsonify({
+        'success': True,
+        'job': job
+    })
+
+@app.route('/api/jobs/<job_id>/events', methods=['GET'])
+@login_required
+def stream_job_events(job_id):
+    """
+    Stream job progress as server-sent events
+    
+    Emits stage_started / progress / partial_result / stage_completed events with
+    the elapsed time of the stage, then a final job_completed or job_failed event.
+    Reconnecting clients resume after the Last-Event-ID they received.
+    
+    Idle streams get a ":" keepalive comment every SSE_KEEPALIVE_SECONDS. A stream
+    ends after SSE_MAX_STREAM_SECONDS (below the gunicorn timeout) with a
+    "reconnect" event, so a long job never holds one request open for its
+    whole duration.
+    """
+    if job_queue.get_job(job_id) is None:
+        return jsonify({
+            'success': False,
+            'error': 'Job not found'
+        }), 404
+    
+    last_event_id = request.headers.get('Last-Event-ID', type=int) or request.args.get('last_event_id', 0, type=int)
+    
+    def generate():
+        yield "retry: 1000\n\n"
+        for event in job_queue.stream_events(job_id, last_event_id=last_event_id,
+                                             timeout=SSE_MAX_STREAM_SECONDS, keepalive=SSE_KEEPALIVE_SECONDS):
+            if event is None:
+                yield ": keepalive\n\n"
+                continue
+            yield f"id: {event['id']}\nevent: {event['event']}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+        
+        job = job_queue.get_job(job_id)
+        if job is not None and job['status'] not in ('completed', 'failed'):
+            yield "event: reconnect\ndata: {}\n\n"
+    
+    return app.response_class(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+def save_upload(file, filepath, chunk_size=1024 * 1024):
+    """
+    Save an uploaded file while hashing its bytes
+    
+    Args:
+        file: Uploaded werkzeug FileStorage
+        filepath: Destination path
+        chunk_size: Bytes read per chunk
+        
+    Returns:
+        str: SHA-256 hex digest of the saved bytes
+    """
+    digest = hashlib.sha256()
+    
+    with FILE_IO_SECONDS.time(operation='audio_write'), open(filepath, 'wb') as f:
+        while True:
+            chunk = file.stream.read(chunk_size)
+            if not chunk:
+                break
+            digest.update(chunk)
+            f.write(chunk)
+    
+    return digest.hexdigest()
+
+def run_audio_pipeline(job, filepath, filename, timestamp, patient_id, patient_email, recording_type, patient_folder, audio_digest=None):
+    """
+    Run transcription, summaries and the patient email for a saved upload
+
+    The audio is only submitted here and the job is suspended, so a job worker
+    is never held while AssemblyAI transcribes. The job is resumed in
+    resume_audio_pipeline by AssemblyAI's completion webhook when
+    TRANSCRIPTION_WEBHOOK_URL is set, and otherwise (or if the webhook never
+    arrives) by the shared transcript poller.
+
+    Args:
+        job: Job tracking stage progress
+        filepath: Path of the saved audio file
+        filename: Original (sanitized) upload filename
+        timestamp: Recording timestamp used for all saved files
+        patient_id: Patient identifier
+        patient_email: Patient email address (may be empty)
+        recording_type: 'conversation' or 'summary'
+        patient_folder: Folder where results are stored
+        audio_digest: SHA-256 of the audio bytes (used for the transcription cache)
+
+    Returns:
+        dict: The processing result (same shape as the saved results file)
+    """
+    # Step 1: Transcribe audio (with or without speaker diarization based on recording type)
+    enable_diarization = (recording_type == 'conversation')
+    
+    logger.info("\n" + "-" * 80)
+    if enable_diarization:
+        logger.info("STEP 1: TRANSCRIPTION WITH SPEAKER DIARIZATION")
+    else:
+        logger.info("STEP 1: TRANSCRIPTION (SUMMARY NOTES MODE)")
+    logger.info("-" * 80)
+    
+    job.start_stage('transcription')
+    
+    transcription_result = transcription_service.get_cached_transcription(audio_digest, enable_diarization)
+    if transcription_result is None:
+        return submit_transcription_and_wait(job, filepath, enable_diarization)
+    
+    return process_transcription(
+        job, transcription_result, filename, timestamp, patient_id, patient_email, recording_type, patient_folder
+    )
+
+def resume_audio_pipeline(job, transcript_id, filepath, filename, timestamp, patient_id, patient_email, recording_type, patient_folder, audio_digest=None):
+    """
+    Continue run_audio_pipeline once AssemblyAI has finished the transcript
+
+    Args:
+        job: Suspended job being resumed
+        transcript_id: AssemblyAI transcript id
+        (remaining arguments as for run_audio_pipeline)
+
+    Returns:
+        dict: The processing result
+    """
+    enable_diarization = (recording_type == 'conversation')
+    transcription_result = transcription_service.get_transcription_result(
+        transcript_id,
+        enable_diarization=enable_diarization,
+        audio_digest=audio_digest
+    )
+    
+    if transcription_result is None:
+        # Callback arrived before the transcript was readable; wait for the next signal
+        job.progress('transcription', status='processing')
+        watch_waiting_transcription(job.id, transcript_id, filepath)
+        return job.suspend('transcription', transcript_id=transcript_id)
+    
+    return process_transcription(
+        job, transcription_result, filename, timestamp, patient_id, patient_email, recording_type, patient_folder
+    )
+
+def submit_transcription_and_wait(job, filepath, enable_diarization):
+    """
+    Submit the audio (with a completion webhook if configured) and suspend the job
+
+    Returns:
+        dict: The failed submission, or the suspension placeholder
+    """
+    submitted = transcription_service.submit_transcription(
+        filepath,
+        enable_diarization=enable_diarization,
+        webhook_url=f"{TRANSCRIPTION_WEBHOOK_URL}?job_id={job.id}" if TRANSCRIPTION_WEBHOOK_URL else None,
+        webhook_secret=TRANSCRIPTION_WEBHOOK_SECRET
+    )
+    
+    if not submitted['success']:
+        logger.error(f"❌ Transcription submission failed: {submitted.get('error')}")
+        job.finish_stage('transcription', status='failed')
+        return submitted
+    
+    transcript_id = submitted['transcript_id']
+    job.progress('transcription', status=submitted['status'])
+    if TRANSCRIPTION_WEBHOOK_URL:
+        logger.info(f"📨 Transcript {transcript_id} submitted, waiting for completion webhook")
+        watch_waiting_transcription(job.id, transcript_id, filepath)
+    else:
+        logger.info(f"📨 Transcript {transcript_id} submitted, waiting for the transcript poller")
+        # Nothing else writes the job while it waits, so the poller can report progress on it
+        watch_waiting_transcription(
+            job.id, transcript_id, filepath, min_interval=None,
+            progress_callback=lambda status: job.progress('transcription', status=status)
+        )
+    return job.suspend('transcription', transcript_id=transcript_id)
+
+def process_transcription(job, transcription_result, filename, timestamp, patient_id, patient_email, recording_type, patient_folder):
+    """
+    Finish the transcription stage, then generate summaries, send the email and save results
+
+    Args:
+        job: Job tracking stage progress (transcription stage running)
+        transcription_result: transcribe_audio result
+        (remaining arguments as for run_audio_pipeline)
+
+    Returns:
+        dict: The processing result (same shape as the saved results file)
+    """
+    if not transcription_result['success']:
+        logger.error(f"❌ Transcription failed: {transcription_result.get('error')}")
+        job.finish_stage('transcription', status='failed')
+        return transcription_result
+    
+    dialogue = transcription_result['dialogue']
+    conversation_text = transcription_service.format_dialogue_text(dialogue)
+    job.publish_partial('transcription', conversation_text=conversation_text, transcription=transcription_result)
+    job.finish_stage('transcription')
+    
+    logger.info(f"✓ Transcription completed: {len(conversation_text)} characters")
+    
+    # Step 2: Generate clinical summary
+    logger.info("\n" + "-" * 80)
+    logger.info("STEP 2: GENERATING CLINICAL SUMMARY")
+    logger.info("-" * 80)
+    
+    job.start_stage('clinical_summary')
+    clinical_summary = ai_service.generate_clinical_summary(conversation_text)
+    
+    if not clinical_summary['success']:
+        logger.error(f"❌ Clinical summary generation failed")
+        job.finish_stage('clinical_summary', status='failed')
+        return {
+            'success': False,
+            'error': 'Failed to generate clinical summary',
+            'transcription': transcription_result
+        }
+    
+    job.publish_partial('clinical_summary', clinical_summary=clinical_summary)
+    job.finish_stage('clinical_summary', model_used=clinical_summary['model_used'])
+    logger.info(f"✓ Clinical summary generated using: {clinical_summary['model_used']}")
+    
+    # Step 3: Generate Medical Decision Making summary
+    logger.info("\n" + "-" * 80)
+    logger.info("STEP 3: GENERATING MEDICAL DECISION MAKING SUMMARY")
+    logger.info("-" * 80)
+    
+    job.start_stage('mdm_summary')
+    mdm_summary = ai_service.generate_medical_decision_making(
+        conversation_text,
+        clinical_summary
+    )
+    
+    if not mdm_summary['success']:
+        logger.error(f"❌ MDM summary generation failed")
+        job.finish_stage('mdm_summary', status='failed')
+        # Still save and return the clinical summary even if MDM fails (no patient email)
+        mdm_summary = {'success': False, 'error': 'MDM generation failed'}
+        warning = 'MDM summary could not be generated'
+        save_recording_results(
+            job, filename, timestamp, patient_id, recording_type, patient_folder,
+            transcription_result, conversation_text, clinical_summary, mdm_summary, warning=warning
+        )
+        return {
+            'success': True,
+            'transcription': transcription_result,
+            'conversation_text': conversation_text,
+            'clinical_summary': clinical_summary,
+            'mdm_summary': mdm_summary,
+            'warning': warning,
+            'patient_id': patient_id,
+            'recording_id': f"{patient_id}/{timestamp}"
+        }
+    
+    job.publish_partial('mdm_summary', mdm_summary=mdm_summary)
+    job.finish_stage('mdm_summary', model_used=mdm_summary['model_used'])
+    logger.info(f"✓ MDM summary generated using: {mdm_summary['model_used']}")
+    
+    # Generate and queue patient email
+    logger.info("\n" + "-" * 80)
+    logger.info("STEP 4: GENERATING AND QUEUEING PATIENT EMAIL")
+    logger.info("-" * 80)
+    
+    job.start_stage('email')
+    generated_email = generate_patient_email(clinical_summary, mdm_summary)
+    logger.info("✓ Patient email generated")
+    
+    # Prepare email data
+    email_data = {
+        'timestamp': datetime.now().isoformat(),
+        'patient_id': patient_id,
+        'to': patient_email if patient_email else f"{patient_id}@patient.email",
+        'subject': generated_email['subject'],
+        'body': generated_email['body'],
+        'direction': 'outbound',
+        'sent': False,
+        'queued': bool(patient_email and patient_email.strip())
+    }
+    
+    # Save email to patient folder (the dispatcher updates it once delivered)
+    email_filename = f"{timestamp}_email.json"
+    email_filepath = os.path.join(patient_folder, email_filename)
+    
+    with FILE_IO_SECONDS.time(operation='email_write'), open(email_filepath, 'w', encoding='utf-8') as f:
+        json.dump(email_data, f, indent=2, ensure_ascii=False)
+    
+    # Hand delivery to the outbound queue so SMTP never delays the results
+    if email_data['queued']:
+        logger.info(f"📤 Queueing email to: {patient_email}")
+        email_queue.enqueue(
+            to_email=patient_email,
+            subject=generated_email['subject'],
+            body_html=generated_email['body'],
+            patient_id=patient_id,
+            record_path=email_filepath
+        )
+    else:
+        logger.info("ℹ️ No patient email provided, email not sent")
+    
+    job.finish_stage('email', queued=email_data['queued'])
+    logger.info(f"💾 Email saved to: {patient_folder}/{email_filename}")
+    
+    save_recording_results(
+        job, filename, timestamp, patient_id, recording_type, patient_folder,
+        transcription_result, conversation_text, clinical_summary, mdm_summary
+    )
+    
+    logger.info("\n" + "=" * 80)
+    logger.info("✅ PROCESSING COMPLETED SUCCESSFULLY")
+    logger.info("=" * 80 + "\n")
+    
+    return {
+        'success': True,
+        'transcription': transcription_result,
+        'conversation_text': conversation_text,
+        'clinical_summary': clinical_summary,
+        'mdm_summary': mdm_summary,
+        'patient_id': patient_id,
+        'recording_id': f"{patient_id}/{timestamp}"
+    }
+
+def save_recording_results(job, filename, timestamp, patient_id, recording_type, patient_folder,
+                           transcription_result, conversation_text, clinical_summary, mdm_summary, warning=None):
+    """
+    Save a processed recording to its results file and the recording catalog
+    
+    Args:
+        job: Job running the pipeline
+        warning: Optional note about a step that failed (e.g. MDM generation)
+        (remaining arguments as for process_transcription, plus the generated summaries)
+    """
+    # Save results to a JSON file in the patient folder with timestamp
+    job.start_stage('save_results')
+    results = {
+        'timestamp': datetime.now().isoformat(),
+        'filename': filename,
+        'patient_id': patient_id,
+        'recording_type': recording_type,
+        'transcription': transcription_result,
+        'conversation_text': conversation_text,
+        'clinical_summary': clinical_summary,
+        'mdm_summary': mdm_summary
+    }
+    if warning:
+        results['warning'] = warning
+    
+    results_filename = f"{timestamp}_results.json"
+    results_filepath = os.path.join(patient_folder, results_filename)
+    
+    with FILE_IO_SECONDS.time(operation='results_write'), open(results_filepath, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2, ensure_ascii=False)
+    
+    recording_catalog.upsert_recording(os.path.basename(patient_folder), timestamp, results)
+    job.finish_stage('save_results')
+    logger.info(f"💾 Results saved to: {patient_folder}/{results_filename}")
+
+@app.route('/api/webhooks/assemblyai', methods=['POST'])
+def assemblyai_webhook():
+    """
+    Completion callback from AssemblyAI: resume the job waiting on the transcript
+
+    AssemblyAI posts {"transcript_id": ..., "status": "completed" | "error"} to
+    the webhook URL given at submission, which carries our job id.
+    """
+    if TRANSCRIPTION_WEBHOOK_SECRET and not hmac.compare_digest(
+        request.headers.get(WEBHOOK_AUTH_HEADER, ''), TRANSCRIPTION_WEBHOOK_SECRET
+    ):
+        logger.warning("⚠️ Rejected transcription webhook with invalid token")
+        return jsonify({'success': False, 'error': 'Unauthorized'}), 401
+    
+    payload = request.get_json(silent=True) or {}
+    job_id = request.args.get('job_id', '')
+    transcript_id = payload.get('transcript_id')
+    job = job_queue.get_job(job_id)
+    
+    if job is None:
+        return jsonify({'success': False, 'error': 'Job not found'}), 404
+    
+    # Submission has not been recorded yet: ask AssemblyAI to retry
+    if job['status'] in ('queued', 'running') and job.get('transcript_id') is None:
+        return jsonify({'success': False, 'error': 'Job is not waiting yet'}), 409
+    
+    if job.get('transcript_id') != transcript_id:
+        return jsonify({'success': False, 'error': 'Transcript does not belong to this job'}), 404
+    
+    logger.info(f"📬 Transcription webhook for {transcript_id}: {payload.get('status')}")
+    resumed = resume_transcription_job(job_id, transcript_id)
+    
+    # Duplicate or late callbacks are acknowledged so they are not retried
+    return jsonify({'success': True, 'resumed': resumed['success']})
+
+def resume_transcription_job(job_id, transcript_id):
+    """Resume a job suspended in submit_transcription_and_wait"""
+    job = job_queue.get_job(job_id)
+    if job is None:
+        return {'success': False, 'error': 'Job not found'}
+    return job_queue.resume(job_id, resume_audio_pipeline, dict(job['params'], transcript_id=transcript_id))
+
+def watch_waiting_transcription(job_id, transcript_id, filepath, min_interval=TRANSCRIPTION_WEBHOOK_FALLBACK_SECONDS,
+                                progress_callback=None):
+    """
+    Track the transcript on the shared poller and resume the job once it finishes
+
+    This is how jobs resume without webhooks, and the fallback when a webhook never arrives.
+
+    Args:
+        job_id: Suspended job waiting on the transcript
+        transcript_id: AssemblyAI transcript id
+        filepath: Audio file (its duration paces the polling)
+        min_interval: Lower bound on the polling interval (the webhook is the fast path)
+        progress_callback: Optional callable invoked with the status on every poll
+    """
+    future = transcription_service.poller.watch(
+        transcript_id,
+        audio_duration=transcription_service.estimate_audio_duration(filepath),
+        progress_callback=progress_callback,
+        min_interval=min_interval
+    )
+    future.add_done_callback(lambda _: resume_unnotified_job(job_id, transcript_id))
+
+def resume_unnotified_job(job_id, transcript_id):
+    """Resume a job whose transcript finished without its webhook resuming it first"""
+    job = job_queue.get_job(job_id)
+    if job is None or job['status'] != 'waiting' or job.get('transcript_id') != transcript_id:
+        return
+    
+    if TRANSCRIPTION_WEBHOOK_URL:
+        logger.warning(f"⚠️ No webhook received for transcript {transcript_id}, resuming job {job_id} from polling")
+    else:
+        logger.info(f"📋 Transcript {transcript_id} finished, resuming job {job_id}")
+    resume_transcription_job(job_id, transcript_id)
+
+def recover_waiting_jobs():
+    """Re-arm the polling fallback for jobs that were waiting when the server stopped"""
+    for job in job_queue.waiting_jobs():
+        if job.get('transcript_id'):
+            watch_waiting_transcription(job['id'], job['transcript_id'], job['params']['filepath'], min_interval=None)
+
 @app.route('/api/results/<filename>')
 @login_required
 def get_results(filename):
@@ -529,10 +1042,13 @@ def get_patient_emails(patient_id):
     try:
         patient_folder = os.path.join(app.config['UPLOAD_FOLDER'], secure_filename(patient_id))
         
+        checked_at = datetime.now().isoformat()
+        
         if not os.path.exists(patient_folder):
             return jsonify({
                 'success': True,
-                'emails': []
+                'emails': [],
+                'checked_at': checked_at
             })
         
         emails = []
@@ -554,7 +1070,8 @@ def get_patient_emails(patient_id):
         
         return jsonify({
             'success': True,
-            'emails': emails
+            'emails': emails,
+            'checked_at': checked_at
         })
     except Exception as e:
         logger.error(f"Error getting emails for patient {patient_id}: {str(e)}")
@@ -568,6 +1085,25 @@ def get_patient_emails(patient_id):
 def fetch_patient_inbox(patient_id):
     """Fetch new emails from inbox for a specific patient"""
     try:
+        if inbox_sync.enabled:
+            # The background sync already files new mail; report what arrived since the last check
+            since = request.json.get('since') if request.is_json and request.json else None
+            patient_email = request.json.get('patient_email') if request.is_json and request.json else None
+            if patient_email:
+                # Route mail from this address to the patient
+                email_service.sync_store.record_patient_address(patient_email, secure_filename(patient_id))
+            # File held mail that now matches a patient
+            inbox_sync.refile_unrouted()
+            counts = inbox_sync.inbox_counts(patient_id, since)
+            return jsonify({
+                'success': True,
+                'new_emails': counts['new'],
+                'total_fetched': counts['total'],
+                'checked_at': datetime.now().isoformat(),
+                'last_sync_at': inbox_sync.status()['last_sync_at'],
+                'message': f"Found {counts['new']} new email(s)"
+            })
+        
         logger.info(f"📬 Fetching inbox emails for patient: {patient_id}")
         
         # Get patient email from request or find it in existing emails
@@ -609,27 +1145,10 @@ def fetch_patient_inbox(patient_id):
             })
         
         # Save new emails to patient folder
-        patient_folder = os.path.join(app.config['UPLOAD_FOLDER'], secure_filename(patient_id))
-        os.makedirs(patient_folder, exist_ok=True)
-        
         new_count = 0
         for email_data in inbox_emails:
-            # Add patient_id to email data
-            email_data['patient_id'] = patient_id
-            
-            # Create filename from email ID
-            email_id_hash = hash(email_data.get('id', ''))
-            email_filename = f"inbox_{abs(email_id_hash)}_email.json"
-            email_path = os.path.join(patient_folder, email_filename)
-            
-            # Skip if already exists
-            if os.path.exists(email_path):
-                continue
-            
-            # Save email
-            with open(email_path, 'w', encoding='utf-8') as f:
-                json.dump(email_data, f, indent=2, ensure_ascii=False)
-            new_count += 1
+            if inbox_sync.file_email(patient_id, email_data):
+                new_count += 1
         
         logger.info(f"✅ Saved {new_count} new emails for patient {patient_id}")
         
@@ -651,110 +1170,23 @@ def fetch_patient_inbox(patient_id):
 @app.route('/api/patient/<patient_id>/health-summary', methods=['POST'])
 @login_required
 def generate_patient_health_summary(patient_id):
-    """Generate comprehensive patient health summary from all clinical records"""
+    """
+    Return the patient's health summary, updating the stored one with any new visits
+    
+    JSON body (optional): {"refresh": true} rebuilds it from every visit
+    """
     try:
-        logger.info(f"📋 Generating health summary for patient: {patient_id}")
-        
-        patient_folder = os.path.join(app.config['UPLOAD_FOLDER'], secure_filename(patient_id))
+        refresh = bool((request.get_json(silent=True) or {}).get('refresh'))
+        result = health_summaries.get_summary(secure_filename(patient_id), refresh=refresh)
         
-        if not os.path.exists(patient_folder):
-            return jsonify({
-                'success': False,
-                'error': 'No records found for this patient'
-            }), 404
-        
-        # Collect all clinical summaries from patient's recordings
-        clinical_records = []
-        
-        for filename in os.listdir(patient_folder):
-            if filename.endswith('_results.json'):
-                results_path = os.path.join(patient_folder, filename)
-                try:
-                    with open(results_path, 'r', encoding='utf-8') as f:
-                        data = json.load(f)
-                        
-                        visit_date = data.get('timestamp', 'Unknown date')
-                        clinical_summary = data.get('clinical_summary', {})
-                        
-                        if clinical_summary:
-                            record = f"""
-Visit Date: {visit_date}
-Chief Complaint: {clinical_summary.get('chief_complaint', 'N/A')}
-History of Present Illness: {clinical_summary.get('history_of_present_illness', 'N/A')}
-Assessment and Plan: {clinical_summary.get('assessment_plan', 'N/A')}
----
-"""
-                            clinical_records.append(record)
-                except Exception as e:
-                    logger.warning(f"Error loading record {filename}: {str(e)}")
-                    continue
-        
-        if not clinical_records:
+        if not result['success']:
             return jsonify({
                 'success': False,
-                'error': 'No clinical summaries found for this patient'
-            }), 404
-        
-        # Combine all records
-        all_records = '\n'.join(clinical_records)
-        
-        logger.info(f"   Found {len(clinical_records)} clinical record(s)")
-        
-        # Generate comprehensive summary using AI
-        prompt = f"""You are a medical records specialist. Based on the following clinical records for patient {patient_id}, create a comprehensive health history summary.
-
-CLINICAL RECORDS:
-{all_records}
-
-Please provide a detailed health summary including:
-1. **Patient Overview**: Brief introduction
-2. **Medical History Timeline**: Chronological summary of visits and conditions
-3. **Recurring Conditions**: Any patterns or recurring health issues
-4. **Current Health Status**: Latest assessment
-5. **Treatment Summary**: Medications and interventions prescribed
-6. **Follow-up Recommendations**: Any ongoing care needs
-
-Be professional, concise, and focus on key medical information. Format with clear headers and bullet points."""
-        
-        # Use Llama model for summary generation
-        try:
-            result = ai_service._call_openrouter(
-                prompt,
-                model=PRIMARY_MODEL,
-                client=ai_service.client,
-                api_key_type="Primary API",
-                max_tokens=800
-            )
-            
-            if result['success']:
-                summary_text = result['response']
-                model_used = "Clinical AI"
-            else:
-                raise Exception(result.get('error', 'Unknown error'))
-        except Exception as e:
-            logger.warning(f"   Primary model failed, using fallback: {str(e)}")
-            result = ai_service._call_openrouter(
-                prompt,
-                model=FALLBACK_MODEL,
-                client=ai_service.client,
-                api_key_type="Primary API",
-                max_tokens=800
-            )
-            
-            if result['success']:
-                summary_text = result['response']
-                model_used = "Clinical AI (Fallback)"
-            else:
-                raise Exception(result.get('error', 'Failed to generate summary'))
-        
-        logger.info(f"   ✅ Health summary generated successfully")
+                'error': result['error']
+            }), result['status_code']
         
-        return jsonify({
-            'success': True,
-            'summary': summary_text,
-            'total_visits': len(clinical_records),
-            'model_used': model_used
-        })
+        logger.info(f"   ✅ Health summary for {patient_id} ready ({result['mode']}, {result['total_visits']} visit(s))")
+        return jsonify(result)
         
     except Exception as e:
         logger.error(f"Error generating health summary: {str(e)}")
@@ -781,23 +1213,9 @@ def send_patient_reply(patient_id):
                 'error': 'Missing required fields: patient_email, subject, body'
             }), 400
         
-        logger.info(f"📤 Sending reply to patient {patient_id} ({patient_email})")
+        logger.info(f"📤 Queueing reply to patient {patient_id} ({patient_email})")
         
-        # Send email
-        send_result = email_service.send_email(
-            to_email=patient_email,
-            subject=subject,
-            body_html=body,
-            patient_id=patient_id
-        )
-        
-        if not send_result['success']:
-            return jsonify({
-                'success': False,
-                'error': f"Failed to send email: {send_result.get('error')}"
-            }), 500
-        
-        # Save sent email to patient folder
+        # Save reply to patient folder, then queue it for delivery
         patient_folder = os.path.join(app.config['UPLOAD_FOLDER'], secure_filename(patient_id))
         os.makedirs(patient_folder, exist_ok=True)
         
@@ -809,8 +1227,8 @@ def send_patient_reply(patient_id):
             'subject': subject,
             'body': body,
             'direction': 'outbound',
-            'sent': True,
-            'sent_at': send_result.get('sent_at'),
+            'sent': False,
+            'queued': True,
             'in_reply_to': reply_to_id
         }
         
@@ -820,11 +1238,19 @@ def send_patient_reply(patient_id):
         with open(email_path, 'w', encoding='utf-8') as f:
             json.dump(email_data, f, indent=2, ensure_ascii=False)
         
-        logger.info(f"✅ Reply sent and saved")
+        email_data['queue_id'] = email_queue.enqueue(
+            to_email=patient_email,
+            subject=subject,
+            body_html=body,
+            patient_id=patient_id,
+            record_path=email_path
+        )
+        
+        logger.info(f"✅ Reply saved and queued")
         
         return jsonify({
             'success': True,
-            'message': 'Reply sent successfully',
+            'message': 'Reply queued for delivery',
             'email': email_data
         })
         
@@ -841,6 +1267,19 @@ def send_patient_reply(patient_id):
 def fetch_all_inbox():
     """Fetch all new emails from inbox (for all patients)"""
     try:
+        if inbox_sync.enabled:
+            # The background sync already files new mail; report what arrived since the last check
+            since = request.json.get('since') if request.is_json and request.json else None
+            counts = inbox_sync.inbox_counts(since=since)
+            return jsonify({
+                'success': True,
+                'new_emails': counts['new'],
+                'patients_updated': counts['patients_updated'],
+                'checked_at': datetime.now().isoformat(),
+                'last_sync_at': inbox_sync.status()['last_sync_at'],
+                'message': f"Found {counts['new']} new emails for {counts['patients_updated']} patients"
+            })
+        
         logger.info("📬 Fetching all inbox emails...")
         
         # Fetch all emails from IMAP
@@ -858,27 +1297,15 @@ def fetch_all_inbox():
         patients_updated = set()
         
         for email_data in inbox_emails:
-            patient_id = email_data.get('patient_id', 'unknown')
+            # X-Patient-ID, or the sent email this is a reply to
+            patient_id = inbox_sync.route(email_data)
             
-            if patient_id == 'unknown':
+            if patient_id is None:
                 continue
             
-            patient_folder = os.path.join(app.config['UPLOAD_FOLDER'], secure_filename(patient_id))
-            os.makedirs(patient_folder, exist_ok=True)
-            
-            # Create filename from email ID
-            email_id_hash = hash(email_data.get('id', ''))
-            email_filename = f"inbox_{abs(email_id_hash)}_email.json"
-            email_path = os.path.join(patient_folder, email_filename)
-            
-            # Skip if already exists
-            if os.path.exists(email_path):
+            if not inbox_sync.file_email(patient_id, email_data):
                 continue
             
-            # Save email
-            with open(email_path, 'w', encoding='utf-8') as f:
-                json.dump(email_data, f, indent=2, ensure_ascii=False)
-            
             total_saved += 1
             patients_updated.add(patient_id)
         
@@ -1094,35 +1521,18 @@ Always remind users to consult healthcare professionals. Be concise and evidence
         # Step 3: Generate response using existing LLM service
         full_prompt = f"{system_prompt}\n\nQuestion: {user_message}\n\nAnswer:"
         
-        # Try primary model (using FREE tier from config)
-        try:
-            result = ai_service._call_openrouter(
-                full_prompt,
-                model=PRIMARY_MODEL,  # Uses free tier from config
-                client=ai_service.client,
-                api_key_type="Primary API",
-                max_tokens=400
-            )
-            if result['success']:
-                response_text = result['response']
-                model_used = PRIMARY_MODEL
-            else:
-                raise Exception(result.get('error', 'Unknown error'))
-        except Exception as e:
-            logger.warning(f"   Primary model failed, using fallback: {str(e)}")
-            # Fallback to DeepSeek (FREE tier)
-            result = ai_service._call_openrouter(
-                full_prompt,
-                model=FALLBACK_MODEL,  # Uses free tier from config
-                client=ai_service.client,
-                api_key_type="Primary API",
-                max_tokens=400
-            )
-            if result['success']:
-                response_text = result['response']
-                model_used = FALLBACK_MODEL
-            else:
-                raise Exception(result.get('error', 'Unknown error'))
+        # Free-tier models with the shared fallback chain and circuit breakers
+        result = ai_service._call_ai_with_fallback(
+            full_prompt,
+            "Chat Response",
+            max_tokens=400,
+            template='chat_assistant'
+        )
+        if not result['success']:
+            raise Exception(result.get('error', 'Unknown error'))
+        
+        response_text = result['response']
+        model_used = result['model']
         
         logger.info(f"   ✓ Response generated using: {model_used}")
         
@@ -1226,6 +1636,35 @@ AIscribe is a medical transcription and communication platform with these key fe
    - Logout button in top right
 """
 
+_background_pid = None
+_background_lock = threading.Lock()
+
+@app.before_request
+def start_background_services():
+    """Start this process's background work on its first request (so it runs after fork)"""
+    global _background_pid
+    if _background_pid == os.getpid():
+        return
+    
+    with _background_lock:
+        if _background_pid == os.getpid():
+            return
+        _background_pid = os.getpid()
+        
+        try:
+            recover_waiting_jobs()
+            email_queue.start()  # Deliver anything left in the queue by a previous run
+            inbox_sync.migrate_inbox_files()  # Index (and de-duplicate) inbox emails saved before the index existed
+            inbox_sync.migrate_patient_addresses()  # Route replies to mail sent before addresses were recorded
+            inbox_sync.start()  # File patient replies as they arrive
+            metrics_registry.start_exporter()  # Publish this worker's metrics for scrapes answered by the others
+        except Exception as e:
+            logger.error(f"❌ Failed to start background services: {str(e)}")
+            logger.exception(e)
+
+startup_report.end_import_timing()
+logger.info(f"⏱️ {startup_report.summary()}")
+
 if __name__ == '__main__':
     logger.info("🌐 Starting Flask server on http://localhost:5000")
     logger.info("📝 Open your browser and navigate to http://localhost:5000")
@@ -2,32 +2,116 @@
 
 import json
 import os
+import sqlite3
 import hashlib
+import threading
+from contextlib import contextmanager
 from datetime import datetime
+from logger_config import setup_logger
+from config import USERS_DB_PATH
 
+logger = setup_logger()
+
+# Legacy store, imported into USERS_DB_PATH once and then left untouched
 USERS_FILE = 'users.json'
 
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    email TEXT PRIMARY KEY,
+    first_name TEXT NOT NULL,
+    last_name TEXT NOT NULL,
+    password TEXT NOT NULL,
+    newsletter INTEGER NOT NULL DEFAULT 0,
+    created_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS migrations (
+    name TEXT PRIMARY KEY,
+    applied_at TEXT NOT NULL
+);
+"""
+
 class AuthService:
-    """Handle user authentication with file storage"""
+    """Handle user authentication with SQLite storage and an in-process cache"""
+    
+    def __init__(self, db_path=USERS_DB_PATH):
+        self.db_path = db_path
+        self._cache = {}
+        self._cache_signature = None
+        self._cache_lock = threading.Lock()
+        
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+        self._migrate_users_file()
     
-    def __init__(self):
-        self._ensure_users_file()
+    @contextmanager
+    def _connect(self):
+        """Open a transaction on a fresh connection (safe across threads and gunicorn workers)"""
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        try:
+            conn.execute('PRAGMA journal_mode=WAL')
+            with conn:
+                yield conn
+        finally:
+            conn.close()
     
-    def _ensure_users_file(self):
-        """Create users file if it doesn't exist"""
+    def _migrate_users_file(self):
+        """Import users.json the first time the database is used"""
         if not os.path.exists(USERS_FILE):
-            with open(USERS_FILE, 'w') as f:
-                json.dump({}, f)
+            return
+        
+        with self._connect() as conn:
+            claimed = conn.execute(
+                'INSERT OR IGNORE INTO migrations (name, applied_at) VALUES (?, ?)',
+                ('users_json', datetime.now().isoformat())
+            ).rowcount
+            if not claimed:
+                return
+            
+            with open(USERS_FILE, 'r') as f:
+                users = json.load(f)
+            
+            conn.executemany(
+                """INSERT OR IGNORE INTO users (email, first_name, last_name, password, newsletter, created_at)
+                   VALUES (?, ?, ?, ?, ?, ?)""",
+                [
+                    (email, user['first_name'], user['last_name'], user['password'],
+                     int(bool(user.get('newsletter'))), user.get('created_at') or datetime.now().isoformat())
+                    for email, user in users.items()
+                ]
+            )
+        
+        logger.info(f"✓ Imported {len(users)} user(s) from {USERS_FILE} into {self.db_path}")
     
-    def _load_users(self):
-        """Load users from file"""
-        with open(USERS_FILE, 'r') as f:
-            return json.load(f)
+    def _db_signature(self):
+        """Changes whenever any process commits to the database (WAL writes touch the -wal file)"""
+        signature = []
+        for path in (self.db_path, f"{self.db_path}-wal"):
+            try:
+                stat = os.stat(path)
+                signature.append((stat.st_mtime_ns, stat.st_size))
+            except FileNotFoundError:
+                signature.append(None)
+        return tuple(signature)
     
-    def _save_users(self, users):
-        """Save users to file"""
-        with open(USERS_FILE, 'w') as f:
-            json.dump(users, f, indent=2)
+    def _get_user_record(self, email):
+        """Stored user row as a dict, served from the cache while the database is unchanged"""
+        signature = self._db_signature()
+        with self._cache_lock:
+            if signature != self._cache_signature:
+                self._cache = {}
+                self._cache_signature = signature
+            if email in self._cache:
+                return self._cache[email]
+        
+        with self._connect() as conn:
+            row = conn.execute('SELECT * FROM users WHERE email = ?', (email,)).fetchone()
+        user = dict(row) if row else None
+        
+        with self._cache_lock:
+            if signature == self._cache_signature:
+                self._cache[email] = user
+        return user
     
     def _hash_password(self, password):
         """Hash password using SHA256"""
@@ -35,34 +119,37 @@ class AuthService:
     
     def signup(self, first_name, last_name, email, password, newsletter=False):
         """Register a new user"""
-        users = self._load_users()
-        
-        # Check if user already exists
-        if email in users:
-            return {'success': False, 'error': 'User already exists'}
+        fields = {'first_name': first_name, 'last_name': last_name, 'email': email, 'password': password}
+        missing = [name for name, value in fields.items() if not isinstance(value, str) or not value.strip()]
+        if missing:
+            return {'success': False, 'error': f"Missing required fields: {', '.join(missing)}"}
         
-        # Create new user
-        users[email] = {
-            'first_name': first_name,
-            'last_name': last_name,
-            'email': email,
-            'password': self._hash_password(password),
-            'newsletter': newsletter,
-            'created_at': datetime.now().isoformat()
-        }
+        try:
+            with self._connect() as conn:
+                conn.execute(
+                    """INSERT INTO users (email, first_name, last_name, password, newsletter, created_at)
+                       VALUES (?, ?, ?, ?, ?, ?)""",
+                    (email, first_name, last_name, self._hash_password(password),
+                     int(bool(newsletter)), datetime.now().isoformat())
+                )
+        except sqlite3.IntegrityError as e:
+            # Check if user already exists (primary key, so concurrent signups cannot both succeed)
+            if 'UNIQUE' in str(e) and 'users.email' in str(e):
+                return {'success': False, 'error': 'User already exists'}
+            logger.error(f"❌ Could not register {email}: {str(e)}")
+            return {'success': False, 'error': 'Could not register user'}
         
-        self._save_users(users)
+        with self._cache_lock:
+            self._cache.pop(email, None)
         return {'success': True, 'message': 'User registered successfully'}
     
     def login(self, email, password):
         """Authenticate user"""
-        users = self._load_users()
+        user = self._get_user_record(email)
         
-        if email not in users:
+        if user is None:
             return {'success': False, 'error': 'Invalid email or password'}
         
-        user = users[email]
-        
         if user['password'] != self._hash_password(password):
             return {'success': False, 'error': 'Invalid email or password'}
         
@@ -77,17 +164,13 @@ class AuthService:
     
     def get_user(self, email):
         """Get user information"""
-        users = self._load_users()
+        user = self._get_user_record(email)
         
-        if email not in users:
+        if user is None:
             return None
         
-        user = users[email]
         return {
             'first_name': user['first_name'],
             'last_name': user['last_name'],
             'email': user['email']
         }
-
-
-
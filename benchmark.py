@@ -0,0 +1,576 @@
+"""End-to-end benchmark of /api/process-audio against local stand-ins for AssemblyAI, OpenRouter and SMTP
+
+Usage:
+    python benchmark.py --recordings 20 --concurrency 4 --output bench.json
+
+The app runs in a subprocess (the Flask server by default, or --app-command,
+e.g. "gunicorn -w 2 -b 127.0.0.1:{port} app:app") with a throwaway upload
+folder and every upstream pointed at in-process fakes, so no API quota is used.
+Compare runs by diffing the JSON reports.
+"""
+
+import argparse
+import json
+import os
+import random
+import shlex
+import shutil
+import socket
+import socketserver
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import requests
+from fake_assemblyai import FakeAssemblyAI
+from logger_config import setup_logger
+
+logger = setup_logger()
+
+FINAL_JOB_STATUSES = ('completed', 'failed')
+
+CLINICAL_SUMMARY_RESPONSE = """CHIEF_COMPLAINT:
+Sore throat and mild fever for three days.
+
+HISTORY_OF_PRESENT_ILLNESS:
+Patient reports three days of sore throat with mild fever and some difficulty swallowing. Denies cough.
+
+ASSESSMENT_PLAN:
+Acute pharyngitis. Amoxicillin 500 mg three times daily for ten days. Return if symptoms worsen."""
+
+MDM_RESPONSE = """**Step 1: ICD-10-CM Coding**
+- J02.9 Acute pharyngitis, unspecified
+
+**Step 2: CPT Coding**
+- 99213 Established patient office visit, low complexity
+
+**Step 3: Medical Decision-Making (MDM)**
+1. **Number of diagnoses or management options**: Low
+2. **Amount and/or complexity of data reviewed and analyzed**: Minimal
+3. **Risk of complications and/or morbidity or mortality of management**: Moderate
+
+**Overall MDM Level**: Low"""
+
+
+class FakeOpenRouter:
+    """
+    In-process fake of the OpenRouter chat completions endpoint
+
+    Every request waits latency_seconds (plus up to jitter_seconds) and fails
+    with a 503 at error_rate, or always for models in failing_models, so
+    fallbacks and hedging can be exercised.
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, latency_seconds=1.0, jitter_seconds=0.0,
+                 error_rate=0.0, failing_models=()):
+        self.latency_seconds = latency_seconds
+        self.jitter_seconds = jitter_seconds
+        self.error_rate = error_rate
+        self.failing_models = set(failing_models)
+        self.stats = {'requests': 0, 'failures': 0, 'by_model': {}}
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        """Base URL to use as OPENROUTER_BASE_URL"""
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/api/v1"
+
+    def start(self):
+        """Serve requests on a background thread"""
+        self._thread = threading.Thread(target=self._server.serve_forever, name='fake-openrouter', daemon=True)
+        self._thread.start()
+        logger.info(f"✓ Fake OpenRouter listening on {self.url}")
+        return self
+
+    def stop(self):
+        """Stop serving"""
+        self._server.shutdown()
+        self._server.server_close()
+
+    def complete(self, request_body):
+        """
+        Answer one chat completion request
+
+        Returns:
+            tuple: (HTTP status, response body)
+        """
+        model = request_body.get('model', 'unknown')
+        prompt = request_body.get('messages', [{}])[-1].get('content', '')
+        time.sleep(self.latency_seconds + random.uniform(0, self.jitter_seconds))
+
+        fails = model in self.failing_models or random.random() < self.error_rate
+        with self._lock:
+            self.stats['requests'] += 1
+            model_stats = self.stats['by_model'].setdefault(model, {'requests': 0, 'failures': 0})
+            model_stats['requests'] += 1
+            if fails:
+                self.stats['failures'] += 1
+                model_stats['failures'] += 1
+
+        if fails:
+            return 503, {'error': {'message': 'Simulated upstream failure', 'code': 503}}
+
+        content = CLINICAL_SUMMARY_RESPONSE if 'CHIEF_COMPLAINT' in prompt else MDM_RESPONSE
+        return 200, {
+            'id': f"gen-{uuid.uuid4().hex}",
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': model,
+            'choices': [{
+                'index': 0,
+                'message': {'role': 'assistant', 'content': content},
+                'finish_reason': 'stop'
+            }],
+            'usage': {
+                'prompt_tokens': len(prompt.split()),
+                'completion_tokens': len(content.split()),
+                'total_tokens': len(prompt.split()) + len(content.split())
+            }
+        }
+
+    def _handler_class(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                if not self.path.endswith('/chat/completions'):
+                    self._send_json(404, {'error': {'message': 'Not found'}})
+                    return
+                status, payload = fake.complete(json.loads(body or b'{}'))
+                self._send_json(status, payload)
+
+            def _send_json(self, status, payload):
+                data = json.dumps(payload).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        return Handler
+
+
+class FakeSMTPServer:
+    """
+    Minimal plaintext SMTP server (EHLO, AUTH PLAIN, MAIL, RCPT, DATA, NOOP, RSET, QUIT)
+
+    Accepted messages are counted, not stored. DATA waits latency_seconds and
+    is refused with a 451 at error_rate. Point the app at it with
+    EMAIL_SMTP_STARTTLS=false.
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, latency_seconds=0.0, error_rate=0.0):
+        self.latency_seconds = latency_seconds
+        self.error_rate = error_rate
+        self.stats = {'connections': 0, 'messages': 0, 'refused': 0}
+        self._lock = threading.Lock()
+        self._server = socketserver.ThreadingTCPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def address(self):
+        return self._server.server_address[:2]
+
+    def start(self):
+        """Serve connections on a background thread"""
+        self._thread = threading.Thread(target=self._server.serve_forever, name='fake-smtp', daemon=True)
+        self._thread.start()
+        logger.info(f"✓ Fake SMTP listening on {self.address[0]}:{self.address[1]}")
+        return self
+
+    def stop(self):
+        """Stop serving"""
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _count(self, name):
+        with self._lock:
+            self.stats[name] += 1
+
+    def _handler_class(self):
+        fake = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                fake._count('connections')
+                self._reply('220 fake-smtp ready')
+                while True:
+                    line = self.rfile.readline()
+                    if not line:
+                        return
+                    command = line.decode('utf-8', errors='ignore').strip()
+                    verb = command.split(' ', 1)[0].upper()
+
+                    if verb == 'EHLO':
+                        self._reply('250-fake-smtp', '250-AUTH PLAIN', '250 8BITMIME')
+                    elif verb == 'AUTH':
+                        self._reply('235 Authentication successful')
+                    elif verb == 'DATA':
+                        self._reply('354 End data with <CR><LF>.<CR><LF>')
+                        while self.rfile.readline() not in (b'.\r\n', b'.\n', b''):
+                            pass
+                        time.sleep(fake.latency_seconds)
+                        if random.random() < fake.error_rate:
+                            fake._count('refused')
+                            self._reply('451 Simulated temporary failure')
+                        else:
+                            fake._count('messages')
+                            self._reply('250 Message accepted')
+                    elif verb == 'QUIT':
+                        self._reply('221 Bye')
+                        return
+                    elif verb in ('HELO', 'MAIL', 'RCPT', 'NOOP', 'RSET'):
+                        self._reply('250 OK')
+                    else:
+                        self._reply('502 Command not implemented')
+
+            def _reply(self, *lines):
+                self.wfile.write(''.join(f"{line}\r\n" for line in lines).encode('utf-8'))
+
+        return Handler
+
+
+class PipelineBenchmark:
+    """Start the fakes and the app, drive concurrent uploads and collect per-stage latencies"""
+
+    def __init__(self, args):
+        self.args = args
+        self.workdir = tempfile.mkdtemp(prefix='aiscribe-bench-')
+        self.port = args.port or _free_port()
+        self.app_url = f"http://127.0.0.1:{self.port}"
+        self.email = f"bench-{uuid.uuid4().hex[:8]}@example.com"
+        self.password = 'benchmark-password'
+        self._local = threading.local()
+        self.assemblyai = None
+        self.openrouter = None
+        self.smtp = None
+        self.app_process = None
+
+    def run(self):
+        """
+        Run the whole benchmark
+
+        Returns:
+            dict: The report (also written to --output)
+        """
+        try:
+            self._start_fakes()
+            self._start_app()
+            self._create_user()
+
+            logger.info(f"🏁 Submitting {self.args.recordings} recording(s), {self.args.concurrency} at a time")
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=self.args.concurrency, thread_name_prefix='bench-client') as executor:
+                samples = list(executor.map(self._run_recording, range(self.args.recordings)))
+            wall_seconds = time.perf_counter() - started
+
+            expected_emails = sum(1 for sample in samples if sample['status'] == 'completed')
+            email_wait_seconds = self._wait_for_emails(expected_emails)
+            report = self._build_report(samples, wall_seconds, email_wait_seconds)
+        finally:
+            self._stop()
+
+        with open(self.args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        logger.info(f"💾 Benchmark report saved to {self.args.output}")
+        return report
+
+    def _start_fakes(self):
+        self.assemblyai = FakeAssemblyAI(
+            processing_seconds=self.args.transcription_seconds,
+            error_rate=self.args.assemblyai_error_rate,
+            drop_webhook_rate=self.args.drop_webhook_rate,
+            latency_seconds=self.args.assemblyai_latency
+        ).start()
+        self.openrouter = FakeOpenRouter(
+            latency_seconds=self.args.openrouter_latency,
+            jitter_seconds=self.args.openrouter_jitter,
+            error_rate=self.args.openrouter_error_rate,
+            failing_models=self.args.failing_model
+        ).start()
+        self.smtp = FakeSMTPServer(
+            latency_seconds=self.args.smtp_latency,
+            error_rate=self.args.smtp_error_rate
+        ).start()
+
+    def _app_environment(self):
+        """Environment for the app: throwaway storage and every upstream pointed at the fakes"""
+        smtp_host, smtp_port = self.smtp.address
+        env = dict(os.environ)
+        env.update({
+            'UPLOAD_FOLDER': os.path.join(self.workdir, 'uploads'),
+            'USERS_DB_PATH': os.path.join(self.workdir, 'users.db'),
+            'LOG_FILE': os.path.join(self.workdir, 'aiscribe.log'),
+            'LOG_LEVEL': self.args.app_log_level,
+            'ASSEMBLYAI_API_KEY': 'benchmark',
+            'ASSEMBLYAI_BASE_URL': self.assemblyai.url,
+            'TRANSCRIPTION_WEBHOOK_URL': f"{self.app_url}/api/webhooks/assemblyai" if self.args.webhook else '',
+            'OPENROUTER_BASE_URL': self.openrouter.url,
+            'OPENROUTER_API_KEY': 'benchmark-primary',
+            'OPENROUTER_API_KEY_BACKUP': 'benchmark-backup',
+            'OPENAI_API_KEY': 'benchmark',
+            # Every fake transcript is identical: caching would hide the LLM stages
+            'COMPLETION_CACHE_ENABLED': 'true' if self.args.completion_cache else 'false',
+            'EMAIL_SMTP_SERVER': smtp_host,
+            'EMAIL_SMTP_PORT': str(smtp_port),
+            'EMAIL_SMTP_STARTTLS': 'false',
+            'EMAIL_USERNAME': 'clinic@example.com',
+            'EMAIL_PASSWORD': 'benchmark',
+            'INBOX_SYNC_ENABLED': 'false',
+            'JOB_MAX_PENDING': str(max(self.args.recordings, 20))
+        })
+        if self.args.job_workers:
+            env['JOB_WORKERS'] = str(self.args.job_workers)
+        return env
+
+    def _start_app(self):
+        if self.args.app_command:
+            command = shlex.split(self.args.app_command.format(port=self.port))
+        else:
+            command = [sys.executable, '-m', 'flask', '--app', 'app', 'run',
+                       '--host', '127.0.0.1', '--port', str(self.port), '--no-reload']
+
+        app_dir = os.path.dirname(os.path.abspath(__file__))
+        self.app_output = open(os.path.join(self.workdir, 'app_output.log'), 'w', encoding='utf-8')
+        self.app_process = subprocess.Popen(
+            command, cwd=app_dir, env=self._app_environment(), stdout=self.app_output, stderr=subprocess.STDOUT
+        )
+
+        deadline = time.monotonic() + 60
+        while time.monotonic() < deadline:
+            if self.app_process.poll() is not None:
+                raise RuntimeError(f"App exited with code {self.app_process.returncode}, see {self.app_output.name}")
+            try:
+                if requests.get(f"{self.app_url}/api/health", timeout=1).ok:
+                    logger.info(f"✓ App ready at {self.app_url}")
+                    return
+            except requests.RequestException:
+                pass
+            time.sleep(0.2)
+        raise RuntimeError(f"App did not become ready, see {self.app_output.name}")
+
+    def _create_user(self):
+        response = requests.post(f"{self.app_url}/api/signup", json={
+            'first_name': 'Bench', 'last_name': 'Mark', 'email': self.email, 'password': self.password
+        }, timeout=30)
+        if not response.json().get('success'):
+            raise RuntimeError(f"Could not create benchmark user: {response.text}")
+
+    def _session(self):
+        """Logged-in HTTP session for the calling client thread"""
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = requests.Session()
+            session.post(f"{self.app_url}/api/login", json={'email': self.email, 'password': self.password}, timeout=30)
+            self._local.session = session
+        return session
+
+    def _run_recording(self, index):
+        """Upload one recording and wait for its job; returns the latency sample"""
+        session = self._session()
+        audio = os.urandom(self.args.audio_kb * 1024)  # Unique bytes so the transcription cache never hits
+        sample = {'index': index, 'status': None, 'upload_seconds': None, 'end_to_end_seconds': None, 'stages': {}}
+
+        started = time.perf_counter()
+        try:
+            response = session.post(f"{self.app_url}/api/process-audio", files={
+                'audio': (f"bench_{index}.mp3", audio, 'audio/mpeg')
+            }, data={
+                'patient_id': f"bench_patient_{index:04d}",
+                'patient_email': f"patient{index}@example.com",
+                'recording_type': 'conversation'
+            }, timeout=120)
+        except requests.RequestException as e:
+            sample.update(status='error', error=str(e))
+            return sample
+
+        sample['upload_seconds'] = time.perf_counter() - started
+        if response.status_code != 202:
+            sample.update(status='rejected', http_status=response.status_code, error=response.text[:200])
+            return sample
+
+        job_id = response.json()['job_id']
+        deadline = time.monotonic() + self.args.timeout
+        job = None
+        while time.monotonic() < deadline:
+            job = session.get(f"{self.app_url}/api/jobs/{job_id}", timeout=30).json().get('job')
+            if job and job['status'] in FINAL_JOB_STATUSES:
+                break
+            time.sleep(self.args.poll_interval)
+        else:
+            sample.update(status='timeout', job_id=job_id)
+            return sample
+
+        sample.update(
+            status=job['status'],
+            job_id=job_id,
+            end_to_end_seconds=time.perf_counter() - started,
+            error=job.get('error'),
+            stages={stage['name']: {'status': stage['status'], 'seconds': stage['duration_seconds']}
+                    for stage in job['stages']}
+        )
+        return sample
+
+    def _wait_for_emails(self, expected, timeout=60):
+        """Wait for the outbound queue to deliver the patient emails; returns seconds waited"""
+        started = time.perf_counter()
+        while self.smtp.stats['messages'] < expected and time.perf_counter() - started < timeout:
+            time.sleep(0.2)
+        return time.perf_counter() - started
+
+    def _build_report(self, samples, wall_seconds, email_wait_seconds):
+        completed = [sample for sample in samples if sample['status'] == 'completed']
+        stage_names = []
+        for sample in samples:
+            for name in sample['stages']:
+                if name not in stage_names:
+                    stage_names.append(name)
+
+        stages = {}
+        for name in stage_names:
+            entries = [sample['stages'][name] for sample in samples if name in sample['stages']]
+            stages[name] = dict(
+                latency_summary([entry['seconds'] for entry in entries if entry['seconds'] is not None]),
+                failed=sum(1 for entry in entries if entry['status'] == 'failed')
+            )
+
+        email_queue = None
+        try:
+            email_queue = self._session().get(f"{self.app_url}/api/email-queue", timeout=10).json().get('queue')
+        except (requests.RequestException, ValueError):
+            pass
+
+        status_counts = {}
+        for sample in samples:
+            status_counts[sample['status']] = status_counts.get(sample['status'], 0) + 1
+
+        report = {
+            'started_at': datetime.now().isoformat(),
+            'config': vars(self.args),
+            'recordings': dict(submitted=len(samples), **status_counts),
+            'wall_seconds': round(wall_seconds, 3),
+            'recordings_per_minute': round(len(completed) / wall_seconds * 60, 2) if wall_seconds else None,
+            'latency': {
+                'upload': latency_summary([s['upload_seconds'] for s in samples if s['upload_seconds'] is not None]),
+                'end_to_end': latency_summary([s['end_to_end_seconds'] for s in completed])
+            },
+            'stages': stages,
+            'email': {
+                'delivered': self.smtp.stats['messages'],
+                'drain_seconds_after_last_job': round(email_wait_seconds, 3),
+                'queue': email_queue
+            },
+            'upstream': {
+                'assemblyai': dict(self.assemblyai.stats),
+                'openrouter': dict(self.openrouter.stats),
+                'smtp': dict(self.smtp.stats)
+            },
+            'errors': [{'index': s['index'], 'status': s['status'], 'error': s.get('error')}
+                       for s in samples if s['status'] != 'completed']
+        }
+
+        logger.info(f"📊 {len(completed)}/{len(samples)} recordings completed in {wall_seconds:.1f}s "
+                    f"({report['recordings_per_minute']} per minute)")
+        for name, summary in stages.items():
+            if summary['count']:
+                logger.info(f"   {name:<18} p50 {summary['p50']:.3f}s  p95 {summary['p95']:.3f}s  "
+                            f"p99 {summary['p99']:.3f}s  ({summary['failed']} failed)")
+        return report
+
+    def _stop(self):
+        if self.app_process is not None:
+            self.app_process.terminate()
+            try:
+                self.app_process.wait(timeout=15)
+            except subprocess.TimeoutExpired:
+                self.app_process.kill()
+            self.app_output.close()
+        for fake in (self.assemblyai, self.openrouter, self.smtp):
+            if fake is not None:
+                fake.stop()
+        if self.args.keep_workdir:
+            logger.info(f"📁 App data and logs kept in {self.workdir}")
+        else:
+            shutil.rmtree(self.workdir, ignore_errors=True)
+
+
+def percentile(values, pct):
+    """Percentile of values (linear interpolation between closest ranks)"""
+    ordered = sorted(values)
+    if not ordered:
+        return None
+    position = (len(ordered) - 1) * pct / 100
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def latency_summary(values):
+    """Count, mean, p50/p95/p99 and max of a list of durations in seconds"""
+    if not values:
+        return {'count': 0, 'mean': None, 'p50': None, 'p95': None, 'p99': None, 'max': None}
+    return {
+        'count': len(values),
+        'mean': round(sum(values) / len(values), 4),
+        'p50': round(percentile(values, 50), 4),
+        'p95': round(percentile(values, 95), 4),
+        'p99': round(percentile(values, 99), 4),
+        'max': round(max(values), 4)
+    }
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def main():
+    """Command line entry point: python benchmark.py"""
+    parser = argparse.ArgumentParser(description='Benchmark the audio pipeline against local upstream stand-ins')
+    parser.add_argument('--recordings', type=int, default=20, help='Number of uploads')
+    parser.add_argument('--concurrency', type=int, default=4, help='Uploads in flight at once')
+    parser.add_argument('--audio-kb', type=int, default=256, help='Size of each (random) audio upload')
+    parser.add_argument('--job-workers', type=int, default=None, help='JOB_WORKERS for the app (default: app config)')
+    parser.add_argument('--webhook', action='store_true', help='Use completion webhooks instead of polling')
+    parser.add_argument('--completion-cache', action='store_true', help='Leave the LLM completion cache on')
+    parser.add_argument('--transcription-seconds', type=float, default=2.0, help='Fake transcription time')
+    parser.add_argument('--assemblyai-latency', type=float, default=0.05, help='Added latency per AssemblyAI request')
+    parser.add_argument('--assemblyai-error-rate', type=float, default=0.0, help='Fraction of transcripts that fail')
+    parser.add_argument('--drop-webhook-rate', type=float, default=0.0, help='Fraction of webhooks never sent')
+    parser.add_argument('--openrouter-latency', type=float, default=1.0, help='Latency per completion')
+    parser.add_argument('--openrouter-jitter', type=float, default=0.2, help='Extra random latency per completion')
+    parser.add_argument('--openrouter-error-rate', type=float, default=0.0, help='Fraction of completions that fail')
+    parser.add_argument('--failing-model', action='append', default=[], help='Model that always fails (repeatable)')
+    parser.add_argument('--smtp-latency', type=float, default=0.05, help='Latency per SMTP message')
+    parser.add_argument('--smtp-error-rate', type=float, default=0.0, help='Fraction of SMTP sends refused')
+    parser.add_argument('--app-command', default=None,
+                        help='Command starting the app, with {port} (default: flask development server)')
+    parser.add_argument('--app-log-level', default='INFO', help='LOG_LEVEL for the app')
+    parser.add_argument('--port', type=int, default=0, help='App port (default: a free one)')
+    parser.add_argument('--poll-interval', type=float, default=0.25, help='Seconds between job status checks')
+    parser.add_argument('--timeout', type=float, default=600, help='Seconds to wait for each job')
+    parser.add_argument('--keep-workdir', action='store_true', help='Keep the app data and logs afterwards')
+    parser.add_argument('--output', default=f"benchmark_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json",
+                        help='JSON report path')
+    args = parser.parse_args()
+
+    PipelineBenchmark(args).run()
+
+
+if __name__ == '__main__':
+    main()
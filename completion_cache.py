@@ -0,0 +1,251 @@
+"""Two-level cache for deterministic LLM completions"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from logger_config import setup_logger
+from config import COMPLETION_CACHE_DB_PATH, COMPLETION_CACHE_TTL_HOURS, COMPLETION_CACHE_MEMORY_ENTRIES
+
+logger = setup_logger()
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS completions (
+    key TEXT PRIMARY KEY,
+    template TEXT NOT NULL,
+    template_version INTEGER NOT NULL,
+    response TEXT NOT NULL,
+    model_used TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    expires_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_completions_template ON completions (template, template_version);
+CREATE INDEX IF NOT EXISTS idx_completions_expires ON completions (expires_at);
+"""
+
+
+def make_cache_key(model, prompt, system_message, max_tokens, template, template_version):
+    """
+    Build a cache key from the normalized request
+
+    Whitespace runs in the prompt and system message are collapsed and the model
+    id is lower-cased, so cosmetic differences still hit the same entry.
+
+    Returns:
+        str: SHA-256 hex digest
+    """
+    normalized = {
+        'model': model.strip().lower(),
+        'prompt': ' '.join(prompt.split()),
+        'system': ' '.join(system_message.split()),
+        'max_tokens': max_tokens,
+        'template': template,
+        'template_version': template_version
+    }
+    return hashlib.sha256(json.dumps(normalized, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+class CompletionCache:
+    """Bounded in-memory LRU in front of a SQLite store, with a TTL per entry"""
+
+    def __init__(self, db_path=COMPLETION_CACHE_DB_PATH, ttl_hours=COMPLETION_CACHE_TTL_HOURS,
+                 max_memory_entries=COMPLETION_CACHE_MEMORY_ENTRIES):
+        self.db_path = db_path
+        self.ttl_seconds = ttl_hours * 3600
+        self.max_memory_entries = max_memory_entries
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0, 'stores': 0}
+
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+            conn.execute('DELETE FROM completions WHERE expires_at < ?', (time.time(),))
+
+        logger.info(f"✓ CompletionCache initialized at {db_path}")
+
+    @contextmanager
+    def _connect(self):
+        """Open a transaction on a fresh connection (safe across threads and gunicorn workers)"""
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        try:
+            conn.execute('PRAGMA journal_mode=WAL')
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def get(self, key):
+        """
+        Look up a cached completion
+
+        Args:
+            key: Key from make_cache_key
+
+        Returns:
+            dict or None: {'response': ..., 'model_used': ...}
+        """
+        return self.get_first([key])[1]
+
+    def get_first(self, keys):
+        """
+        Look up several keys (e.g. one per model) as a single request
+
+        Earlier keys are preferred. The lookup counts as one hit or one miss in
+        stats(), however many keys it checks, and needs at most one query.
+
+        Args:
+            keys: Keys from make_cache_key, in order of preference
+
+        Returns:
+            tuple: (key, entry) for the first key with a live entry, or (None, None)
+        """
+        now = time.time()
+        in_memory = {}
+
+        with self._lock:
+            for key in keys:
+                entry = self._memory.get(key)
+                if entry is None:
+                    continue
+                if entry['expires_at'] > now:
+                    in_memory[key] = entry
+                else:
+                    del self._memory[key]
+
+        # Only keys preferred over the first memory hit are worth reading from disk
+        on_disk = {}
+        candidates = []
+        for key in keys:
+            if key in in_memory:
+                break
+            candidates.append(key)
+        if candidates:
+            placeholders = ', '.join('?' * len(candidates))
+            with self._connect() as conn:
+                rows = conn.execute(
+                    f'SELECT key, response, model_used, expires_at FROM completions '
+                    f'WHERE key IN ({placeholders}) AND expires_at > ?',
+                    (*candidates, now)
+                ).fetchall()
+            on_disk = {row['key']: dict(row) for row in rows}
+
+        with self._lock:
+            for key in keys:
+                if key in on_disk:
+                    self._stats['disk_hits'] += 1
+                    entry = on_disk[key]
+                    del entry['key']
+                    self._remember(key, entry)
+                    return key, entry
+                if key in in_memory:
+                    self._stats['memory_hits'] += 1
+                    if key in self._memory:
+                        self._memory.move_to_end(key)
+                    return key, in_memory[key]
+            self._stats['misses'] += 1
+            return None, None
+
+    def put(self, key, response, model_used, template, template_version):
+        """
+        Store a completion in memory and on disk
+
+        Args:
+            key: Key from make_cache_key
+            response: Completion text
+            model_used: Model label reported with the response
+            template: Prompt template name
+            template_version: Prompt template version
+        """
+        now = time.time()
+        entry = {'response': response, 'model_used': model_used, 'expires_at': now + self.ttl_seconds}
+
+        with self._connect() as conn:
+            conn.execute(
+                """INSERT OR REPLACE INTO completions
+                   (key, template, template_version, response, model_used, created_at, expires_at)
+                   VALUES (?, ?, ?, ?, ?, ?, ?)""",
+                (key, template, template_version, response, model_used, now, entry['expires_at'])
+            )
+
+        with self._lock:
+            self._stats['stores'] += 1
+            self._remember(key, entry)
+
+    def invalidate(self, template=None, template_version=None):
+        """
+        Drop cached completions
+
+        Args:
+            template: Only drop entries for this template (None for all)
+            template_version: Only drop entries for this version of the template
+
+        Returns:
+            int: Number of entries removed from disk
+        """
+        query = 'DELETE FROM completions'
+        params = []
+        if template is not None:
+            query += ' WHERE template = ?'
+            params.append(template)
+            if template_version is not None:
+                query += ' AND template_version = ?'
+                params.append(template_version)
+
+        with self._connect() as conn:
+            removed = conn.execute(query, params).rowcount
+
+        # Memory entries are not tagged by template; clearing them is cheap
+        with self._lock:
+            self._memory.clear()
+
+        logger.info(f"🧹 Invalidated {removed} cached completion(s){f' for {template}' if template else ''}")
+        return removed
+
+    def purge_stale_versions(self, current_versions):
+        """
+        Drop entries whose template version is no longer current
+
+        Args:
+            current_versions: {template name: current version}
+
+        Returns:
+            int: Number of entries removed
+        """
+        removed = 0
+        with self._connect() as conn:
+            for template, version in current_versions.items():
+                removed += conn.execute(
+                    'DELETE FROM completions WHERE template = ? AND template_version != ?',
+                    (template, version)
+                ).rowcount
+        if removed:
+            logger.info(f"🧹 Purged {removed} completion(s) from outdated prompt templates")
+        return removed
+
+    def stats(self):
+        """
+        Cache counters for this process
+
+        Returns:
+            dict: memory_hits, disk_hits, misses, stores, hit_rate, memory_entries
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats['memory_entries'] = len(self._memory)
+        lookups = stats['memory_hits'] + stats['disk_hits'] + stats['misses']
+        hits = stats['memory_hits'] + stats['disk_hits']
+        stats['hit_rate'] = round(hits / lookups, 3) if lookups else None
+        return stats
+
+    def _remember(self, key, entry):
+        """Insert into the memory LRU (caller holds the lock)"""
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
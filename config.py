@@ -16,7 +16,18 @@ PRIMARY_MODEL = "meta-llama/llama-3.3-70b-instruct:free"
 FALLBACK_MODEL = "deepseek/deepseek-r1-distill-llama-70b:free"
 
 # OpenRouter API Configuration
-OPENROUTER_BASE_URL = "https://openrouter.ai/api/v1"
+OPENROUTER_BASE_URL = os.getenv("OPENROUTER_BASE_URL", "https://openrouter.ai/api/v1")
+
+# Hedged requests: launch the next model/key attempt if the current one is slow
+AI_HEDGE_ENABLED = os.getenv("AI_HEDGE_ENABLED", "true").lower() == "true"
+AI_HEDGE_DELAY_SECONDS = float(os.getenv("AI_HEDGE_DELAY_SECONDS", "10"))
+AI_HEDGE_MAX_PARALLEL = int(os.getenv("AI_HEDGE_MAX_PARALLEL", "2"))
+
+# Long transcripts: split on speaker turns (with overlap), extract findings per chunk concurrently, then merge
+LONG_TRANSCRIPT_THRESHOLD_CHARS = int(os.getenv("LONG_TRANSCRIPT_THRESHOLD_CHARS", "24000"))
+TRANSCRIPT_CHUNK_CHARS = int(os.getenv("TRANSCRIPT_CHUNK_CHARS", "12000"))
+TRANSCRIPT_CHUNK_OVERLAP_TURNS = int(os.getenv("TRANSCRIPT_CHUNK_OVERLAP_TURNS", "3"))
+TRANSCRIPT_CHUNK_PARALLELISM = int(os.getenv("TRANSCRIPT_CHUNK_PARALLELISM", "4"))
 
 # Application Configuration
 # Use environment variable for Railway volume support, fallback to local 'uploads' folder
@@ -24,3 +35,92 @@ UPLOAD_FOLDER = os.getenv("UPLOAD_FOLDER", "uploads")
 ALLOWED_EXTENSIONS = {'wav', 'mp3', 'mp4', 'm4a', 'flac', 'ogg', 'webm'}
 MAX_FILE_SIZE = 100 * 1024 * 1024  # 100 MB
 
+# Background Job Configuration
+# Jobs are persisted under the upload folder so every gunicorn worker can report their status
+JOBS_FOLDER = os.getenv("JOBS_FOLDER", os.path.join(UPLOAD_FOLDER, ".jobs"))
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_MAX_PENDING = int(os.getenv("JOB_MAX_PENDING", "20"))
+# Finished jobs (and their resume claims) are deleted after this long
+JOB_RETENTION_HOURS = float(os.getenv("JOB_RETENTION_HOURS", "24"))
+# Job progress streams: keepalive comment interval, and a cap below the gunicorn timeout after which the client reconnects
+SSE_KEEPALIVE_SECONDS = float(os.getenv("SSE_KEEPALIVE_SECONDS", "15"))
+SSE_MAX_STREAM_SECONDS = float(os.getenv("SSE_MAX_STREAM_SECONDS", "100"))
+
+# Recording catalog (SQLite index of *_results.json files used by the dashboard)
+CATALOG_DB_PATH = os.getenv("CATALOG_DB_PATH", os.path.join(UPLOAD_FOLDER, ".catalog.db"))
+
+# Transcription cache (keyed by audio SHA-256 + diarization flag)
+TRANSCRIPTION_CACHE_ENABLED = os.getenv("TRANSCRIPTION_CACHE_ENABLED", "true").lower() == "true"
+TRANSCRIPTION_CACHE_FOLDER = os.getenv("TRANSCRIPTION_CACHE_FOLDER", os.path.join(UPLOAD_FOLDER, ".transcription_cache"))
+TRANSCRIPTION_CACHE_MAX_ENTRIES = int(os.getenv("TRANSCRIPTION_CACHE_MAX_ENTRIES", "500"))
+TRANSCRIPTION_CACHE_MAX_BYTES = int(os.getenv("TRANSCRIPTION_CACHE_MAX_BYTES", str(200 * 1024 * 1024)))
+TRANSCRIPTION_CACHE_MAX_AGE_DAYS = float(os.getenv("TRANSCRIPTION_CACHE_MAX_AGE_DAYS", "30"))
+
+# LLM completion cache (in-memory LRU backed by SQLite)
+COMPLETION_CACHE_ENABLED = os.getenv("COMPLETION_CACHE_ENABLED", "true").lower() == "true"
+COMPLETION_CACHE_DB_PATH = os.getenv("COMPLETION_CACHE_DB_PATH", os.path.join(UPLOAD_FOLDER, ".completion_cache.db"))
+COMPLETION_CACHE_TTL_HOURS = float(os.getenv("COMPLETION_CACHE_TTL_HOURS", "168"))
+COMPLETION_CACHE_MEMORY_ENTRIES = int(os.getenv("COMPLETION_CACHE_MEMORY_ENTRIES", "256"))
+
+# Transcription completion webhooks (leave TRANSCRIPTION_WEBHOOK_URL empty to poll instead)
+ASSEMBLYAI_BASE_URL = os.getenv("ASSEMBLYAI_BASE_URL", "")
+TRANSCRIPTION_WEBHOOK_URL = os.getenv("TRANSCRIPTION_WEBHOOK_URL", "")
+TRANSCRIPTION_WEBHOOK_SECRET = os.getenv("TRANSCRIPTION_WEBHOOK_SECRET", "")
+TRANSCRIPTION_WEBHOOK_FALLBACK_SECONDS = float(os.getenv("TRANSCRIPTION_WEBHOOK_FALLBACK_SECONDS", "60"))
+
+# Shared transcript poller
+TRANSCRIPT_POLL_MIN_SECONDS = float(os.getenv("TRANSCRIPT_POLL_MIN_SECONDS", "1"))
+TRANSCRIPT_POLL_MAX_SECONDS = float(os.getenv("TRANSCRIPT_POLL_MAX_SECONDS", "30"))
+TRANSCRIPT_POLL_JITTER = float(os.getenv("TRANSCRIPT_POLL_JITTER", "0.2"))
+TRANSCRIPT_POLL_MAX_ERRORS = int(os.getenv("TRANSCRIPT_POLL_MAX_ERRORS", "5"))
+AUDIO_BYTES_PER_SECOND_ESTIMATE = int(os.getenv("AUDIO_BYTES_PER_SECOND_ESTIMATE", "16000"))  # ~128 kbps
+
+# Model circuit breaker (per model + API key)
+MODEL_CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("MODEL_CIRCUIT_FAILURE_THRESHOLD", "3"))
+MODEL_CIRCUIT_COOLDOWN_SECONDS = float(os.getenv("MODEL_CIRCUIT_COOLDOWN_SECONDS", "60"))
+MODEL_CIRCUIT_MAX_COOLDOWN_SECONDS = float(os.getenv("MODEL_CIRCUIT_MAX_COOLDOWN_SECONDS", "600"))
+MODEL_LATENCY_WINDOW = int(os.getenv("MODEL_LATENCY_WINDOW", "50"))
+
+# Outbound email queue
+EMAIL_QUEUE_DB_PATH = os.getenv("EMAIL_QUEUE_DB_PATH", os.path.join(UPLOAD_FOLDER, ".email_queue.db"))
+EMAIL_QUEUE_MAX_ATTEMPTS = int(os.getenv("EMAIL_QUEUE_MAX_ATTEMPTS", "8"))
+EMAIL_QUEUE_BASE_DELAY_SECONDS = float(os.getenv("EMAIL_QUEUE_BASE_DELAY_SECONDS", "30"))
+EMAIL_QUEUE_MAX_DELAY_SECONDS = float(os.getenv("EMAIL_QUEUE_MAX_DELAY_SECONDS", "3600"))
+EMAIL_QUEUE_POLL_SECONDS = float(os.getenv("EMAIL_QUEUE_POLL_SECONDS", "5"))
+
+# Inbox sync state (IMAP UIDVALIDITY / last UID per sync)
+MAIL_SYNC_DB_PATH = os.getenv("MAIL_SYNC_DB_PATH", os.path.join(UPLOAD_FOLDER, ".mail_sync.db"))
+
+# Background inbox sync (one IMAP IDLE connection per deployment)
+INBOX_SYNC_ENABLED = os.getenv("INBOX_SYNC_ENABLED", "true").lower() == "true"
+INBOX_SYNC_IDLE_SECONDS = float(os.getenv("INBOX_SYNC_IDLE_SECONDS", "1500"))  # Re-IDLE before servers' 29 min cutoff
+INBOX_SYNC_POLL_SECONDS = float(os.getenv("INBOX_SYNC_POLL_SECONDS", "60"))  # Servers without IDLE
+INBOX_SYNC_RECONNECT_MAX_SECONDS = float(os.getenv("INBOX_SYNC_RECONNECT_MAX_SECONDS", "300"))
+INBOX_SYNC_BATCH_LIMIT = int(os.getenv("INBOX_SYNC_BATCH_LIMIT", "100"))
+INBOX_SYNC_LOCK_PATH = os.getenv("INBOX_SYNC_LOCK_PATH", os.path.join(UPLOAD_FOLDER, ".inbox_sync.lock"))
+INBOX_UNROUTED_RETENTION_DAYS = float(os.getenv("INBOX_UNROUTED_RETENTION_DAYS", "30"))  # Mail no patient matched yet
+
+# Patient health summaries (rolling summary per patient, updated with new visits only)
+HEALTH_SUMMARY_DB_PATH = os.getenv("HEALTH_SUMMARY_DB_PATH", os.path.join(UPLOAD_FOLDER, ".health_summaries.db"))
+# Patients with more visits are summarized per time window (in parallel), then the window summaries are reduced
+HEALTH_SUMMARY_DIRECT_MAX_VISITS = int(os.getenv("HEALTH_SUMMARY_DIRECT_MAX_VISITS", "12"))
+HEALTH_SUMMARY_WINDOW_MONTHS = int(os.getenv("HEALTH_SUMMARY_WINDOW_MONTHS", "6"))
+HEALTH_SUMMARY_WINDOW_MAX_VISITS = int(os.getenv("HEALTH_SUMMARY_WINDOW_MAX_VISITS", "12"))
+HEALTH_SUMMARY_REDUCE_FAN_IN = int(os.getenv("HEALTH_SUMMARY_REDUCE_FAN_IN", "8"))
+HEALTH_SUMMARY_PARALLELISM = int(os.getenv("HEALTH_SUMMARY_PARALLELISM", "4"))
+HEALTH_SUMMARY_WINDOW_MAX_TOKENS = int(os.getenv("HEALTH_SUMMARY_WINDOW_MAX_TOKENS", "500"))
+
+# User store (existing users.json is imported on first start)
+USERS_DB_PATH = os.getenv("USERS_DB_PATH", "users.db")
+
+# Logging (records are queued by request threads and written by one listener thread per process)
+LOG_LEVEL = os.getenv("LOG_LEVEL", "DEBUG").upper()
+LOG_FILE = os.getenv("LOG_FILE", "aiscribe.log")
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", str(10 * 1024 * 1024)))
+LOG_BACKUP_COUNT = int(os.getenv("LOG_BACKUP_COUNT", "5"))
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text").lower()  # "json" for one structured record per line
+
+# Metrics (/api/metrics): each worker publishes its totals here so any worker can answer a scrape
+METRICS_DIR = os.getenv("METRICS_DIR", os.path.join(UPLOAD_FOLDER, ".metrics"))
+METRICS_FLUSH_SECONDS = float(os.getenv("METRICS_FLUSH_SECONDS", "15"))
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")  # If set, scrapers must send Authorization: Bearer <token>
@@ -10,7 +10,8 @@ EMAIL_CONFIG = {
         "server": os.getenv("EMAIL_SMTP_SERVER", "smtp.gmail.com"),
         "port": int(os.getenv("EMAIL_SMTP_PORT", "587")),
         "username": os.getenv("EMAIL_USERNAME"),
-        "password": os.getenv("EMAIL_PASSWORD")
+        "password": os.getenv("EMAIL_PASSWORD"),
+        "starttls": os.getenv("EMAIL_SMTP_STARTTLS", "true").lower() == "true"  # false only for local test servers
     },
     "imap": {
         "server": os.getenv("EMAIL_IMAP_SERVER", "imap.gmail.com"),
@@ -18,6 +19,16 @@ EMAIL_CONFIG = {
         "username": os.getenv("EMAIL_USERNAME"),
         "password": os.getenv("EMAIL_PASSWORD")
     },
+    "smtp_pool": {
+        "max_connections": int(os.getenv("EMAIL_SMTP_POOL_SIZE", "2")),
+        "max_idle_seconds": float(os.getenv("EMAIL_SMTP_MAX_IDLE_SECONDS", "120")),
+        "keepalive_after_seconds": float(os.getenv("EMAIL_SMTP_KEEPALIVE_AFTER_SECONDS", "15")),
+        "max_messages_per_connection": int(os.getenv("EMAIL_SMTP_MAX_MESSAGES_PER_CONNECTION", "50"))
+    },
+    "imap_fetch": {
+        "batch_size": int(os.getenv("EMAIL_IMAP_FETCH_BATCH_SIZE", "50")),
+        "max_body_bytes": int(os.getenv("EMAIL_IMAP_MAX_BODY_BYTES", "65536"))
+    },
     "from_email": os.getenv("EMAIL_USERNAME"),
     "from_name": os.getenv("EMAIL_FROM_NAME", "AIscribe Medical Team")
 }
@@ -0,0 +1,288 @@
+"""Persistent outbound email queue with a background dispatcher"""
+
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from logger_config import setup_logger, log_event, correlation_id, new_correlation_id
+from config import (
+    EMAIL_QUEUE_DB_PATH, EMAIL_QUEUE_MAX_ATTEMPTS, EMAIL_QUEUE_BASE_DELAY_SECONDS,
+    EMAIL_QUEUE_MAX_DELAY_SECONDS, EMAIL_QUEUE_POLL_SECONDS
+)
+
+logger = setup_logger()
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbound_emails (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    to_email TEXT NOT NULL,
+    subject TEXT NOT NULL,
+    body_html TEXT NOT NULL,
+    patient_id TEXT NOT NULL,
+    record_path TEXT,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    enqueued_at REAL NOT NULL,
+    next_attempt_at REAL NOT NULL,
+    claimed_at REAL,
+    sent_at TEXT,
+    delivery_seconds REAL,
+    last_error TEXT,
+    correlation_id TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_outbound_due ON outbound_emails (status, next_attempt_at);
+"""
+
+# A message stuck in 'sending' this long belongs to a worker that died mid-send
+STALE_CLAIM_SECONDS = 600
+
+# Number of recent deliveries used for the latency figures in stats()
+LATENCY_SAMPLE_SIZE = 200
+
+
+class OutboundEmailQueue:
+    """
+    Queue patient emails in SQLite and deliver them from a background thread
+
+    Every gunicorn worker runs a dispatcher; a message is claimed with a
+    conditional UPDATE so only one of them sends it. Failed sends are retried
+    with exponential backoff, and the saved <timestamp>_email.json record is
+    updated with the outcome.
+    """
+
+    def __init__(self, email_service, db_path=EMAIL_QUEUE_DB_PATH, max_attempts=EMAIL_QUEUE_MAX_ATTEMPTS,
+                 base_delay=EMAIL_QUEUE_BASE_DELAY_SECONDS, max_delay=EMAIL_QUEUE_MAX_DELAY_SECONDS,
+                 poll_interval=EMAIL_QUEUE_POLL_SECONDS):
+        self.email_service = email_service
+        self.db_path = db_path
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.poll_interval = poll_interval
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._thread_lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+            # Queues created before correlation ids were tracked
+            columns = {row['name'] for row in conn.execute('PRAGMA table_info(outbound_emails)')}
+            if 'correlation_id' not in columns:
+                conn.execute('ALTER TABLE outbound_emails ADD COLUMN correlation_id TEXT')
+
+        logger.info(f"✓ OutboundEmailQueue initialized at {db_path}")
+
+    @contextmanager
+    def _connect(self):
+        """Open a transaction on a fresh connection (safe across threads and gunicorn workers)"""
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        try:
+            conn.execute('PRAGMA journal_mode=WAL')
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def enqueue(self, to_email, subject, body_html, patient_id, record_path=None):
+        """
+        Queue an email for delivery
+
+        Args:
+            to_email: Recipient email address
+            subject: Email subject
+            body_html: Email body (HTML format)
+            patient_id: Patient identifier
+            record_path: Optional saved email JSON to update with the delivery outcome
+
+        Returns:
+            int: Queue entry id
+        """
+        now = time.time()
+        with self._connect() as conn:
+            cursor = conn.execute(
+                """INSERT INTO outbound_emails
+                   (to_email, subject, body_html, patient_id, record_path, enqueued_at, next_attempt_at, correlation_id)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+                (to_email, subject, body_html, patient_id, record_path, now, now, correlation_id.get())
+            )
+            message_id = cursor.lastrowid
+
+        logger.info(f"📮 Queued email {message_id} to {to_email}")
+        self.start()
+        self._wakeup.set()
+        return message_id
+
+    def start(self):
+        """Start this process's dispatcher thread if it is not running"""
+        with self._thread_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='aiscribe-email-dispatcher', daemon=True)
+                self._thread.start()
+
+    def stats(self):
+        """
+        Queue depth and delivery latency
+
+        Returns:
+            dict: Counts by status, oldest pending age and latency of recent deliveries
+        """
+        now = time.time()
+        with self._connect() as conn:
+            counts = {row['status']: row['count'] for row in conn.execute(
+                'SELECT status, COUNT(*) AS count FROM outbound_emails GROUP BY status'
+            )}
+            oldest = conn.execute(
+                "SELECT MIN(enqueued_at) AS oldest FROM outbound_emails WHERE status IN ('pending', 'sending')"
+            ).fetchone()['oldest']
+            latencies = sorted(row['delivery_seconds'] for row in conn.execute(
+                "SELECT delivery_seconds FROM outbound_emails WHERE status = 'sent' ORDER BY id DESC LIMIT ?",
+                (LATENCY_SAMPLE_SIZE,)
+            ))
+
+        return {
+            'pending': counts.get('pending', 0),
+            'sending': counts.get('sending', 0),
+            'sent': counts.get('sent', 0),
+            'failed': counts.get('failed', 0),
+            'oldest_pending_seconds': round(now - oldest, 1) if oldest else None,
+            'delivery_seconds_avg': round(sum(latencies) / len(latencies), 3) if latencies else None,
+            'delivery_seconds_p95': round(latencies[int(0.95 * (len(latencies) - 1))], 3) if latencies else None
+        }
+
+    def _run(self):
+        """Dispatcher loop: deliver due messages, then sleep until woken or the next poll"""
+        while True:
+            try:
+                self._release_stale_claims()
+                while True:
+                    message = self._claim_next()
+                    if message is None:
+                        break
+                    self._deliver(message)
+            except Exception as e:
+                logger.error(f"❌ Email dispatcher error: {str(e)}")
+                logger.exception(e)
+
+            self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
+
+    def _claim_next(self):
+        """Atomically take the next due message, or None if nothing is due"""
+        now = time.time()
+        with self._connect() as conn:
+            while True:
+                row = conn.execute(
+                    """SELECT * FROM outbound_emails
+                       WHERE status = 'pending' AND next_attempt_at <= ?
+                       ORDER BY next_attempt_at LIMIT 1""",
+                    (now,)
+                ).fetchone()
+                if row is None:
+                    return None
+
+                claimed = conn.execute(
+                    "UPDATE outbound_emails SET status = 'sending', claimed_at = ? WHERE id = ? AND status = 'pending'",
+                    (now, row['id'])
+                ).rowcount
+                if claimed:
+                    return dict(row)
+                # Another worker claimed it first: look for the next one
+
+    def _release_stale_claims(self):
+        """Return messages abandoned mid-send (e.g. a worker restart) to the queue"""
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE outbound_emails SET status = 'pending' WHERE status = 'sending' AND claimed_at < ?",
+                (time.time() - STALE_CLAIM_SECONDS,)
+            )
+
+    def _deliver(self, message):
+        """Send one claimed message under the correlation id of the request that queued it"""
+        token = correlation_id.set(message.get('correlation_id') or new_correlation_id())
+        try:
+            self._send(message)
+        finally:
+            correlation_id.reset(token)
+
+    def _send(self, message):
+        """Send one claimed message and record the outcome"""
+        attempts = message['attempts'] + 1
+        started = time.perf_counter()
+        result = self.email_service.send_email(
+            to_email=message['to_email'],
+            subject=message['subject'],
+            body_html=message['body_html'],
+            patient_id=message['patient_id']
+        )
+        log_event(
+            logger, f"📧 Email {message['id']} send attempt {attempts}: {'sent' if result['success'] else 'failed'}",
+            event='stage', stage='email_send', outcome='completed' if result['success'] else 'failed',
+            duration_ms=round((time.perf_counter() - started) * 1000), email_id=message['id'], attempt=attempts
+        )
+
+        if result['success']:
+            delivery_seconds = time.time() - message['enqueued_at']
+            with self._connect() as conn:
+                conn.execute(
+                    """UPDATE outbound_emails
+                       SET status = 'sent', attempts = ?, sent_at = ?, delivery_seconds = ?, last_error = NULL
+                       WHERE id = ?""",
+                    (attempts, result['sent_at'], delivery_seconds, message['id'])
+                )
+            self._update_record(message['record_path'], sent=True, sent_at=result['sent_at'], queued=False,
+                                send_attempts=attempts, send_error=None, message_id=result.get('message_id'))
+            logger.info(f"✅ Email {message['id']} delivered after {attempts} attempt(s), {delivery_seconds:.1f}s in queue")
+            return
+
+        error = result.get('error', 'Unknown error')
+        if attempts >= self.max_attempts:
+            with self._connect() as conn:
+                conn.execute(
+                    "UPDATE outbound_emails SET status = 'failed', attempts = ?, last_error = ? WHERE id = ?",
+                    (attempts, error, message['id'])
+                )
+            self._update_record(message['record_path'], queued=False, send_attempts=attempts, send_error=error)
+            logger.error(f"❌ Giving up on email {message['id']} after {attempts} attempts: {error}")
+            return
+
+        # Exponential backoff with jitter so a recovering SMTP server is not hit all at once
+        delay = min(self.base_delay * (2 ** (attempts - 1)), self.max_delay) * random.uniform(0.8, 1.2)
+        with self._connect() as conn:
+            conn.execute(
+                """UPDATE outbound_emails
+                   SET status = 'pending', attempts = ?, next_attempt_at = ?, last_error = ?
+                   WHERE id = ?""",
+                (attempts, time.time() + delay, error, message['id'])
+            )
+        self._update_record(message['record_path'], send_attempts=attempts, send_error=error)
+        logger.warning(f"⚠️ Email {message['id']} failed (attempt {attempts}/{self.max_attempts}), retrying in {delay:.0f}s")
+
+    def _update_record(self, record_path, **fields):
+        """Merge delivery fields into the saved email JSON (None values are removed)"""
+        if not record_path:
+            return
+
+        try:
+            with open(record_path, 'r', encoding='utf-8') as f:
+                record = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"⚠️ Could not update email record {record_path}: {str(e)}")
+            return
+
+        for key, value in fields.items():
+            if value is None:
+                record.pop(key, None)
+            else:
+                record[key] = value
+        record['updated_at'] = datetime.now().isoformat()
+
+        tmp_path = f"{record_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(record, f, indent=2, ensure_ascii=False)
+        os.replace(tmp_path, record_path)
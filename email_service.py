@@ -1,17 +1,25 @@
 # Email Service for AIscribe - Send and Receive Emails
 
-import smtplib
+import atexit
 import imaplib
 import email
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from email.header import decode_header
+from email.utils import make_msgid
 from datetime import datetime
 from logger_config import setup_logger
 from email_config import EMAIL_CONFIG
+from smtp_pool import SMTPConnectionPool
+from mail_store import MailSyncStore
+from imap_fetch import parse_fetch_response, get_fetch_item, find_text_part, decode_body_part
+from metrics import EMAIL_SECONDS
 
 logger = setup_logger('EmailService')
 
+# Headers fetched up front; bodies are only downloaded for the text part we keep
+HEADER_FIELDS = 'MESSAGE-ID FROM TO SUBJECT DATE IN-REPLY-TO REFERENCES X-PATIENT-ID'
+
 class EmailService:
     """Service for sending and receiving emails via SMTP and IMAP"""
     
@@ -25,6 +33,22 @@ class EmailService:
         self.password = EMAIL_CONFIG['smtp']['password']
         self.from_email = EMAIL_CONFIG['from_email']
         self.from_name = EMAIL_CONFIG['from_name']
+        self.imap_fetch_batch_size = EMAIL_CONFIG['imap_fetch']['batch_size']
+        self.imap_max_body_bytes = EMAIL_CONFIG['imap_fetch']['max_body_bytes']
+        
+        # Reuse logged-in SMTP sessions instead of a full handshake per email
+        self.smtp_pool = SMTPConnectionPool(
+            self.smtp_server,
+            self.smtp_port,
+            self.username,
+            self.password,
+            starttls=EMAIL_CONFIG['smtp']['starttls'],
+            **EMAIL_CONFIG['smtp_pool']
+        )
+        atexit.register(self.smtp_pool.close_all)
+        
+        # Where each inbox sync left off, so a refresh only downloads new mail
+        self.sync_store = MailSyncStore()
         
         logger.info(f"📧 EmailService initialized with {self.from_email}")
     
@@ -51,6 +75,7 @@ class EmailService:
             message['To'] = to_email
             message['Subject'] = subject
             message['Reply-To'] = self.from_email
+            message['Message-ID'] = make_msgid(domain=self.from_email.split('@')[-1] if self.from_email else None)
             
             # Add custom headers for tracking
             message['X-Patient-ID'] = patient_id
@@ -60,17 +85,24 @@ class EmailService:
             html_part = MIMEText(body_html, 'html')
             message.attach(html_part)
             
-            # Connect to SMTP server and send
-            with smtplib.SMTP(self.smtp_server, self.smtp_port) as server:
-                server.starttls()  # Upgrade to secure connection
-                server.login(self.username, self.password)
-                server.send_message(message)
+            # Send on a pooled, already authenticated SMTP connection
+            with EMAIL_SECONDS.time(operation='smtp_send'):
+                self.smtp_pool.send_message(message)
             
             logger.info(f"✅ Email sent successfully to {to_email}")
             
+            # Replies quote this Message-ID in In-Reply-To, which routes them back to the patient;
+            # mail from the address without it is routed by the sender
+            try:
+                self.sync_store.record_sent_message(message['Message-ID'], patient_id)
+                self.sync_store.record_patient_address(to_email, patient_id)
+            except Exception as e:
+                logger.warning(f"⚠️ Could not record sent Message-ID: {str(e)}")
+            
             return {
                 'success': True,
                 'message': f'Email sent to {to_email}',
+                'message_id': message['Message-ID'],
                 'sent_at': datetime.now().isoformat()
             }
             
@@ -81,13 +113,14 @@ class EmailService:
                 'error': str(e)
             }
     
-    def fetch_inbox_emails(self, patient_email=None, limit=50):
+    def fetch_inbox_emails(self, patient_email=None, limit=50, incremental=True):
         """
         Fetch emails from inbox via IMAP
         
         Args:
             patient_email: Filter emails from specific patient email address
             limit: Maximum number of emails to fetch
+            incremental: Resume from the stored sync position (False forces a full resync)
             
         Returns:
             list of email dictionaries
@@ -95,82 +128,12 @@ class EmailService:
         try:
             logger.info(f"📬 Fetching inbox emails{f' for {patient_email}' if patient_email else ''}...")
             
-            # Connect to IMAP server
-            mail = imaplib.IMAP4_SSL(self.imap_server, self.imap_port)
-            mail.login(self.username, self.password)
-            mail.select('inbox')
-            
-            # Search for emails
-            if patient_email:
-                # Search for emails from this patient email
-                search_criteria = f'(FROM "{patient_email}")'
-                logger.info(f"   Search criteria: {search_criteria}")
-            else:
-                search_criteria = 'ALL'
-            
-            status, messages = mail.search(None, search_criteria)
-            email_ids = messages[0].split()
-            
-            logger.info(f"   Found {len(email_ids)} email(s) matching criteria")
-            
-            # Get the latest emails (up to limit)
-            email_ids = email_ids[-limit:] if len(email_ids) > limit else email_ids
-            email_ids = list(reversed(email_ids))  # Newest first
-            
-            emails = []
-            
-            for email_id in email_ids:
-                try:
-                    status, msg_data = mail.fetch(email_id, '(RFC822)')
-                    
-                    for response_part in msg_data:
-                        if isinstance(response_part, tuple):
-                            msg = email.message_from_bytes(response_part[1])
-                            
-                            # Decode subject
-                            subject = self._decode_header(msg['Subject'])
-                            from_email = msg['From']
-                            to_email = msg['To']
-                            date_str = msg['Date']
-                            message_id = msg['Message-ID']
-                            in_reply_to = msg.get('In-Reply-To', '')
-                            references = msg.get('References', '')
-                            
-                            # Try to extract patient ID from headers
-                            email_patient_id = msg.get('X-Patient-ID', '')
-                            
-                            # Get email body
-                            body = self._get_email_body(msg)
-                            
-                            # Parse date
-                            try:
-                                email_date = email.utils.parsedate_to_datetime(date_str)
-                                timestamp = email_date.isoformat()
-                            except:
-                                timestamp = datetime.now().isoformat()
-                            
-                            emails.append({
-                                'id': message_id,
-                                'from': from_email,
-                                'to': to_email,
-                                'subject': subject,
-                                'body': body,
-                                'timestamp': timestamp,
-                                'patient_id': email_patient_id or 'unknown',
-                                'direction': 'inbound',
-                                'in_reply_to': in_reply_to,
-                                'references': references
-                            })
-                            
-                except Exception as e:
-                    logger.warning(f"Error processing email {email_id}: {str(e)}")
-                    continue
+            mail = self.connect_imap()
+            emails = self.sync_mailbox(mail, patient_email=patient_email, limit=limit, incremental=incremental)
             
             mail.close()
             mail.logout()
             
-            logger.info(f"✅ Fetched {len(emails)} emails from inbox")
-            
             return emails
             
         except Exception as e:
@@ -178,6 +141,97 @@ class EmailService:
             logger.exception(e)
             return []
     
+    def connect_imap(self):
+        """
+        Open an authenticated IMAP session
+        
+        Returns:
+            imaplib.IMAP4_SSL connection
+        """
+        with EMAIL_SECONDS.time(operation='imap_connect'):
+            mail = imaplib.IMAP4_SSL(self.imap_server, self.imap_port)
+            mail.login(self.username, self.password)
+        return mail
+    
+    def sync_mailbox(self, mail, patient_email=None, limit=50, incremental=True):
+        """
+        Download new inbox messages on an open IMAP session
+        
+        Only messages with a UID above the last one synced are downloaded. The
+        first sync, or one after the mailbox UIDVALIDITY changed, falls back to
+        the newest `limit` messages.
+        
+        Args:
+            mail: Logged-in IMAP connection
+            patient_email: Filter emails from specific patient email address
+            limit: Maximum number of emails to fetch
+            incremental: Resume from the stored sync position (False forces a full resync)
+            
+        Returns:
+            list of email dictionaries
+        """
+        # Selecting again also picks up the latest UIDVALIDITY on long-lived sessions
+        mail.select('inbox')
+        uidvalidity = int(mail.response('UIDVALIDITY')[1][0])
+        
+        # Each search (all mail, or one patient's) keeps its own sync position
+        sync_key = f"inbox:{patient_email.lower() if patient_email else 'ALL'}"
+        state = self.sync_store.get_sync_state(sync_key) if incremental else None
+        if state and state['uidvalidity'] != uidvalidity:
+            logger.warning(f"⚠️ Inbox UIDVALIDITY changed ({state['uidvalidity']} -> {uidvalidity}), running a full resync")
+            state = None
+        last_uid = state['last_uid'] if state else 0
+        
+        # Search for emails
+        if patient_email:
+            # Search for emails from this patient email
+            search_criteria = f'(FROM "{patient_email}")'
+        else:
+            search_criteria = 'ALL'
+        
+        if state:
+            search_criteria = f'(UID {last_uid + 1}:* {search_criteria})'
+        logger.info(f"   Search criteria: {search_criteria}")
+        
+        with EMAIL_SECONDS.time(operation='imap_search'):
+            status, messages = mail.uid('SEARCH', None, search_criteria)
+        # "n:*" always matches the newest message, even when its UID is below n
+        uids = sorted(uid for uid in map(int, messages[0].split()) if uid > last_uid)
+        newest_uid = uids[-1] if uids else last_uid
+        
+        logger.info(f"   Found {len(uids)} new email(s) matching criteria")
+        
+        if state:
+            # Catch up oldest first so nothing is skipped when more than `limit` arrived
+            uids = uids[:limit]
+            newest_uid = uids[-1] if uids else last_uid
+        else:
+            # Full resync: get the latest emails (up to limit)
+            uids = uids[-limit:]
+        
+        emails = []
+        fetched_uid = None
+        
+        # Oldest first, stopping at the first failed batch: the sync position only
+        # moves past messages that were actually fetched, so the rest are retried
+        for batch_start in range(0, len(uids), self.imap_fetch_batch_size):
+            batch = uids[batch_start:batch_start + self.imap_fetch_batch_size]
+            try:
+                with EMAIL_SECONDS.time(operation='imap_fetch'):
+                    emails.extend(self._fetch_messages(mail, batch))
+            except Exception as e:
+                logger.warning(f"⚠️ Error fetching emails {batch[0]}-{batch[-1]}, retrying them on the next sync: {str(e)}")
+                newest_uid = fetched_uid
+                break
+            fetched_uid = batch[-1]
+        
+        if newest_uid is not None:
+            self.sync_store.save_sync_state(sync_key, uidvalidity, newest_uid)
+        
+        logger.info(f"✅ Fetched {len(emails)} emails from inbox (synced through UID {newest_uid if newest_uid is not None else last_uid})")
+        
+        return list(reversed(emails))  # Newest first
+    
     def _decode_header(self, header_value):
         """Decode email header"""
         if header_value is None:
@@ -197,41 +251,99 @@ class EmailService:
         
         return decoded_string
     
-    def _get_email_body(self, msg):
-        """Extract email body from message"""
-        body = ''
-        
-        if msg.is_multipart():
-            for part in msg.walk():
-                content_type = part.get_content_type()
-                content_disposition = str(part.get('Content-Disposition'))
+    def _fetch_messages(self, mail, uids):
+        """
+        Download a batch of messages with as few round trips as possible
+        
+        Headers and BODYSTRUCTURE for the whole batch come in one FETCH; then
+        only the text part each message needs is fetched (capped at
+        imap_max_body_bytes), one FETCH per distinct section number. Attachments
+        are never downloaded.
+        
+        Args:
+            mail: Logged-in IMAP connection with the inbox selected
+            uids: Message UIDs, in the order the results should be returned
+            
+        Returns:
+            list of email dictionaries
+        """
+        uid_set = ','.join(str(uid) for uid in uids)
+        status, data = mail.uid('FETCH', uid_set, f'(UID BODY.PEEK[HEADER.FIELDS ({HEADER_FIELDS})] BODYSTRUCTURE)')
+        fetched = parse_fetch_response(data)
+        
+        # Group messages by the section holding their text
+        text_parts = {}
+        sections = {}
+        for uid, attrs in fetched.items():
+            text_part = find_text_part(attrs.get('BODYSTRUCTURE'))
+            if text_part:
+                text_parts[uid] = text_part
+                sections.setdefault(text_part['section'], []).append(uid)
+        
+        bodies = {}
+        for section, section_uids in sections.items():
+            status, data = mail.uid(
+                'FETCH',
+                ','.join(str(uid) for uid in section_uids),
+                f'(UID BODY.PEEK[{section}]<0.{self.imap_max_body_bytes}>)'
+            )
+            for uid, attrs in parse_fetch_response(data).items():
+                bodies[uid] = get_fetch_item(attrs, f'BODY[{section}]')
+        
+        emails = []
+        for uid in uids:
+            attrs = fetched.get(uid)
+            if attrs is None:
+                logger.warning(f"Email {uid} missing from FETCH response")
+                continue
+            
+            try:
+                msg = email.message_from_bytes(get_fetch_item(attrs, 'BODY[HEADER') or b'')
                 
-                # Skip attachments
-                if 'attachment' in content_disposition:
-                    continue
+                body = ''
+                text_part = text_parts.get(uid)
+                if text_part:
+                    body = decode_body_part(bodies.get(uid), text_part['encoding'], text_part['charset'])
+                    # Clean up quoted/forwarded text
+                    body = self._extract_reply_content(body)
                 
-                # Get plain text or HTML
-                if content_type == 'text/plain':
-                    try:
-                        body = part.get_payload(decode=True).decode('utf-8', errors='ignore')
-                        break
-                    except:
-                        pass
-                elif content_type == 'text/html' and not body:
-                    try:
-                        body = part.get_payload(decode=True).decode('utf-8', errors='ignore')
-                    except:
-                        pass
-        else:
-            try:
-                body = msg.get_payload(decode=True).decode('utf-8', errors='ignore')
-            except:
-                body = str(msg.get_payload())
+                emails.append(self._build_email_record(uid, msg, body))
+                
+            except Exception as e:
+                logger.warning(f"Error processing email {uid}: {str(e)}")
+                continue
         
-        # Clean up quoted/forwarded text
-        body = self._extract_reply_content(body)
+        return emails
+    
+    def _build_email_record(self, uid, msg, body):
+        """Inbound email dictionary from parsed headers and the decoded body"""
+        # Decode subject
+        subject = self._decode_header(msg['Subject'])
+        date_str = msg['Date']
+        
+        # Try to extract patient ID from headers
+        email_patient_id = msg.get('X-Patient-ID', '')
+        
+        # Parse date
+        try:
+            email_date = email.utils.parsedate_to_datetime(date_str)
+            timestamp = email_date.isoformat()
+        except:
+            timestamp = datetime.now().isoformat()
         
-        return body
+        return {
+            'id': msg['Message-ID'],
+            'uid': uid,
+            'from': msg['From'],
+            'to': msg['To'],
+            'subject': subject,
+            'body': body,
+            'timestamp': timestamp,
+            'patient_id': email_patient_id or 'unknown',
+            'direction': 'inbound',
+            'in_reply_to': msg.get('In-Reply-To', ''),
+            'references': msg.get('References', '')
+        }
     
     def _extract_reply_content(self, body):
         """Extract only the new reply content, removing quoted text"""
@@ -0,0 +1,272 @@
+"""Local stand-in for the AssemblyAI API (upload, submit, status and completion webhook)
+
+Usage:
+    python fake_assemblyai.py --port 8765 --processing-seconds 5
+
+Then start the app with:
+    ASSEMBLYAI_BASE_URL=http://localhost:8765
+    TRANSCRIPTION_WEBHOOK_URL=http://localhost:5000/api/webhooks/assemblyai
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+import urllib.request
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from logger_config import setup_logger
+
+logger = setup_logger()
+
+SAMPLE_UTTERANCES = [
+    ('A', "Good morning. What brings you in today?"),
+    ('B', "I've had a sore throat and a mild fever for about three days."),
+    ('A', "Any cough or trouble swallowing?"),
+    ('B', "A little trouble swallowing, no cough."),
+    ('A', "Your throat looks inflamed. I'll prescribe amoxicillin 500 milligrams three times a day for ten days."),
+]
+
+
+class FakeAssemblyAI:
+    """
+    In-process fake of the AssemblyAI endpoints used by TranscriptionService
+
+    Transcripts move from queued to processing to completed (or error) over
+    processing_seconds; the completion webhook is sent when they finish.
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, processing_seconds=5.0, error_rate=0.0,
+                 drop_webhook_rate=0.0, latency_seconds=0.0):
+        self.processing_seconds = processing_seconds
+        self.error_rate = error_rate
+        self.drop_webhook_rate = drop_webhook_rate
+        self.latency_seconds = latency_seconds
+        self.transcripts = {}
+        self.stats = {'uploads': 0, 'submits': 0, 'status_requests': 0, 'webhooks_sent': 0, 'webhooks_dropped': 0}
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        """Base URL to use as ASSEMBLYAI_BASE_URL"""
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        """Serve requests on a background thread"""
+        self._thread = threading.Thread(target=self._server.serve_forever, name='fake-assemblyai', daemon=True)
+        self._thread.start()
+        logger.info(f"✓ Fake AssemblyAI listening on {self.url}")
+        return self
+
+    def stop(self):
+        """Stop serving"""
+        self._server.shutdown()
+        self._server.server_close()
+
+    def create_transcript(self, request_body, processing_seconds=None):
+        """
+        Register a submitted transcript and schedule its completion
+
+        processing_seconds overrides the instance default for this transcript,
+        so a run can mix short and long recordings.
+        """
+        if processing_seconds is None:
+            processing_seconds = self.processing_seconds
+        transcript_id = uuid.uuid4().hex
+        transcript = {
+            'id': transcript_id,
+            'status': 'queued',
+            'audio_url': request_body.get('audio_url'),
+            'speaker_labels': request_body.get('speaker_labels'),
+            'webhook_url': request_body.get('webhook_url'),
+            'webhook_auth_header_name': request_body.get('webhook_auth_header_name'),
+            'webhook_auth_header_value': request_body.get('webhook_auth_header_value'),
+            'created': time.monotonic(),
+            'processing_seconds': processing_seconds,
+            'fails': random.random() < self.error_rate
+        }
+        with self._lock:
+            self.transcripts[transcript_id] = transcript
+            self.stats['submits'] += 1
+
+        timer = threading.Timer(processing_seconds, self._complete, args=(transcript_id,))
+        timer.daemon = True
+        timer.start()
+        return self.transcript_response(transcript_id)
+
+    def transcript_response(self, transcript_id):
+        """Body of GET /v2/transcript/<id>, shaped like AssemblyAI's response"""
+        with self._lock:
+            transcript = self.transcripts.get(transcript_id)
+            if transcript is None:
+                return None
+            status = transcript['status']
+            if status == 'queued' and time.monotonic() - transcript['created'] > transcript['processing_seconds'] * 0.2:
+                status = transcript['status'] = 'processing'
+
+        response = {
+            'id': transcript_id,
+            'status': status,
+            'audio_url': transcript['audio_url'],
+            'speaker_labels': transcript['speaker_labels'],
+            'webhook_url': transcript['webhook_url'],
+            'error': None,
+            'text': None,
+            'words': None,
+            'utterances': None,
+            'confidence': None,
+            'audio_duration': None
+        }
+
+        if status == 'error':
+            response['error'] = 'Simulated transcription failure'
+        elif status == 'completed':
+            response.update(self._sample_transcript(transcript['speaker_labels']))
+        return response
+
+    def _complete(self, transcript_id):
+        """Finish a transcript and call its webhook"""
+        with self._lock:
+            transcript = self.transcripts[transcript_id]
+            transcript['status'] = 'error' if transcript['fails'] else 'completed'
+
+        if not transcript['webhook_url']:
+            return
+
+        if random.random() < self.drop_webhook_rate:
+            logger.info(f"🕳️ Dropping webhook for {transcript_id}")
+            self._count('webhooks_dropped')
+            return
+
+        headers = {'Content-Type': 'application/json'}
+        if transcript['webhook_auth_header_name']:
+            headers[transcript['webhook_auth_header_name']] = transcript['webhook_auth_header_value']
+
+        body = json.dumps({'transcript_id': transcript_id, 'status': transcript['status']}).encode('utf-8')
+        webhook_request = urllib.request.Request(transcript['webhook_url'], data=body, headers=headers, method='POST')
+        try:
+            with urllib.request.urlopen(webhook_request, timeout=10) as response:
+                logger.info(f"📬 Webhook for {transcript_id} delivered ({response.status})")
+            self._count('webhooks_sent')
+        except Exception as e:
+            logger.warning(f"⚠️ Webhook for {transcript_id} failed: {str(e)}")
+
+    def _sample_transcript(self, speaker_labels):
+        """Canned doctor-patient transcript in AssemblyAI's response format"""
+        utterances = []
+        start = 0
+        for speaker, text in SAMPLE_UTTERANCES:
+            end = start + 400 * len(text.split())
+            utterances.append({
+                'speaker': speaker,
+                'text': text,
+                'start': start,
+                'end': end,
+                'confidence': 0.95,
+                'words': []
+            })
+            start = end
+
+        return {
+            'text': ' '.join(text for _, text in SAMPLE_UTTERANCES),
+            'words': [],
+            'utterances': utterances if speaker_labels else None,
+            'confidence': 0.95,
+            'audio_duration': start / 1000
+        }
+
+    def _count(self, name):
+        with self._lock:
+            self.stats[name] += 1
+
+    def _handler_class(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def do_POST(self):
+                time.sleep(fake.latency_seconds)
+                body = self._read_body()
+
+                if self.path == '/v2/upload':
+                    fake._count('uploads')
+                    self._send_json(200, {'upload_url': f"{fake.url}/uploads/{uuid.uuid4().hex} ({len(body)} bytes)"})
+                elif self.path == '/v2/transcript':
+                    self._send_json(200, fake.create_transcript(json.loads(body or b'{}')))
+                else:
+                    self._send_json(404, {'error': 'Not found'})
+
+            def do_GET(self):
+                time.sleep(fake.latency_seconds)
+                prefix = '/v2/transcript/'
+                response = None
+                if self.path.startswith(prefix):
+                    fake._count('status_requests')
+                    response = fake.transcript_response(self.path[len(prefix):])
+
+                if response is None:
+                    self._send_json(404, {'error': 'Transcript not found'})
+                else:
+                    self._send_json(200, response)
+
+            def _read_body(self):
+                """Read a Content-Length or chunked request body"""
+                if self.headers.get('Transfer-Encoding', '').lower() == 'chunked':
+                    chunks = []
+                    while True:
+                        size = int(self.rfile.readline().strip().split(b';')[0], 16)
+                        if size == 0:
+                            self.rfile.readline()
+                            break
+                        chunks.append(self.rfile.read(size))
+                        self.rfile.readline()
+                    return b''.join(chunks)
+                return self.rfile.read(int(self.headers.get('Content-Length', 0)))
+
+            def _send_json(self, status, payload):
+                data = json.dumps(payload).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        return Handler
+
+
+def main():
+    """Command line entry point: python fake_assemblyai.py"""
+    parser = argparse.ArgumentParser(description='Run a local stand-in for the AssemblyAI API')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--processing-seconds', type=float, default=5.0, help='Time until a transcript completes')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of transcripts that fail')
+    parser.add_argument('--drop-webhook-rate', type=float, default=0.0, help='Fraction of webhooks never sent')
+    parser.add_argument('--latency', type=float, default=0.0, help='Added latency per request in seconds')
+    args = parser.parse_args()
+
+    fake = FakeAssemblyAI(
+        host=args.host,
+        port=args.port,
+        processing_seconds=args.processing_seconds,
+        error_rate=args.error_rate,
+        drop_webhook_rate=args.drop_webhook_rate,
+        latency_seconds=args.latency
+    ).start()
+
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        fake.stop()
+
+
+if __name__ == '__main__':
+    main()
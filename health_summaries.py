@@ -0,0 +1,521 @@
+"""Rolling per-patient health summaries, updated incrementally and built per time window for long histories"""
+
+import contextvars
+import json
+import os
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime
+from logger_config import setup_logger
+from config import (
+    HEALTH_SUMMARY_DB_PATH, UPLOAD_FOLDER, PRIMARY_MODEL, HEALTH_SUMMARY_DIRECT_MAX_VISITS,
+    HEALTH_SUMMARY_WINDOW_MONTHS, HEALTH_SUMMARY_WINDOW_MAX_VISITS, HEALTH_SUMMARY_REDUCE_FAN_IN,
+    HEALTH_SUMMARY_PARALLELISM, HEALTH_SUMMARY_WINDOW_MAX_TOKENS
+)
+from ai_summarization_service import PROMPT_TEMPLATE_VERSIONS
+
+logger = setup_logger()
+
+RESULTS_SUFFIX = '_results.json'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS patient_health_summaries (
+    patient_id TEXT PRIMARY KEY,
+    summary TEXT NOT NULL,
+    visits TEXT NOT NULL,
+    visit_count INTEGER NOT NULL,
+    model_used TEXT NOT NULL,
+    template_version INTEGER NOT NULL,
+    updated_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS health_summary_windows (
+    patient_id TEXT NOT NULL,
+    window_key TEXT NOT NULL,
+    visits TEXT NOT NULL,
+    record_count INTEGER NOT NULL,
+    summary TEXT NOT NULL,
+    template_version INTEGER NOT NULL,
+    updated_at TEXT NOT NULL,
+    PRIMARY KEY (patient_id, window_key)
+);
+"""
+
+MONTH_NAMES = ('Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec')
+
+SUMMARY_SECTIONS = """Please provide a detailed health summary including:
+1. **Patient Overview**: Brief introduction
+2. **Medical History Timeline**: Chronological summary of visits and conditions
+3. **Recurring Conditions**: Any patterns or recurring health issues
+4. **Current Health Status**: Latest assessment
+5. **Treatment Summary**: Medications and interventions prescribed
+6. **Follow-up Recommendations**: Any ongoing care needs
+
+Be professional, concise, and focus on key medical information. Format with clear headers and bullet points."""
+
+
+class HealthSummaryStore:
+    """SQLite store of each patient's latest health summary and the visits it covers"""
+
+    def __init__(self, db_path=HEALTH_SUMMARY_DB_PATH):
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        """Open a transaction on a fresh connection (safe across threads and gunicorn workers)"""
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        try:
+            conn.execute('PRAGMA journal_mode=WAL')
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def get_summary(self, patient_id):
+        """
+        Stored summary for a patient
+
+        Returns:
+            dict or None: summary, visits ({visit id: results file mtime_ns}), visit_count,
+                          model_used, template_version and updated_at
+        """
+        with self._connect() as conn:
+            row = conn.execute(
+                'SELECT * FROM patient_health_summaries WHERE patient_id = ?', (patient_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        summary = dict(row)
+        summary['visits'] = json.loads(summary['visits'])
+        return summary
+
+    def save_summary(self, patient_id, summary, visits, visit_count, model_used, template_version):
+        """
+        Replace a patient's summary
+
+        Args:
+            patient_id: Patient folder name
+            summary: Summary text
+            visits: {visit id: results file mtime_ns} the summary was built from
+            visit_count: Number of those visits that had a clinical summary
+            model_used: Display name of the model that wrote it
+            template_version: Version of the prompt template used
+
+        Returns:
+            str: The updated_at timestamp
+        """
+        updated_at = datetime.now().isoformat()
+        with self._connect() as conn:
+            conn.execute(
+                """INSERT OR REPLACE INTO patient_health_summaries
+                   (patient_id, summary, visits, visit_count, model_used, template_version, updated_at)
+                   VALUES (?, ?, ?, ?, ?, ?, ?)""",
+                (patient_id, summary, json.dumps(visits), visit_count, model_used, template_version, updated_at)
+            )
+        return updated_at
+
+    def delete_summary(self, patient_id):
+        """Drop a patient's summary (e.g. after one of its visits was deleted)"""
+        with self._connect() as conn:
+            conn.execute('DELETE FROM patient_health_summaries WHERE patient_id = ?', (patient_id,))
+
+    def get_windows(self, patient_id):
+        """
+        Cached time-window summaries of a patient
+
+        Returns:
+            dict: window key -> {visits, record_count, summary, template_version, updated_at}
+        """
+        with self._connect() as conn:
+            rows = conn.execute(
+                'SELECT * FROM health_summary_windows WHERE patient_id = ?', (patient_id,)
+            ).fetchall()
+        windows = {}
+        for row in rows:
+            window = dict(row)
+            window['visits'] = json.loads(window['visits'])
+            windows[window.pop('window_key')] = window
+        return windows
+
+    def save_window(self, patient_id, window_key, visits, record_count, summary, template_version):
+        """
+        Replace one window's summary
+
+        Args:
+            patient_id: Patient folder name
+            window_key: Window identifier (e.g. "2025-07")
+            visits: {visit id: results file mtime_ns} in the window
+            record_count: Number of those visits that had a clinical summary
+            summary: Window summary text ('' if no visit had a clinical summary)
+            template_version: Version of the window prompt template
+        """
+        with self._connect() as conn:
+            conn.execute(
+                """INSERT OR REPLACE INTO health_summary_windows
+                   (patient_id, window_key, visits, record_count, summary, template_version, updated_at)
+                   VALUES (?, ?, ?, ?, ?, ?, ?)""",
+                (patient_id, window_key, json.dumps(visits), record_count, summary, template_version,
+                 datetime.now().isoformat())
+            )
+
+    def prune_windows(self, patient_id, keep_keys):
+        """Drop cached windows that no longer have any visits"""
+        with self._connect() as conn:
+            rows = conn.execute(
+                'SELECT window_key FROM health_summary_windows WHERE patient_id = ?', (patient_id,)
+            ).fetchall()
+            for row in rows:
+                if row['window_key'] not in keep_keys:
+                    conn.execute(
+                        'DELETE FROM health_summary_windows WHERE patient_id = ? AND window_key = ?',
+                        (patient_id, row['window_key'])
+                    )
+
+
+class PatientHealthSummarizer:
+    """
+    Build and maintain a rolling health summary per patient
+
+    Visits are identified by their results file (timestamp prefix and mtime),
+    which only needs a directory listing. An unchanged patient gets the stored
+    summary without reading any visit; new visits are folded into the stored
+    summary with one short LLM call. A deleted or reprocessed visit, or a new
+    prompt template version, triggers a full rebuild.
+
+    Patients with more than direct_max_visits visits would not fit one prompt,
+    so their visits are grouped into time windows (map), each summarized on
+    its own, and the window summaries are combined fan_in at a time until one
+    final summary remains (reduce). Window summaries are stored with the
+    visits they cover, so a new visit only recomputes its own window; the
+    reduce steps over unchanged windows repeat identical prompts and are
+    served by the completion cache.
+    """
+
+    def __init__(self, ai_service, store=None, upload_folder=UPLOAD_FOLDER,
+                 direct_max_visits=HEALTH_SUMMARY_DIRECT_MAX_VISITS, window_months=HEALTH_SUMMARY_WINDOW_MONTHS,
+                 window_max_visits=HEALTH_SUMMARY_WINDOW_MAX_VISITS, reduce_fan_in=HEALTH_SUMMARY_REDUCE_FAN_IN,
+                 parallelism=HEALTH_SUMMARY_PARALLELISM, window_max_tokens=HEALTH_SUMMARY_WINDOW_MAX_TOKENS):
+        self.ai_service = ai_service
+        self.store = store or HealthSummaryStore()
+        self.upload_folder = upload_folder
+        self.direct_max_visits = direct_max_visits
+        self.window_months = window_months
+        self.window_max_visits = window_max_visits
+        self.reduce_fan_in = max(reduce_fan_in, 2)
+        self.parallelism = parallelism
+        self.window_max_tokens = window_max_tokens
+
+    def get_summary(self, patient_id, refresh=False):
+        """
+        Current health summary for a patient
+
+        Args:
+            patient_id: Patient folder name (already sanitized)
+            refresh: Ignore the stored summary and rebuild from every visit
+
+        Returns:
+            dict: success, summary, total_visits, model_used, generated_at and
+                  how it was produced ('cached', 'incremental', 'full' or 'hierarchical'), or an error
+        """
+        visits = self.list_visits(patient_id)
+        if visits is None:
+            return {'success': False, 'error': 'No records found for this patient', 'status_code': 404}
+
+        template_version = PROMPT_TEMPLATE_VERSIONS['patient_health_summary']
+        stored = None if refresh else self.store.get_summary(patient_id)
+        if stored and stored['template_version'] != template_version:
+            stored = None
+
+        if stored and stored['visits'] == visits:
+            logger.info(f"♻️ Health summary for {patient_id} is up to date ({stored['visit_count']} visit(s))")
+            return self._response(stored['summary'], stored['visit_count'], stored['model_used'],
+                                  stored['updated_at'], 'cached')
+
+        if len(visits) > self.direct_max_visits:
+            return self._hierarchical_summary(patient_id, visits, template_version, refresh)
+
+        new_visit_ids = None
+        if stored and all(visits.get(visit_id) == mtime for visit_id, mtime in stored['visits'].items()):
+            new_visit_ids = sorted(set(visits) - set(stored['visits']))
+
+        if new_visit_ids is not None:
+            records = self._load_records(patient_id, new_visit_ids)
+            if not records:
+                # Only visits without a clinical summary were added
+                updated_at = self.store.save_summary(patient_id, stored['summary'], visits, stored['visit_count'],
+                                                     stored['model_used'], template_version)
+                return self._response(stored['summary'], stored['visit_count'], stored['model_used'],
+                                      updated_at, 'cached')
+
+            logger.info(f"📋 Updating health summary for {patient_id} with {len(records)} new visit(s)")
+            prompt = self._update_prompt(patient_id, stored['summary'], records)
+            template = 'patient_health_summary_update'
+            visit_count = stored['visit_count'] + len(records)
+            mode = 'incremental'
+        else:
+            records = self._load_records(patient_id, sorted(visits))
+            if not records:
+                return {'success': False, 'error': 'No clinical summaries found for this patient', 'status_code': 404}
+
+            logger.info(f"📋 Generating health summary for {patient_id} from {len(records)} visit(s)")
+            prompt = self._full_prompt(patient_id, records)
+            template = 'patient_health_summary'
+            visit_count = len(records)
+            mode = 'full'
+
+        # Same model fallback chain and circuit breakers as the visit summaries
+        result = self.ai_service._call_ai_with_fallback(
+            prompt,
+            "Patient Health Summary",
+            max_tokens=800,
+            template=template
+        )
+        if not result['success']:
+            return {'success': False, 'error': result.get('error', 'Failed to generate summary'), 'status_code': 500}
+
+        model_used = "Clinical AI" if result['model'] == PRIMARY_MODEL else "Clinical AI (Fallback)"
+        updated_at = self.store.save_summary(patient_id, result['response'], visits, visit_count, model_used,
+                                             template_version)
+        return self._response(result['response'], visit_count, model_used, updated_at, mode)
+
+    def _hierarchical_summary(self, patient_id, visits, template_version, refresh):
+        """Map-reduce summary over time windows, recomputing only windows whose visits changed"""
+        windows = group_visits(visits, self.window_months, self.window_max_visits)
+        window_version = PROMPT_TEMPLATE_VERSIONS['patient_health_window']
+        cached = {} if refresh else self.store.get_windows(patient_id)
+        stale = [
+            key for key, window_visits in windows.items()
+            if key not in cached
+            or cached[key]['visits'] != window_visits
+            or cached[key]['template_version'] != window_version
+        ]
+        logger.info(f"📋 Summarizing {patient_id} in {len(windows)} window(s), {len(stale)} to recompute")
+
+        results = self._map(lambda key: self._summarize_window(patient_id, key, windows[key]), stale)
+        for key, result in zip(stale, results):
+            if not result['success']:
+                return {'success': False, 'error': result.get('error', 'Failed to summarize visits'), 'status_code': 500}
+            self.store.save_window(patient_id, key, windows[key], result['record_count'], result['summary'],
+                                   window_version)
+            cached[key] = {'summary': result['summary'], 'record_count': result['record_count']}
+        self.store.prune_windows(patient_id, set(windows))
+
+        sections = [(window_label(key, self.window_months), cached[key]['summary'])
+                    for key in windows if cached[key]['summary']]
+        visit_count = sum(cached[key]['record_count'] for key in windows)
+        if not sections:
+            return {'success': False, 'error': 'No clinical summaries found for this patient', 'status_code': 404}
+
+        # Reduce: combine consecutive window summaries until one prompt can hold them all
+        while len(sections) > self.reduce_fan_in:
+            groups = [sections[index:index + self.reduce_fan_in]
+                      for index in range(0, len(sections), self.reduce_fan_in)]
+            results = self._map(lambda group: self._call(
+                self._reduce_prompt(patient_id, group), "Health Summary Period",
+                'patient_health_reduce', self.window_max_tokens
+            ), groups)
+            sections = []
+            for group, result in zip(groups, results):
+                if not result['success']:
+                    return {'success': False, 'error': result.get('error', 'Failed to combine summaries'), 'status_code': 500}
+                sections.append((join_labels(group[0][0], group[-1][0]), result['response']))
+
+        result = self._call(self._final_prompt(patient_id, sections), "Patient Health Summary",
+                            'patient_health_summary_reduce', 800)
+        if not result['success']:
+            return {'success': False, 'error': result.get('error', 'Failed to generate summary'), 'status_code': 500}
+
+        model_used = "Clinical AI" if result['model'] == PRIMARY_MODEL else "Clinical AI (Fallback)"
+        updated_at = self.store.save_summary(patient_id, result['response'], visits, visit_count, model_used,
+                                             template_version)
+        return self._response(result['response'], visit_count, model_used, updated_at, 'hierarchical')
+
+    def _summarize_window(self, patient_id, window_key, window_visits):
+        """Summarize the visits of one window"""
+        records = self._load_records(patient_id, sorted(window_visits))
+        if not records:
+            return {'success': True, 'summary': '', 'record_count': 0}
+
+        label = window_label(window_key, self.window_months)
+        result = self._call(self._window_prompt(patient_id, label, records), "Health Summary Window",
+                            'patient_health_window', self.window_max_tokens)
+        if not result['success']:
+            return result
+        return {'success': True, 'summary': result['response'], 'record_count': len(records)}
+
+    def _call(self, prompt, summary_type, template, max_tokens):
+        """One LLM call through the usual model fallback chain"""
+        return self.ai_service._call_ai_with_fallback(prompt, summary_type, max_tokens=max_tokens, template=template)
+
+    def _map(self, fn, items):
+        """Run fn over items in parallel (keeping the caller's correlation id), results in order"""
+        if len(items) <= 1:
+            return [fn(item) for item in items]
+        with ThreadPoolExecutor(max_workers=min(self.parallelism, len(items)),
+                                thread_name_prefix='aiscribe-health-summary') as executor:
+            futures = [executor.submit(contextvars.copy_context().run, fn, item) for item in items]
+            return [future.result() for future in futures]
+
+    def invalidate(self, patient_id):
+        """Forget a patient's stored summary so the next request rebuilds it"""
+        self.store.delete_summary(patient_id)
+        logger.info(f"🗑️ Health summary for {patient_id} invalidated")
+
+    def list_visits(self, patient_id):
+        """
+        Visits in a patient folder, without reading them
+
+        Returns:
+            dict or None: {visit id (timestamp prefix): results file mtime_ns}, None if the folder is missing
+        """
+        patient_folder = os.path.join(self.upload_folder, patient_id)
+        try:
+            entries = list(os.scandir(patient_folder))
+        except FileNotFoundError:
+            return None
+
+        return {
+            entry.name[:-len(RESULTS_SUFFIX)]: entry.stat().st_mtime_ns
+            for entry in entries
+            if entry.name.endswith(RESULTS_SUFFIX) and entry.is_file()
+        }
+
+    def _load_records(self, patient_id, visit_ids):
+        """Formatted clinical records of the given visits (visits without a clinical summary are skipped)"""
+        records = []
+        for visit_id in visit_ids:
+            results_path = os.path.join(self.upload_folder, patient_id, f"{visit_id}{RESULTS_SUFFIX}")
+            try:
+                with open(results_path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+            except Exception as e:
+                logger.warning(f"Error loading record {visit_id}{RESULTS_SUFFIX}: {str(e)}")
+                continue
+
+            clinical_summary = data.get('clinical_summary', {})
+            if clinical_summary:
+                records.append(format_visit_record(data.get('timestamp', 'Unknown date'), clinical_summary))
+        return records
+
+    def _full_prompt(self, patient_id, records):
+        return f"""You are a medical records specialist. Based on the following clinical records for patient {patient_id}, create a comprehensive health history summary.
+
+CLINICAL RECORDS:
+{chr(10).join(records)}
+
+{SUMMARY_SECTIONS}"""
+
+    def _update_prompt(self, patient_id, previous_summary, records):
+        return f"""You are a medical records specialist. Below is the existing health history summary for patient {patient_id}, followed by clinical records of visits it does not include yet. Update the summary so it covers all visits: add the new visits to the timeline in date order, revise recurring conditions, current health status, treatments and follow-up as the new visits require, and keep everything from the existing summary that is still accurate.
+
+EXISTING SUMMARY:
+{previous_summary}
+
+NEW CLINICAL RECORDS:
+{chr(10).join(records)}
+
+{SUMMARY_SECTIONS}"""
+
+    def _window_prompt(self, patient_id, label, records):
+        return f"""You are a medical records specialist. Summarize the following clinical records of patient {patient_id} from {label}.
+
+CLINICAL RECORDS:
+{chr(10).join(records)}
+
+List each visit date with its complaint, findings and diagnosis, then all medications (with doses) and other treatments, and any follow-up that was planned. Be concise and keep every diagnosis, medication and date."""
+
+    def _reduce_prompt(self, patient_id, sections):
+        return f"""You are a medical records specialist. Combine the following consecutive period summaries of patient {patient_id} into one chronological summary covering {join_labels(sections[0][0], sections[-1][0])}.
+
+{format_sections(sections)}
+
+Keep every diagnosis, medication (with doses), treatment and date, note conditions that recur across periods, and be concise."""
+
+    def _final_prompt(self, patient_id, sections):
+        return f"""You are a medical records specialist. Based on the following summaries of consecutive periods of care for patient {patient_id}, create a comprehensive health history summary.
+
+{format_sections(sections)}
+
+{SUMMARY_SECTIONS}"""
+
+    def _response(self, summary, visit_count, model_used, generated_at, mode):
+        return {
+            'success': True,
+            'summary': summary,
+            'total_visits': visit_count,
+            'model_used': model_used,
+            'generated_at': generated_at,
+            'mode': mode
+        }
+
+
+def format_visit_record(visit_date, clinical_summary):
+    """One visit's clinical summary as a prompt record"""
+    return f"""
+Visit Date: {visit_date}
+Chief Complaint: {clinical_summary.get('chief_complaint', 'N/A')}
+History of Present Illness: {clinical_summary.get('history_of_present_illness', 'N/A')}
+Assessment and Plan: {clinical_summary.get('assessment_plan', 'N/A')}
+---
+"""
+
+
+def group_visits(visits, window_months, max_visits):
+    """
+    Group visits into calendar windows of window_months months
+
+    Visit ids start with the recording date (YYYYMMDD). Windows holding more
+    than max_visits visits are split into consecutive chunks ("2025-07#2").
+
+    Returns:
+        dict: window key -> {visit id: mtime_ns}, in chronological order
+    """
+    windows = {}
+    for visit_id in sorted(visits):
+        try:
+            visit_date = datetime.strptime(visit_id[:8], '%Y%m%d')
+            start_month = (visit_date.month - 1) // window_months * window_months + 1
+            key = f"{visit_date.year}-{start_month:02d}"
+        except ValueError:
+            key = 'undated'
+        windows.setdefault(key, {})[visit_id] = visits[visit_id]
+
+    grouped = {}
+    for key in sorted(windows):
+        visit_ids = list(windows[key])
+        if len(visit_ids) <= max_visits:
+            grouped[key] = windows[key]
+            continue
+        for index in range(0, len(visit_ids), max_visits):
+            grouped[f"{key}#{index // max_visits + 1}"] = {
+                visit_id: windows[key][visit_id] for visit_id in visit_ids[index:index + max_visits]
+            }
+    return grouped
+
+
+def window_label(window_key, window_months):
+    """Readable period of a window key (e.g. Jul 2025 - Dec 2025)"""
+    key = window_key.split('#')[0]
+    if key == 'undated':
+        return 'Undated visits'
+    year, start_month = (int(part) for part in key.split('-'))
+    end_month = min(start_month + window_months - 1, 12)
+    if end_month == start_month:
+        return f"{MONTH_NAMES[start_month - 1]} {year}"
+    return f"{MONTH_NAMES[start_month - 1]} {year} - {MONTH_NAMES[end_month - 1]} {year}"
+
+
+def join_labels(first, last):
+    """Period spanning two window labels"""
+    start = first.split(' - ')[0]
+    end = last.split(' - ')[-1]
+    return start if start == end else f"{start} - {end}"
+
+
+def format_sections(sections):
+    """Period summaries as prompt text"""
+    return '\n\n'.join(f"PERIOD: {label}\n{summary}" for label, summary in sections)
@@ -0,0 +1,213 @@
+# IMAP FETCH helpers for AIscribe - parse FETCH responses and BODYSTRUCTURE
+
+import base64
+import quopri
+import re
+
+LPAREN = object()
+RPAREN = object()
+
+LITERAL_MARKER = re.compile(rb'\{\d+\}$')
+
+
+def parse_fetch_response(data):
+    """
+    Parse the data returned by imaplib for a UID FETCH command
+
+    imaplib hands literals back as (prefix, literal) tuples and everything
+    else as bytes, so the pieces are reassembled into one token stream.
+
+    Args:
+        data: Response data list from IMAP4.uid('FETCH', ...)
+
+    Returns:
+        dict: UID -> {item name: value}; lists stay lists, literals are bytes,
+              e.g. {'BODYSTRUCTURE': [...], 'BODY[1]<0>': b'...'}
+    """
+    tokens = []
+    for item in data:
+        if isinstance(item, tuple):
+            tokens.extend(_tokenize(item[0]))
+            tokens.append(item[1])
+        elif item:
+            tokens.extend(_tokenize(item))
+
+    messages = {}
+    position = 0
+    while position < len(tokens):
+        value, position = _read_value(tokens, position)
+        if not isinstance(value, list):
+            continue  # Message sequence number
+
+        # Each message is "<seq> (NAME value NAME value ...)"
+        attrs = {}
+        for index in range(0, len(value) - 1, 2):
+            attrs[str(value[index]).upper()] = value[index + 1]
+        if 'UID' in attrs:
+            messages[int(attrs['UID'])] = attrs
+
+    return messages
+
+
+def get_fetch_item(attrs, prefix):
+    """Value of the first FETCH item whose name starts with prefix (servers echo section names loosely)"""
+    for name, value in attrs.items():
+        if name.startswith(prefix):
+            return value
+    return None
+
+
+def find_text_part(structure):
+    """
+    Choose the body part to download from a BODYSTRUCTURE
+
+    Like a full parse would, prefer the first text/plain part, else the first
+    text/html part, skipping attachments and attached messages.
+
+    Args:
+        structure: Parsed BODYSTRUCTURE list
+
+    Returns:
+        dict or None: section, subtype, charset, encoding and size of the part
+    """
+    if not isinstance(structure, list) or not structure:
+        return None
+
+    html = None
+    for section, part in _walk(structure, ''):
+        if len(part) < 7 or not isinstance(part[0], str) or part[0].upper() != 'TEXT':
+            continue
+        if _is_attachment(part):
+            continue
+
+        subtype = str(part[1]).upper()
+        params = _params(part[2])
+        text_part = {
+            'section': section,
+            'subtype': subtype,
+            'charset': params.get('CHARSET'),
+            'encoding': str(part[5] or '7BIT').upper(),
+            'size': int(part[6]) if str(part[6]).isdigit() else None
+        }
+        if subtype == 'PLAIN':
+            return text_part
+        if subtype == 'HTML' and html is None:
+            html = text_part
+
+    return html
+
+
+def decode_body_part(data, encoding, charset):
+    """
+    Decode a (possibly truncated) body section to text
+
+    Args:
+        data: Raw section bytes as fetched
+        encoding: Content-Transfer-Encoding from BODYSTRUCTURE
+        charset: Charset parameter, if any
+
+    Returns:
+        str: Decoded text
+    """
+    if not data:
+        return ''
+
+    if encoding == 'BASE64':
+        compact = b''.join(data.split())
+        # A size-capped fetch can end mid-quantum
+        data = base64.b64decode(compact[:len(compact) - len(compact) % 4])
+    elif encoding == 'QUOTED-PRINTABLE':
+        data = quopri.decodestring(data)
+
+    try:
+        return data.decode(charset or 'utf-8', errors='ignore')
+    except LookupError:
+        return data.decode('utf-8', errors='ignore')
+
+
+def _walk(structure, section):
+    """Yield (section number, single-part structure) for every leaf part"""
+    if isinstance(structure[0], list):
+        # Multipart: child parts come first, then the subtype and extension data
+        for index, child in enumerate(structure):
+            if not isinstance(child, list) or not child:
+                break
+            child_section = f"{section}.{index + 1}" if section else str(index + 1)
+            yield from _walk(child, child_section)
+    else:
+        yield section or '1', structure
+
+
+def _is_attachment(part):
+    """Whether the part's disposition (in the extension data) is attachment"""
+    for item in part[7:]:
+        if isinstance(item, list) and item and isinstance(item[0], str) and item[0].upper() == 'ATTACHMENT':
+            return True
+    return False
+
+
+def _params(value):
+    """Body parameter list ("CHARSET" "utf-8" ...) as an upper-cased dict"""
+    if not isinstance(value, list):
+        return {}
+    return {str(value[i]).upper(): value[i + 1] for i in range(0, len(value) - 1, 2)}
+
+
+def _read_value(tokens, position):
+    """Read one value (nested lists for parentheses) starting at position"""
+    token = tokens[position]
+    if token is LPAREN:
+        items = []
+        position += 1
+        while position < len(tokens) and tokens[position] is not RPAREN:
+            item, position = _read_value(tokens, position)
+            items.append(item)
+        return items, position + 1
+    if token is RPAREN:
+        return None, position + 1  # Unbalanced close: skip it
+    return token, position + 1
+
+
+def _tokenize(text):
+    """Split response text into parens, atoms (str), quoted strings (str) and NIL (None)"""
+    text = LITERAL_MARKER.sub(b'', text.rstrip())
+    tokens = []
+    position = 0
+    length = len(text)
+
+    while position < length:
+        char = text[position:position + 1]
+        if char in (b' ', b'\r', b'\n'):
+            position += 1
+        elif char == b'(':
+            tokens.append(LPAREN)
+            position += 1
+        elif char == b')':
+            tokens.append(RPAREN)
+            position += 1
+        elif char == b'"':
+            position += 1
+            value = bytearray()
+            while position < length and text[position:position + 1] != b'"':
+                if text[position:position + 1] == b'\\':
+                    position += 1
+                value += text[position:position + 1]
+                position += 1
+            tokens.append(value.decode('utf-8', errors='ignore'))
+            position += 1
+        else:
+            start = position
+            depth = 0
+            while position < length:
+                char = text[position:position + 1]
+                if char == b'[':
+                    depth += 1
+                elif char == b']':
+                    depth -= 1
+                elif depth == 0 and char in (b' ', b'(', b')', b'"'):
+                    break
+                position += 1
+            atom = text[start:position].decode('utf-8', errors='ignore')
+            tokens.append(None if atom.upper() == 'NIL' else atom)
+
+    return tokens
@@ -0,0 +1,529 @@
+# Inbox sync for AIscribe - one IMAP IDLE connection files patient replies as they arrive
+
+import hashlib
+import json
+import logging
+import os
+import re
+import select
+import threading
+import time
+from datetime import datetime, timedelta
+from email.utils import parseaddr
+from itertools import count
+from werkzeug.utils import secure_filename
+from logger_config import setup_logger, log_event, correlation_id, new_correlation_id
+from config import (
+    UPLOAD_FOLDER, INBOX_SYNC_ENABLED, INBOX_SYNC_IDLE_SECONDS, INBOX_SYNC_POLL_SECONDS,
+    INBOX_SYNC_RECONNECT_MAX_SECONDS, INBOX_SYNC_BATCH_LIMIT, INBOX_SYNC_LOCK_PATH, INBOX_UNROUTED_RETENTION_DAYS
+)
+
+try:
+    import fcntl
+except ImportError:  # Windows: the dev server is a single process, so no leader election is needed
+    fcntl = None
+
+logger = setup_logger('EmailService')
+
+# Seconds to wait for the server to acknowledge IDLE or DONE
+IDLE_RESPONSE_TIMEOUT = 30
+
+# How often a worker that is not the leader checks whether it can take over
+LEADER_RETRY_SECONDS = 30
+
+MAILBOX_CHANGED = re.compile(rb'^\* \d+ EXISTS')
+MESSAGE_ID = re.compile(r'<[^<>\s]+>')
+
+
+def inbox_message_key(email_data):
+    """
+    Stable digest identifying an inbound email
+
+    Unlike hash(), the digest is the same in every worker and across restarts.
+    It is taken from the Message-ID, or from the sender, recipient, date and
+    subject when the Message-ID is missing.
+
+    Args:
+        email_data: Email dictionary from EmailService
+
+    Returns:
+        str: Hex SHA-256 digest
+    """
+    message_id = (email_data.get('id') or '').strip()
+    if message_id:
+        source = f"id:{message_id}"
+    else:
+        source = 'headers:' + '\n'.join(str(email_data.get(field) or '') for field in ('from', 'to', 'timestamp', 'subject'))
+    return hashlib.sha256(source.encode('utf-8')).hexdigest()
+
+
+def inbox_filename(message_key):
+    """Stored filename for an inbound email"""
+    return f"inbox_{message_key[:24]}_email.json"
+
+
+class IdleLineReader:
+    """
+    Read lines straight from the IMAP socket while in IDLE
+
+    Waiting with select() instead of imaplib's buffered file means a timeout
+    never leaves that file unusable for the commands that follow.
+    """
+
+    def __init__(self, sock, stop_event):
+        self.sock = sock
+        self.stop_event = stop_event
+        self.buffer = b''
+
+    def readline(self, timeout, interruptible=True):
+        """
+        Next line from the server
+
+        Args:
+            timeout: Seconds to wait
+            interruptible: Give up early when a stop is requested
+
+        Returns:
+            bytes or None: The line without CRLF, or None if nothing arrived in time
+        """
+        deadline = time.monotonic() + timeout
+        while b'\n' not in self.buffer:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or (interruptible and self.stop_event.is_set()):
+                return None
+
+            # TLS may already hold decrypted bytes that select() cannot see
+            pending = self.sock.pending() if hasattr(self.sock, 'pending') else 0
+            if not pending:
+                readable, _, _ = select.select([self.sock], [], [], min(remaining, 1.0))
+                if not readable:
+                    continue
+
+            data = self.sock.recv(4096)
+            if not data:
+                raise ConnectionError('IMAP server closed the connection')
+            self.buffer += data
+
+        line, self.buffer = self.buffer.split(b'\n', 1)
+        return line.rstrip(b'\r')
+
+
+class InboxSyncDaemon:
+    """
+    Keep patient folders up to date from one long-lived IMAP connection
+
+    Every gunicorn worker starts the thread, but only the one holding the
+    INBOX_SYNC_LOCK_PATH lock talks to the server; the others wait to take over
+    if it exits. The leader syncs new mail, then waits in IDLE until the server
+    reports a change (re-issuing IDLE every idle_seconds), polls when the server
+    has no IDLE, and reconnects with exponential backoff after errors.
+
+    Replies are routed by X-Patient-ID, by the sent email their In-Reply-To /
+    References headers point at, or else by the sender address the patient was
+    emailed at. Mail that matches no patient is held in the sync store and
+    routed again on every sync (e.g. once the patient is first emailed), for up
+    to INBOX_UNROUTED_RETENTION_DAYS.
+    """
+
+    def __init__(self, email_service, upload_folder=UPLOAD_FOLDER, enabled=INBOX_SYNC_ENABLED,
+                 idle_seconds=INBOX_SYNC_IDLE_SECONDS, poll_seconds=INBOX_SYNC_POLL_SECONDS,
+                 reconnect_max_seconds=INBOX_SYNC_RECONNECT_MAX_SECONDS, batch_limit=INBOX_SYNC_BATCH_LIMIT,
+                 lock_path=INBOX_SYNC_LOCK_PATH, unrouted_retention_days=INBOX_UNROUTED_RETENTION_DAYS):
+        self.email_service = email_service
+        self.upload_folder = upload_folder
+        self.enabled = enabled and bool(email_service.username)
+        self.idle_seconds = idle_seconds
+        self.poll_seconds = poll_seconds
+        self.reconnect_max_seconds = reconnect_max_seconds
+        self.batch_limit = batch_limit
+        self.lock_path = lock_path
+        self.unrouted_retention_days = unrouted_retention_days
+        self._thread = None
+        self._thread_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._tags = count(1)
+        self._reconnect_delay = 1
+        self._stats = {
+            'leader': False,
+            'connected': False,
+            'idle_supported': None,
+            'syncs': 0,
+            'emails_filed': 0,
+            'emails_unrouted': 0,
+            'reconnects': 0,
+            'last_error': None
+        }
+
+    def start(self):
+        """Start this process's sync thread if enabled and not running"""
+        if not self.enabled:
+            return
+
+        with self._thread_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run, name='aiscribe-inbox-sync', daemon=True)
+                self._thread.start()
+
+    def stop(self):
+        """Ask the sync thread to log out and exit"""
+        self._stop.set()
+
+    def status(self):
+        """
+        Sync state: this process's counters plus the last sync time shared by all workers
+
+        Returns:
+            dict: leader/connection flags, counters and last_sync_at
+        """
+        status = dict(self._stats)
+        status['enabled'] = self.enabled
+        state = self.email_service.sync_store.get_sync_state('inbox:ALL')
+        status['last_sync_at'] = state['updated_at'] if state else None
+        return status
+
+    def inbox_counts(self, patient_id=None, since=None):
+        """
+        Count filed inbox emails from the shared index (any worker can answer)
+
+        Args:
+            patient_id: Only this patient (all patients if None)
+            since: ISO timestamp; emails filed after it are counted as new
+
+        Returns:
+            dict: total and new email counts, plus how many patients have new mail
+        """
+        folder = secure_filename(patient_id) if patient_id is not None else None
+        return self.email_service.sync_store.count_inbox_messages(folder, since)
+
+    def file_email(self, patient_id, email_data):
+        """
+        File an inbound email in the patient's folder unless it is already there
+
+        Args:
+            patient_id: Patient identifier
+            email_data: Email dictionary from EmailService
+
+        Returns:
+            bool: True if the email was new
+        """
+        folder = secure_filename(patient_id)
+        message_key = inbox_message_key(email_data)
+        filename = inbox_filename(message_key)
+        synced_at = datetime.now().isoformat()
+
+        sync_store = self.email_service.sync_store
+        if not sync_store.claim_inbox_message(folder, message_key, filename, synced_at):
+            return False
+
+        try:
+            patient_folder = os.path.join(self.upload_folder, folder)
+            os.makedirs(patient_folder, exist_ok=True)
+
+            email_data['patient_id'] = patient_id
+            email_data['synced_at'] = synced_at
+            email_path = os.path.join(patient_folder, filename)
+            tmp_path = f"{email_path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(email_data, f, indent=2, ensure_ascii=False)
+            os.replace(tmp_path, email_path)
+        except Exception:
+            # Let a later sync retry this email
+            sync_store.release_inbox_message(folder, message_key)
+            raise
+
+        return True
+
+    def migrate_inbox_files(self):
+        """
+        Index inbox emails saved before the dedup index existed
+
+        Older files were named after hash(Message-ID), which differs per process,
+        so the same email may be stored several times. Each file is indexed under
+        its stable key and renamed to the stable filename; later copies of an
+        email that is already indexed are deleted. Runs once per deployment.
+
+        Returns:
+            dict or None: indexed and removed file counts, or None if already done
+        """
+        sync_store = self.email_service.sync_store
+        if not sync_store.claim_migration('inbox_message_index'):
+            return None
+
+        indexed = 0
+        removed = 0
+        for folder in sorted(os.listdir(self.upload_folder)):
+            patient_folder = os.path.join(self.upload_folder, folder)
+            if folder.startswith('.') or not os.path.isdir(patient_folder):
+                continue
+
+            filenames = [name for name in os.listdir(patient_folder)
+                         if name.startswith('inbox_') and name.endswith('_email.json')]
+            # Keep the oldest copy of each email
+            filenames.sort(key=lambda name: os.path.getmtime(os.path.join(patient_folder, name)))
+
+            for filename in filenames:
+                email_path = os.path.join(patient_folder, filename)
+                try:
+                    with open(email_path, 'r', encoding='utf-8') as f:
+                        email_data = json.load(f)
+                except (OSError, ValueError) as e:
+                    logger.warning(f"⚠️ Skipping unreadable inbox email {email_path}: {str(e)}")
+                    continue
+
+                message_key = inbox_message_key(email_data)
+                stable_name = inbox_filename(message_key)
+                synced_at = email_data.get('synced_at') or datetime.fromtimestamp(os.path.getmtime(email_path)).isoformat()
+
+                if sync_store.claim_inbox_message(folder, message_key, stable_name, synced_at):
+                    if filename != stable_name:
+                        os.replace(email_path, os.path.join(patient_folder, stable_name))
+                    indexed += 1
+                elif sync_store.get_inbox_filename(folder, message_key) != filename:
+                    os.remove(email_path)
+                    removed += 1
+
+        logger.info(f"🗂️ Indexed {indexed} inbox email(s), removed {removed} duplicate(s)")
+        return {'indexed': indexed, 'removed': removed}
+
+    def migrate_patient_addresses(self):
+        """
+        Index the addresses of outbound emails saved before addresses were recorded
+
+        Mail sent before then has no recorded Message-ID either, so replies to it
+        can only be routed by the sender. Runs once per deployment.
+
+        Returns:
+            int or None: Number of emails indexed, or None if already done
+        """
+        sync_store = self.email_service.sync_store
+        if not sync_store.claim_migration('patient_address_index'):
+            return None
+
+        indexed = 0
+        for folder in sorted(os.listdir(self.upload_folder)):
+            patient_folder = os.path.join(self.upload_folder, folder)
+            if folder.startswith('.') or not os.path.isdir(patient_folder):
+                continue
+
+            for filename in os.listdir(patient_folder):
+                if not filename.endswith('_email.json') or filename.startswith('inbox_'):
+                    continue
+                email_path = os.path.join(patient_folder, filename)
+                try:
+                    with open(email_path, 'r', encoding='utf-8') as f:
+                        email_data = json.load(f)
+                except (OSError, ValueError) as e:
+                    logger.warning(f"⚠️ Skipping unreadable email {email_path}: {str(e)}")
+                    continue
+
+                sent_at = email_data.get('sent_at') or email_data.get('timestamp') or \
+                    datetime.fromtimestamp(os.path.getmtime(email_path)).isoformat()
+                sync_store.record_patient_address(email_data.get('to'), folder, sent_at)
+                indexed += 1
+
+        logger.info(f"🗂️ Indexed the recipients of {indexed} sent email(s)")
+        return indexed
+
+    def route(self, email_data):
+        """
+        Patient an inbound email belongs to
+
+        Args:
+            email_data: Email dictionary from EmailService
+
+        Returns:
+            str or None: Patient identifier, or None if the email cannot be routed
+        """
+        patient_id = email_data.get('patient_id')
+        if patient_id and patient_id != 'unknown':
+            return patient_id
+
+        # Most specific first: the direct parent, then the thread from newest to oldest
+        message_ids = MESSAGE_ID.findall(email_data.get('in_reply_to') or '')
+        message_ids += reversed(MESSAGE_ID.findall(email_data.get('references') or ''))
+        sync_store = self.email_service.sync_store
+        patient_id = sync_store.find_patient_for_reply(message_ids)
+        if patient_id is not None:
+            return patient_id
+
+        # No thread headers we know (e.g. replies to mail sent before Message-IDs were recorded)
+        return sync_store.find_patient_by_address(parseaddr(email_data.get('from') or '')[1])
+
+    def refile_unrouted(self):
+        """
+        Route held emails again, filing those that now match a patient
+
+        Returns:
+            int: Number of emails filed
+        """
+        sync_store = self.email_service.sync_store
+        cutoff = (datetime.now() - timedelta(days=self.unrouted_retention_days)).isoformat()
+        dropped = sync_store.prune_unrouted_messages(cutoff)
+        if dropped:
+            logger.info(f"🗑️ Gave up on {dropped} inbox email(s) no patient matched")
+
+        filed = 0
+        for message_key, email_data in sync_store.list_unrouted_messages():
+            patient_id = self.route(email_data)
+            if patient_id is None:
+                continue
+            if self.file_email(patient_id, email_data):
+                filed += 1
+            sync_store.release_unrouted_message(message_key)
+        return filed
+
+    def sync(self, mail):
+        """
+        Download new mail on an open session and file it into patient folders
+
+        Args:
+            mail: Logged-in IMAP connection
+
+        Returns:
+            int: Number of emails filed
+        """
+        # Each sync cycle is its own unit of work in the logs
+        token = correlation_id.set(new_correlation_id())
+        try:
+            return self._sync(mail)
+        finally:
+            correlation_id.reset(token)
+
+    def _sync(self, mail):
+        """Sync cycle body (see sync)"""
+        started = time.perf_counter()
+        filed = self.refile_unrouted()
+        while True:
+            emails = self.email_service.sync_mailbox(mail, limit=self.batch_limit)
+            for email_data in emails:
+                patient_id = self.route(email_data)
+                if patient_id is None:
+                    # The sync position moves past it, so keep it to file once a patient matches
+                    self._stats['emails_unrouted'] += 1
+                    logger.info(f"📭 No patient for email {email_data.get('id')} from {email_data.get('from')}, holding it")
+                    self.email_service.sync_store.hold_unrouted_message(
+                        inbox_message_key(email_data), parseaddr(email_data.get('from') or '')[1].lower(), email_data
+                    )
+                    continue
+                if self.file_email(patient_id, email_data):
+                    filed += 1
+
+            # A full batch means there may be more to catch up on
+            if len(emails) < self.batch_limit:
+                break
+
+        self._stats['syncs'] += 1
+        self._stats['emails_filed'] += filed
+        if filed:
+            logger.info(f"📥 Filed {filed} new inbox email(s)")
+        log_event(
+            logger, f"📬 Inbox sync filed {filed} email(s)", level=logging.DEBUG,
+            event='stage', stage='inbox_sync', outcome='completed',
+            duration_ms=round((time.perf_counter() - started) * 1000), filed=filed
+        )
+        return filed
+
+    def _run(self):
+        """Sync thread: become leader, then keep a session open until stopped"""
+        lock_file = self._acquire_leadership()
+        if self._stop.is_set():
+            return
+
+        self._stats['leader'] = True
+        logger.info(f"📡 Inbox sync started in process {os.getpid()}")
+
+        try:
+            while not self._stop.is_set():
+                try:
+                    self._session()
+                except Exception as e:
+                    self._stats['reconnects'] += 1
+                    self._stats['last_error'] = str(e)[:300]
+                    logger.warning(f"⚠️ Inbox sync connection lost ({str(e)}), reconnecting in {self._reconnect_delay:.0f}s")
+                    self._stop.wait(self._reconnect_delay)
+                    self._reconnect_delay = min(self._reconnect_delay * 2, self.reconnect_max_seconds)
+        finally:
+            self._stats['leader'] = False
+            if lock_file is not None:
+                lock_file.close()
+
+    def _acquire_leadership(self):
+        """Wait until this process holds the sync lock (kept for the life of the thread)"""
+        if fcntl is None:
+            return None
+
+        lock_file = open(self.lock_path, 'a')
+        while not self._stop.is_set():
+            try:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return lock_file
+            except OSError:
+                self._stop.wait(LEADER_RETRY_SECONDS)
+
+        lock_file.close()
+        return None
+
+    def _session(self):
+        """One IMAP session: sync, then wait for changes, until stopped or the connection fails"""
+        mail = self.email_service.connect_imap()
+        self._stats['connected'] = True
+        self._reconnect_delay = 1
+
+        idle_supported = 'IDLE' in mail.capabilities
+        self._stats['idle_supported'] = idle_supported
+        if not idle_supported:
+            logger.info(f"   IMAP server has no IDLE, polling every {self.poll_seconds:.0f}s")
+
+        try:
+            while not self._stop.is_set():
+                self.sync(mail)
+                if idle_supported:
+                    self._idle(mail)
+                else:
+                    self._stop.wait(self.poll_seconds)
+        finally:
+            self._stats['connected'] = False
+            try:
+                mail.logout()
+            except Exception:
+                pass
+
+    def _idle(self, mail):
+        """
+        Wait in IMAP IDLE until the mailbox changes, idle_seconds pass or a stop is requested
+
+        imaplib has no IDLE support before Python 3.14, so the command is
+        driven directly on the socket.
+
+        Returns:
+            bool: True if the server reported new mail
+        """
+        tag = f'AIDLE{next(self._tags)}'.encode()
+        reader = IdleLineReader(mail.sock, self._stop)
+
+        mail.send(tag + b' IDLE\r\n')
+        line = reader.readline(IDLE_RESPONSE_TIMEOUT, interruptible=False)
+        if line is None or not line.startswith(b'+'):
+            raise ConnectionError(f"IDLE not accepted: {line!r}")
+
+        changed = False
+        deadline = time.monotonic() + self.idle_seconds
+        while not changed:
+            line = reader.readline(deadline - time.monotonic())
+            if line is None:
+                break  # Re-IDLE interval reached, or stopping
+            if line.startswith(b'* BYE'):
+                raise ConnectionError(f"IMAP server ended the session: {line!r}")
+            changed = bool(MAILBOX_CHANGED.match(line))
+
+        mail.send(b'DONE\r\n')
+        while True:
+            line = reader.readline(IDLE_RESPONSE_TIMEOUT, interruptible=False)
+            if line is None:
+                raise TimeoutError('No response to IDLE DONE')
+            if line.startswith(tag + b' '):
+                if not line[len(tag) + 1:].upper().startswith(b'OK'):
+                    raise ConnectionError(f"IDLE failed: {line!r}")
+                return changed
+            changed = changed or bool(MAILBOX_CHANGED.match(line))
@@ -0,0 +1,534 @@
+"""Background job queue for long-running audio processing"""
+
+import json
+import logging
+import os
+import re
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from logger_config import setup_logger, log_event, correlation_id, new_correlation_id
+from metrics import STAGE_SECONDS, JOBS_TOTAL
+from config import JOBS_FOLDER, JOB_WORKERS, JOB_MAX_PENDING, JOB_RETENTION_HOURS
+
+logger = setup_logger()
+
+JOB_ID_PATTERN = re.compile(r'^[0-9a-f]{32}$')
+
+# Expired jobs are looked for at most this often
+PURGE_INTERVAL_SECONDS = 3600
+
+
+class Job:
+    """
+    A single queued job whose state is persisted as JSON after every change
+
+    Every stage change is also appended to the job's event log so progress
+    can be streamed to the browser (see /api/jobs/<job_id>/events). Events
+    only carry stage names, status and scalar details; partial results are
+    kept once under 'partial' (dropped when the job completes, since the
+    result holds them) and JobQueue.stream_events attaches them to the
+    events that refer to them.
+
+    A handler can suspend the job while it waits on an external callback; the
+    job is then resumed (possibly by another gunicorn worker) through
+    JobQueue.resume with a continuation handler.
+    """
+
+    def __init__(self, data, jobs_folder):
+        self.data = data
+        self.jobs_folder = jobs_folder
+        self.suspended = False
+        self._lock = threading.Lock()
+        self._stage_started = {}
+
+    @property
+    def id(self):
+        return self.data['id']
+
+    def start_stage(self, name):
+        """Mark a pipeline stage as running"""
+        with self._lock:
+            self._stage_started[name] = time.monotonic()
+            self.data['stage'] = name
+            self.data['stages'].append({
+                'name': name,
+                'status': 'running',
+                'started_at': datetime.now().isoformat(),
+                'finished_at': None,
+                'duration_seconds': None
+            })
+            self._append_event('stage_started', name, 0.0, {})
+            self._save()
+
+    def finish_stage(self, name, status='completed', **details):
+        """
+        Mark a pipeline stage as finished and record how long it took
+
+        Args:
+            name: Stage name previously passed to start_stage
+            status: 'completed' or 'failed'
+            **details: Extra fields stored on the stage entry
+        """
+        with self._lock:
+            elapsed = self._stage_elapsed(name)
+            self._stage_started.pop(name, None)
+            for stage in reversed(self.data['stages']):
+                if stage['name'] == name and stage['status'] == 'running':
+                    stage['status'] = status
+                    stage['finished_at'] = datetime.now().isoformat()
+                    stage['duration_seconds'] = elapsed
+                    stage.update(details)
+                    break
+            self._append_event(f"stage_{status}", name, elapsed, _scalars(details))
+            self._save()
+        self._log_stage(name, status, elapsed, details)
+
+    def add_completed_stage(self, name, duration_seconds, **details):
+        """Record a stage that finished before the job was queued (e.g. the file upload)"""
+        with self._lock:
+            now = datetime.now().isoformat()
+            self.data['stages'].append({
+                'name': name,
+                'status': 'completed',
+                'started_at': now,
+                'finished_at': now,
+                'duration_seconds': round(duration_seconds, 3),
+                **details
+            })
+            self._append_event('stage_completed', name, round(duration_seconds, 3), _scalars(details))
+            self._save()
+        self._log_stage(name, 'completed', round(duration_seconds, 3), details)
+
+    def progress(self, name, **data):
+        """
+        Report intermediate progress for a running stage
+
+        Args:
+            name: Running stage name
+            **data: Progress details (e.g. transcription polling status)
+        """
+        with self._lock:
+            elapsed = self._stage_elapsed(name)
+            self._append_event('progress', name, elapsed, _scalars(data))
+            self._save()
+
+    def publish_partial(self, name, **data):
+        """
+        Publish a partial result as soon as it exists (e.g. the transcript)
+
+        Args:
+            name: Stage that produced the result
+            **data: Result fields the UI can render early
+        """
+        with self._lock:
+            elapsed = self._stage_elapsed(name)
+            self.data.setdefault('partial', {}).update(data)
+            self._append_event('partial_result', name, elapsed, {'fields': sorted(data)})
+            self._save()
+
+    def suspend(self, reason, **fields):
+        """
+        Park the job until JobQueue.resume is called for it
+
+        This must be the handler's last change to the job: once the state is
+        saved, another worker may resume it. The handler should return the
+        value of this call.
+
+        Args:
+            reason: Short description of what the job is waiting for
+            **fields: Top-level job fields the continuation needs (e.g. transcript_id)
+
+        Returns:
+            dict: Placeholder result for JobQueue._run
+        """
+        with self._lock:
+            self.suspended = True
+            self.data.update(status='waiting', waiting_for=reason, **fields)
+            self.data['suspensions'] = self.data.get('suspensions', 0) + 1
+            self._append_event('job_waiting', self.data['stage'], None, {'waiting_for': reason})
+            self._save()
+        return {'success': True, 'suspended': True}
+
+    def mark_resumed(self):
+        """Record that a suspended job is running again"""
+        with self._lock:
+            self.data.update(status='running', waiting_for=None)
+            self._append_event('job_resumed', self.data['stage'], None, {})
+            self._save()
+
+    def update(self, **fields):
+        """Update top-level job fields"""
+        with self._lock:
+            self.data.update(fields)
+            self._save()
+
+    def close(self, duration_seconds):
+        """Mark the job finished and emit the final event carrying the result"""
+        with self._lock:
+            self.data.update(
+                stage=None,
+                finished_at=datetime.now().isoformat(),
+                duration_seconds=duration_seconds
+            )
+            if self.data['status'] == 'completed':
+                # The result carries every partial result
+                self.data.pop('partial', None)
+            self._append_event(f"job_{self.data['status']}", None, duration_seconds, {})
+            self._save()
+        JOBS_TOTAL.inc(job_type=self.data['type'], outcome=self.data['status'])
+        log_event(
+            logger, f"📋 Job {self.id} {self.data['status']} in {duration_seconds or 0:.2f}s",
+            event='job', job_id=self.id, job_type=self.data['type'], outcome=self.data['status'],
+            duration_ms=round(duration_seconds * 1000) if duration_seconds is not None else None,
+            error=self.data['error']
+        )
+
+    def elapsed_seconds(self):
+        """Seconds since the job started running (survives suspension across processes)"""
+        started_at = self.data.get('started_at')
+        if not started_at:
+            return None
+        return round((datetime.now() - datetime.fromisoformat(started_at)).total_seconds(), 3)
+
+    def _log_stage(self, name, status, elapsed, details):
+        """Emit one structured record and one latency sample per finished stage"""
+        STAGE_SECONDS.observe(elapsed or 0, job_type=self.data['type'], stage=name, outcome=status)
+        log_event(
+            logger, f"⏱️ Stage {name} {status} in {elapsed or 0:.2f}s",
+            level=logging.WARNING if status == 'failed' else logging.INFO,
+            event='stage', job_id=self.id, job_type=self.data['type'], stage=name, outcome=status,
+            duration_ms=round(elapsed * 1000) if elapsed is not None else None,
+            # Scalars only: results such as transcripts stay in the job file
+            **_scalars(details)
+        )
+
+    def _stage_elapsed(self, name):
+        """Elapsed seconds of a running stage (caller holds the lock)"""
+        started = self._stage_started.get(name)
+        if started is not None:
+            return round(time.monotonic() - started, 3)
+
+        # Stage started in another process before the job was suspended
+        for stage in reversed(self.data['stages']):
+            if stage['name'] == name and stage['status'] == 'running':
+                started_at = datetime.fromisoformat(stage['started_at'])
+                return round((datetime.now() - started_at).total_seconds(), 3)
+        return None
+
+    def _append_event(self, event, stage, elapsed_seconds, data):
+        """Append to the event log (caller holds the lock)"""
+        events = self.data.setdefault('events', [])
+        events.append({
+            'id': len(events) + 1,
+            'event': event,
+            'stage': stage,
+            'elapsed_seconds': elapsed_seconds,
+            'at': datetime.now().isoformat(),
+            'data': data
+        })
+
+    def _save(self):
+        """Atomically write the job state so readers never see a partial file"""
+        path = os.path.join(self.jobs_folder, f"{self.id}.json")
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.data, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+
+class JobQueue:
+    """Run jobs on a bounded worker pool and expose their progress"""
+
+    def __init__(self, jobs_folder=JOBS_FOLDER, max_workers=JOB_WORKERS, max_pending=JOB_MAX_PENDING,
+                 retention_hours=JOB_RETENTION_HOURS):
+        self.jobs_folder = jobs_folder
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='aiscribe-job')
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self.retention_seconds = retention_hours * 3600
+        self._next_purge = 0
+        os.makedirs(self.jobs_folder, exist_ok=True)
+        self._maybe_purge()
+        logger.info(f"✓ JobQueue initialized with {max_workers} worker(s), {max_pending} pending max")
+
+    def enqueue(self, job_type, handler, params, completed_stages=None):
+        """
+        Queue a job for background execution
+
+        Args:
+            job_type: Short job type label (e.g. 'process_audio')
+            handler: Callable invoked as handler(job, **params); returns the result dict
+            params: JSON-serializable keyword arguments for the handler
+            completed_stages: Optional {stage name: duration in seconds} for work
+                done before queueing (recorded as already completed)
+
+        Returns:
+            dict: Contains success flag and the queued job data
+        """
+        if not self._slots.acquire(blocking=False):
+            logger.warning(f"⚠️ Job queue is full ({self.max_pending} pending), rejecting {job_type}")
+            return {
+                'success': False,
+                'error': 'Server is busy processing other recordings. Please try again shortly.'
+            }
+
+        job = Job({
+            'id': uuid.uuid4().hex,
+            'type': job_type,
+            'status': 'queued',
+            'stage': None,
+            'stages': [],
+            'params': params,
+            'created_at': datetime.now().isoformat(),
+            'started_at': None,
+            'finished_at': None,
+            'duration_seconds': None,
+            'result': None,
+            'error': None,
+            'events': [],
+            # The request's correlation id follows the job through workers and resumptions
+            'correlation_id': correlation_id.get() or new_correlation_id()
+        }, self.jobs_folder)
+        job.update()
+        for stage_name, duration in (completed_stages or {}).items():
+            job.add_completed_stage(stage_name, duration)
+        snapshot = dict(job.data)
+
+        try:
+            self._executor.submit(self._run, job, handler, params)
+        except Exception:
+            self._slots.release()
+            raise
+
+        logger.info(f"📋 Queued {job_type} job {job.id}")
+        return {'success': True, 'job': snapshot}
+
+    def resume(self, job_id, handler, params):
+        """
+        Continue a suspended job on this process's worker pool
+
+        Only one caller can resume a given suspension, even across gunicorn
+        workers (e.g. a webhook racing the polling fallback). Resumed jobs do
+        not take a pending slot: they were admitted when first queued.
+
+        Args:
+            job_id: Job identifier returned by enqueue
+            handler: Continuation invoked as handler(job, **params)
+            params: Keyword arguments for the continuation
+
+        Returns:
+            dict: Contains success flag, or the error and current job status
+        """
+        data = self.get_job(job_id)
+        if data is None:
+            return {'success': False, 'error': 'Job not found', 'status': None}
+
+        if data['status'] != 'waiting':
+            return {'success': False, 'error': f"Job is {data['status']}, not waiting", 'status': data['status']}
+
+        if not self._claim(job_id, data.get('suspensions', 0)):
+            return {'success': False, 'error': 'Job was already resumed', 'status': data['status']}
+
+        job = Job(data, self.jobs_folder)
+        self._executor.submit(self._run, job, handler, params, True)
+        logger.info(f"📋 Resumed {data['type']} job {job_id}")
+        return {'success': True}
+
+    def waiting_jobs(self):
+        """
+        List suspended jobs (used to re-arm fallbacks after a restart)
+
+        Returns:
+            list: Job data of every job with status 'waiting'
+        """
+        waiting = []
+        for filename in os.listdir(self.jobs_folder):
+            job_id = filename[:-len('.json')]
+            if not filename.endswith('.json') or not JOB_ID_PATTERN.match(job_id):
+                continue
+            try:
+                job = self.get_job(job_id)
+            except ValueError:
+                continue
+            if job and job['status'] == 'waiting':
+                waiting.append(job)
+        return waiting
+
+    def _claim(self, job_id, suspension):
+        """Atomically claim the right to resume one suspension of a job"""
+        path = os.path.join(self.jobs_folder, f"{job_id}.resume{suspension}")
+        try:
+            fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            return False
+        os.close(fd)
+        return True
+
+    def _run(self, job, handler, params, resumed=False):
+        """Execute a job on a worker thread and record its outcome"""
+        token = correlation_id.set(job.data.get('correlation_id') or new_correlation_id())
+        try:
+            self._execute(job, handler, params, resumed)
+        finally:
+            correlation_id.reset(token)
+
+    def _execute(self, job, handler, params, resumed):
+        """Run the handler and record the outcome (under the job's correlation id)"""
+        job.suspended = False
+        if resumed:
+            job.mark_resumed()
+        else:
+            job.update(status='running', started_at=datetime.now().isoformat())
+
+        try:
+            result = handler(job, **params)
+            if job.suspended:
+                logger.info(f"📋 Job {job.id} is waiting: {job.data['waiting_for']}")
+                return
+            if result.get('success'):
+                job.update(status='completed', result=result)
+            else:
+                job.update(status='failed', result=result, error=result.get('error', 'Job failed'))
+        except Exception as e:
+            logger.error(f"❌ Job {job.id} crashed: {str(e)}")
+            logger.exception(e)
+            job.update(status='failed', error=f'Internal server error: {str(e)}')
+        finally:
+            if not resumed:
+                self._slots.release()
+            if not job.suspended:
+                job.close(job.elapsed_seconds())
+                self._maybe_purge()
+
+    def purge_expired(self):
+        """
+        Delete finished jobs untouched for the retention period, with their resume claims
+
+        Job files are rewritten on every change, so their mtime is the time of
+        the last event. Waiting and running jobs are kept whatever their age.
+
+        Returns:
+            int: Number of files deleted
+        """
+        cutoff = time.time() - self.retention_seconds
+        removed = 0
+        for filename in os.listdir(self.jobs_folder):
+            path = os.path.join(self.jobs_folder, filename)
+            job_id = filename.split('.', 1)[0]
+            try:
+                if os.stat(path).st_mtime > cutoff:
+                    continue
+                if filename == f"{job_id}.json":
+                    try:
+                        job = self.get_job(job_id)
+                    except ValueError:
+                        job = None  # Unreadable job file
+                    if job is not None and job['status'] not in ('completed', 'failed'):
+                        continue
+                elif not (JOB_ID_PATTERN.match(job_id) and ('.resume' in filename or filename.endswith('.tmp'))):
+                    continue
+                os.remove(path)
+                removed += 1
+            except FileNotFoundError:
+                continue
+
+        if removed:
+            logger.info(f"🧹 Deleted {removed} expired job file(s)")
+        return removed
+
+    def _maybe_purge(self):
+        """Purge expired jobs at most once per PURGE_INTERVAL_SECONDS (failures are only logged)"""
+        now = time.monotonic()
+        if now < self._next_purge:
+            return
+        self._next_purge = now + PURGE_INTERVAL_SECONDS
+        try:
+            self.purge_expired()
+        except OSError as e:
+            logger.warning(f"⚠️ Could not purge expired jobs: {str(e)}")
+
+    def get_job(self, job_id):
+        """
+        Load the current state of a job
+
+        Args:
+            job_id: Job identifier returned by enqueue
+
+        Returns:
+            dict or None: Job data, or None if the job does not exist
+        """
+        if not JOB_ID_PATTERN.match(job_id or ''):
+            return None
+
+        path = os.path.join(self.jobs_folder, f"{job_id}.json")
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def stream_events(self, job_id, last_event_id=0, poll_interval=0.5, timeout=1800, keepalive=None):
+        """
+        Yield job events as they are recorded, until the job finishes
+
+        Reads the persisted job state, so it works from any gunicorn worker.
+
+        Args:
+            job_id: Job identifier returned by enqueue
+            last_event_id: Resume after this event id (from the Last-Event-ID header)
+            poll_interval: Seconds between checks for new events
+            timeout: Stop streaming after this many seconds
+            keepalive: Yield None after this many seconds without an event (None: never)
+
+        Yields:
+            dict or None: Event entries from the job's event log, or None as a keepalive
+        """
+        path = os.path.join(self.jobs_folder, f"{job_id}.json")
+        deadline = time.monotonic() + timeout
+        last_mtime = None
+        last_yield = time.monotonic()
+
+        while time.monotonic() < deadline:
+            try:
+                mtime = os.stat(path).st_mtime_ns
+            except FileNotFoundError:
+                return
+
+            if mtime != last_mtime:
+                last_mtime = mtime
+                job = self.get_job(job_id)
+                if job is None:
+                    return
+
+                for event in job.get('events', []):
+                    if event['id'] > last_event_id:
+                        last_event_id = event['id']
+                        last_yield = time.monotonic()
+                        yield _with_payload(event, job)
+
+                if job['status'] in ('completed', 'failed'):
+                    return
+
+            if keepalive is not None and time.monotonic() - last_yield >= keepalive:
+                last_yield = time.monotonic()
+                yield None
+
+            time.sleep(poll_interval)
+
+
+def _scalars(details):
+    """Keep only scalar values (payloads such as transcripts do not belong in events or log records)"""
+    return {key: value for key, value in details.items() if isinstance(value, (str, int, float, bool)) or value is None}
+
+
+def _with_payload(event, job):
+    """Attach the partial result or final outcome an event refers to (stored once on the job)"""
+    if event['event'] == 'partial_result':
+        source = job.get('partial') or job.get('result') or {}
+        return {**event, 'data': {field: source.get(field) for field in event['data'].get('fields', [])}}
+    if event['event'] in ('job_completed', 'job_failed'):
+        return {**event, 'data': {'result': job.get('result'), 'error': job.get('error')}}
+    return event
@@ -1,8 +1,100 @@
 """Logging configuration for AIscribe application"""
 
+import atexit
+import copy
+import json
 import logging
+import os
+import queue
 import sys
+import threading
+import uuid
+from contextvars import ContextVar
 from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from config import LOG_LEVEL, LOG_FILE, LOG_MAX_BYTES, LOG_BACKUP_COUNT, LOG_FORMAT
+
+try:
+    import fcntl
+except ImportError:  # Windows: single process, no cross-process rotation lock needed
+    fcntl = None
+
+# Id of the request (or job, email, sync run) being handled, attached to every record
+correlation_id = ContextVar('correlation_id', default=None)
+
+def new_correlation_id():
+    """Short random id for a new request or unit of background work"""
+    return uuid.uuid4().hex[:12]
+
+def log_event(logger, message, level=logging.INFO, **fields):
+    """
+    Log a message with structured fields
+    
+    In text mode only the message is shown; in JSON mode the fields are
+    emitted as top-level keys of the record.
+    
+    Args:
+        logger: Logger from setup_logger
+        message: Human-readable message
+        level: Logging level
+        **fields: JSON-serializable values (e.g. event, stage, duration_ms)
+    """
+    logger.log(level, message, extra={'fields': fields})
+
+class ContextFilter(logging.Filter):
+    """Stamp records with the current correlation id (runs on the logging thread, before queueing)"""
+    
+    def filter(self, record):
+        if not hasattr(record, 'correlation_id'):
+            record.correlation_id = correlation_id.get()
+        return True
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record: timestamp, level, logger, message, correlation id and fields"""
+    
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'correlation_id': getattr(record, 'correlation_id', None)
+        }
+        fields = getattr(record, 'fields', None)
+        if fields:
+            entry.update(fields)
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            # Formatted by StructuredQueueHandler before the record was queued
+            entry['exception'] = record.exc_text
+        if record.stack_info:
+            entry['stack'] = record.stack_info
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+class StructuredQueueHandler(QueueHandler):
+    """
+    Queue records with their traceback kept apart from the message
+    
+    QueueHandler.prepare folds the traceback into the message and drops
+    exc_info, so the listener's formatters could no longer tell them apart.
+    Here the message is merged with its args and the traceback is kept as
+    exc_text (exc_info itself holds the traceback object and cannot be
+    queued safely): text formatters still append it, and JsonFormatter emits
+    it as the "exception" field.
+    """
+    
+    _exception_formatter = logging.Formatter()
+    
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        if record.exc_info:
+            record.exc_text = record.exc_text or self._exception_formatter.formatException(record.exc_info)
+            record.exc_info = None
+        return record
 
 class ColoredFormatter(logging.Formatter):
     """Custom formatter with colors for different log levels"""
@@ -24,42 +116,131 @@ class ColoredFormatter(logging.Formatter):
             logging.ERROR: self.red + self.fmt + self.reset,
             logging.CRITICAL: self.bold_red + self.fmt + self.reset
         }
+        # Build each level's formatter once instead of per record
+        self.formatters = {
+            level: logging.Formatter(level_fmt, datefmt='%Y-%m-%d %H:%M:%S')
+            for level, level_fmt in self.FORMATS.items()
+        }
+        self.default_formatter = logging.Formatter(self.fmt, datefmt='%Y-%m-%d %H:%M:%S')
     
     def format(self, record):
-        log_fmt = self.FORMATS.get(record.levelno)
-        formatter = logging.Formatter(log_fmt, datefmt='%Y-%m-%d %H:%M:%S')
+        formatter = self.formatters.get(record.levelno, self.default_formatter)
         return formatter.format(record)
 
-def setup_logger(name='AIscribe'):
-    """Setup and configure logger"""
-    logger = logging.getLogger(name)
-    logger.setLevel(logging.DEBUG)
+class SharedRotatingFileHandler(RotatingFileHandler):
+    """
+    Size-based rotation that tolerates several gunicorn workers sharing one file
     
-    # Console handler with UTF-8 encoding
-    console_handler = logging.StreamHandler(sys.stdout)
-    console_handler.setLevel(logging.DEBUG)
+    Rotation happens under a lock file, and a worker whose file was already
+    rotated by another one just reopens the new file instead of rotating again.
+    """
     
-    # Set UTF-8 encoding for console output on Windows
-    if hasattr(sys.stdout, 'reconfigure'):
-        try:
-            sys.stdout.reconfigure(encoding='utf-8')
-        except:
-            pass
+    def shouldRollover(self, record):
+        if self.stream is not None and self._rotated_elsewhere():
+            self.stream.close()
+            self.stream = self._open()
+        return super().shouldRollover(record)
     
-    # Format
+    def doRollover(self):
+        if fcntl is None:
+            return super().doRollover()
+        
+        with open(f"{self.baseFilename}.lock", 'a') as lock_file:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            try:
+                if self._rotated_elsewhere():
+                    if self.stream is not None:
+                        self.stream.close()
+                    self.stream = self._open()
+                else:
+                    super().doRollover()
+            finally:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+    
+    def _rotated_elsewhere(self):
+        """Whether the path now points at a different file than the open stream"""
+        try:
+            return os.stat(self.baseFilename).st_ino != os.fstat(self.stream.fileno()).st_ino
+        except (FileNotFoundError, ValueError, AttributeError):
+            return True
+
+# One queue and listener per process: loggers only enqueue, the listener thread formats and writes
+_log_queue = queue.SimpleQueue()
+_listener = None
+_setup_lock = threading.Lock()
+_configured_loggers = set()
+
+def _build_handlers():
+    """Console and rotating file handlers used by the listener thread"""
     fmt = '%(asctime)s | %(levelname)-8s | %(message)s'
-    console_handler.setFormatter(ColoredFormatter(fmt))
     
-    # File handler with UTF-8 encoding
-    file_handler = logging.FileHandler(
-        f'aiscribe_{datetime.now().strftime("%Y%m%d")}.log',
+    # Console handler with UTF-8 encoding
+    console_handler = logging.StreamHandler(sys.stdout)
+    console_handler.setLevel(logging.DEBUG)
+    console_handler.setFormatter(JsonFormatter() if LOG_FORMAT == 'json' else ColoredFormatter(fmt))
+    
+    # File handler with UTF-8 encoding, rotated by size
+    file_handler = SharedRotatingFileHandler(
+        LOG_FILE,
+        maxBytes=LOG_MAX_BYTES,
+        backupCount=LOG_BACKUP_COUNT,
         encoding='utf-8'
     )
     file_handler.setLevel(logging.DEBUG)
-    file_handler.setFormatter(logging.Formatter(fmt, datefmt='%Y-%m-%d %H:%M:%S'))
+    if LOG_FORMAT == 'json':
+        file_handler.setFormatter(JsonFormatter())
+    else:
+        file_handler.setFormatter(logging.Formatter(fmt, datefmt='%Y-%m-%d %H:%M:%S'))
+    
+    return [console_handler, file_handler]
+
+def _start_listener():
+    """Start (or, in a forked child, restart) this process's listener thread"""
+    global _listener
+    _listener = QueueListener(_log_queue, *_build_handlers(), respect_handler_level=True)
+    _listener.start()
+
+def _stop_listener():
+    """Flush queued records at exit"""
+    if _listener is not None:
+        _listener.stop()
+
+def _restart_listener_after_fork():
+    # The parent's listener thread does not exist in the child
+    global _log_queue
+    if _listener is not None:
+        _log_queue = queue.SimpleQueue()
+        for name in _configured_loggers:
+            for handler in logging.getLogger(name).handlers:
+                if isinstance(handler, QueueHandler):
+                    handler.queue = _log_queue
+        _start_listener()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_restart_listener_after_fork)
+
+def setup_logger(name='AIscribe'):
+    """Setup and configure logger (safe to call repeatedly; handlers are only added once)"""
+    logger = logging.getLogger(name)
     
-    logger.addHandler(console_handler)
-    logger.addHandler(file_handler)
+    with _setup_lock:
+        if name in _configured_loggers:
+            return logger
+        
+        if _listener is None:
+            # Set UTF-8 encoding for console output on Windows
+            if hasattr(sys.stdout, 'reconfigure'):
+                try:
+                    sys.stdout.reconfigure(encoding='utf-8')
+                except:
+                    pass
+            _start_listener()
+            atexit.register(_stop_listener)
+        
+        logger.setLevel(LOG_LEVEL)
+        queue_handler = StructuredQueueHandler(_log_queue)
+        queue_handler.addFilter(ContextFilter())
+        logger.addHandler(queue_handler)
+        _configured_loggers.add(name)
     
     return logger
-
@@ -0,0 +1,311 @@
+# Mail sync store for AIscribe - IMAP sync positions, sent Message-IDs, patient addresses, held unrouted mail
+# and the inbox dedup index shared by all workers
+
+import json
+import os
+import sqlite3
+from contextlib import contextmanager
+from datetime import datetime
+from logger_config import setup_logger
+from config import MAIL_SYNC_DB_PATH
+
+logger = setup_logger('EmailService')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS imap_sync_state (
+    sync_key TEXT PRIMARY KEY,
+    uidvalidity INTEGER NOT NULL,
+    last_uid INTEGER NOT NULL,
+    updated_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS sent_messages (
+    message_id TEXT PRIMARY KEY,
+    patient_id TEXT NOT NULL,
+    sent_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS inbox_messages (
+    patient_id TEXT NOT NULL,
+    message_key TEXT NOT NULL,
+    filename TEXT NOT NULL,
+    synced_at TEXT NOT NULL,
+    PRIMARY KEY (patient_id, message_key)
+);
+CREATE INDEX IF NOT EXISTS idx_inbox_synced ON inbox_messages (synced_at);
+CREATE TABLE IF NOT EXISTS patient_addresses (
+    address TEXT NOT NULL,
+    patient_id TEXT NOT NULL,
+    last_sent_at TEXT NOT NULL,
+    PRIMARY KEY (address, patient_id)
+);
+CREATE TABLE IF NOT EXISTS unrouted_messages (
+    message_key TEXT PRIMARY KEY,
+    sender TEXT,
+    email_data TEXT NOT NULL,
+    held_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS migrations (
+    name TEXT PRIMARY KEY,
+    applied_at TEXT NOT NULL
+);
+"""
+
+
+class MailSyncStore:
+    """Persist where each inbox sync left off so refreshes only download new mail"""
+
+    def __init__(self, db_path=MAIL_SYNC_DB_PATH):
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        """Open a transaction on a fresh connection (safe across threads and gunicorn workers)"""
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        try:
+            conn.execute('PRAGMA journal_mode=WAL')
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def get_sync_state(self, sync_key):
+        """
+        Last synced position for a mailbox query
+
+        Args:
+            sync_key: Mailbox plus search criteria identifier
+
+        Returns:
+            dict or None: {'uidvalidity': int, 'last_uid': int, 'updated_at': str}
+        """
+        with self._connect() as conn:
+            row = conn.execute(
+                'SELECT uidvalidity, last_uid, updated_at FROM imap_sync_state WHERE sync_key = ?',
+                (sync_key,)
+            ).fetchone()
+        return dict(row) if row else None
+
+    def save_sync_state(self, sync_key, uidvalidity, last_uid):
+        """
+        Record the highest UID synced (never moves backwards within one UIDVALIDITY)
+
+        Args:
+            sync_key: Mailbox plus search criteria identifier
+            uidvalidity: Mailbox UIDVALIDITY the UIDs belong to
+            last_uid: Highest UID that has been downloaded
+        """
+        with self._connect() as conn:
+            conn.execute(
+                """INSERT INTO imap_sync_state (sync_key, uidvalidity, last_uid, updated_at)
+                   VALUES (?, ?, ?, ?)
+                   ON CONFLICT(sync_key) DO UPDATE SET
+                       last_uid = CASE WHEN uidvalidity = excluded.uidvalidity
+                                       THEN MAX(last_uid, excluded.last_uid)
+                                       ELSE excluded.last_uid END,
+                       uidvalidity = excluded.uidvalidity,
+                       updated_at = excluded.updated_at""",
+                (sync_key, uidvalidity, last_uid, datetime.now().isoformat())
+            )
+
+    def record_sent_message(self, message_id, patient_id):
+        """
+        Remember which patient an outgoing email belongs to, for routing replies
+
+        Args:
+            message_id: Message-ID header of the sent email
+            patient_id: Patient identifier
+        """
+        with self._connect() as conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO sent_messages (message_id, patient_id, sent_at) VALUES (?, ?, ?)',
+                (message_id.strip(), patient_id, datetime.now().isoformat())
+            )
+
+    def find_patient_for_reply(self, message_ids):
+        """
+        Patient whose sent email is referenced by a reply
+
+        Args:
+            message_ids: Message-IDs from the reply's In-Reply-To / References headers
+
+        Returns:
+            str or None: Patient identifier of the first known Message-ID
+        """
+        message_ids = [message_id.strip() for message_id in message_ids if message_id.strip()]
+        if not message_ids:
+            return None
+
+        with self._connect() as conn:
+            for message_id in message_ids:
+                row = conn.execute(
+                    'SELECT patient_id FROM sent_messages WHERE message_id = ?', (message_id,)
+                ).fetchone()
+                if row:
+                    return row['patient_id']
+        return None
+
+    def record_patient_address(self, address, patient_id, sent_at=None):
+        """
+        Remember that a patient was emailed at an address, for routing mail from it
+
+        Args:
+            address: Recipient email address
+            patient_id: Patient identifier
+            sent_at: ISO timestamp of the email (now if omitted)
+        """
+        address = (address or '').strip().lower()
+        if '@' not in address:
+            return
+
+        with self._connect() as conn:
+            conn.execute(
+                """INSERT INTO patient_addresses (address, patient_id, last_sent_at) VALUES (?, ?, ?)
+                   ON CONFLICT(address, patient_id) DO UPDATE SET
+                       last_sent_at = MAX(last_sent_at, excluded.last_sent_at)""",
+                (address, patient_id, sent_at or datetime.now().isoformat())
+            )
+
+    def find_patient_by_address(self, address):
+        """
+        Patient emailed at an address (the most recently emailed one if several share it)
+
+        Args:
+            address: Sender email address
+
+        Returns:
+            str or None: Patient identifier
+        """
+        address = (address or '').strip().lower()
+        if '@' not in address:
+            return None
+
+        with self._connect() as conn:
+            row = conn.execute(
+                'SELECT patient_id FROM patient_addresses WHERE address = ? ORDER BY last_sent_at DESC LIMIT 1',
+                (address,)
+            ).fetchone()
+        return row['patient_id'] if row else None
+
+    def hold_unrouted_message(self, message_key, sender, email_data):
+        """
+        Keep an inbound email no patient could be found for, so it can be filed later
+
+        Args:
+            message_key: Stable digest identifying the email
+            sender: Sender address
+            email_data: Email dictionary from EmailService
+        """
+        with self._connect() as conn:
+            conn.execute(
+                'INSERT OR IGNORE INTO unrouted_messages (message_key, sender, email_data, held_at) VALUES (?, ?, ?, ?)',
+                (message_key, sender, json.dumps(email_data, ensure_ascii=False), datetime.now().isoformat())
+            )
+
+    def list_unrouted_messages(self):
+        """
+        Held inbound emails, oldest first
+
+        Returns:
+            list: (message_key, email dictionary) tuples
+        """
+        with self._connect() as conn:
+            rows = conn.execute('SELECT message_key, email_data FROM unrouted_messages ORDER BY held_at').fetchall()
+        return [(row['message_key'], json.loads(row['email_data'])) for row in rows]
+
+    def release_unrouted_message(self, message_key):
+        """Forget a held email (it was filed)"""
+        with self._connect() as conn:
+            conn.execute('DELETE FROM unrouted_messages WHERE message_key = ?', (message_key,))
+
+    def prune_unrouted_messages(self, held_before):
+        """
+        Give up on held emails older than a cutoff
+
+        Returns:
+            int: Number of emails dropped
+        """
+        with self._connect() as conn:
+            return conn.execute('DELETE FROM unrouted_messages WHERE held_at < ?', (held_before,)).rowcount
+
+    def claim_inbox_message(self, patient_id, message_key, filename, synced_at=None):
+        """
+        Register an inbound email in the dedup index
+
+        The primary key makes this an atomic check-and-insert, so two workers
+        filing the same email cannot both win.
+
+        Args:
+            patient_id: Patient identifier
+            message_key: Stable digest identifying the email
+            filename: File the email is stored in
+            synced_at: ISO timestamp it was filed (now if omitted)
+
+        Returns:
+            bool: True if the email was not indexed yet
+        """
+        with self._connect() as conn:
+            return conn.execute(
+                """INSERT OR IGNORE INTO inbox_messages (patient_id, message_key, filename, synced_at)
+                   VALUES (?, ?, ?, ?)""",
+                (patient_id, message_key, filename, synced_at or datetime.now().isoformat())
+            ).rowcount == 1
+
+    def release_inbox_message(self, patient_id, message_key):
+        """Drop an index entry whose file could not be written"""
+        with self._connect() as conn:
+            conn.execute(
+                'DELETE FROM inbox_messages WHERE patient_id = ? AND message_key = ?',
+                (patient_id, message_key)
+            )
+
+    def get_inbox_filename(self, patient_id, message_key):
+        """File an indexed email is stored in, or None if it is not indexed"""
+        with self._connect() as conn:
+            row = conn.execute(
+                'SELECT filename FROM inbox_messages WHERE patient_id = ? AND message_key = ?',
+                (patient_id, message_key)
+            ).fetchone()
+        return row['filename'] if row else None
+
+    def count_inbox_messages(self, patient_id=None, since=None):
+        """
+        Count filed inbox emails
+
+        Args:
+            patient_id: Only this patient (all patients if None)
+            since: ISO timestamp; emails filed after it are counted as new
+
+        Returns:
+            dict: total and new email counts, plus how many patients have new mail
+        """
+        where = 'WHERE patient_id = ?' if patient_id is not None else ''
+        params = (patient_id,) if patient_id is not None else ()
+
+        with self._connect() as conn:
+            total = conn.execute(f'SELECT COUNT(*) FROM inbox_messages {where}', params).fetchone()[0]
+            if not since:
+                return {'total': total, 'new': 0, 'patients_updated': 0}
+
+            new_where = f"{where} {'AND' if where else 'WHERE'} synced_at > ?"
+            row = conn.execute(
+                f'SELECT COUNT(*), COUNT(DISTINCT patient_id) FROM inbox_messages {new_where}',
+                params + (since,)
+            ).fetchone()
+
+        return {'total': total, 'new': row[0], 'patients_updated': row[1]}
+
+    def claim_migration(self, name):
+        """
+        Mark a one-time migration as taken
+
+        Returns:
+            bool: True for the single caller (across workers) that should run it
+        """
+        with self._connect() as conn:
+            return conn.execute(
+                'INSERT OR IGNORE INTO migrations (name, applied_at) VALUES (?, ?)',
+                (name, datetime.now().isoformat())
+            ).rowcount == 1
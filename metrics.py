@@ -0,0 +1,328 @@
+"""In-process counters and latency histograms exposed in the Prometheus text format"""
+
+import glob
+import json
+import os
+import threading
+import time
+import weakref
+from bisect import bisect_left
+from contextlib import contextmanager
+from logger_config import setup_logger
+from config import METRICS_DIR, METRICS_FLUSH_SECONDS
+
+logger = setup_logger()
+
+# Upper bounds (seconds) for latency histograms: from local file I/O up to long transcriptions
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+
+class MetricsRegistry:
+    """
+    Hold every metric and the samples recorded in this process
+
+    Recording is lock-free: each thread writes to its own shard (a dict of
+    label values -> number list), so request, job and email threads never
+    contend. A scrape sums the shards; shards of finished threads are folded
+    into a retired total so short-lived threads do not accumulate.
+
+    Each gunicorn worker also writes its totals to METRICS_DIR every
+    METRICS_FLUSH_SECONDS, and a scrape adds up the files of the other live
+    workers, so /api/metrics reports the whole deployment whichever worker
+    answers.
+    """
+
+    def __init__(self, metrics_dir=METRICS_DIR, flush_seconds=METRICS_FLUSH_SECONDS):
+        self.metrics_dir = metrics_dir
+        self.flush_seconds = flush_seconds
+        self.metrics = {}
+        self._local = threading.local()
+        self._shards = []
+        self._retired = {}
+        self._lock = threading.Lock()
+        self._exporter = None
+
+    def counter(self, name, help_text, labelnames=()):
+        """Register a monotonically increasing counter"""
+        return self._register(Counter(self, name, help_text, labelnames))
+
+    def histogram(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        """Register a histogram of observed values (e.g. durations in seconds)"""
+        return self._register(Histogram(self, name, help_text, labelnames, buckets))
+
+    def _register(self, metric):
+        self.metrics[metric.name] = metric
+        return metric
+
+    def cell(self, metric, labels):
+        """Number list for a label set in the calling thread's shard"""
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = self._local.shard = {}
+            with self._lock:
+                self._shards.append((weakref.ref(threading.current_thread()), shard))
+
+        key = (metric.name, tuple(str(labels.get(name, '')) for name in metric.labelnames))
+        values = shard.get(key)
+        if values is None:
+            values = shard[key] = [0] * metric.cell_size
+        return values
+
+    def snapshot(self):
+        """
+        Totals recorded by this process
+
+        Returns:
+            dict: (metric name, label values) -> summed number list
+        """
+        totals = {}
+        with self._lock:
+            live = []
+            for thread_ref, shard in self._shards:
+                thread = thread_ref()
+                if thread is None or not thread.is_alive():
+                    # The thread can no longer write: fold its numbers in for good
+                    _merge(self._retired, list(shard.items()))
+                else:
+                    live.append((thread_ref, shard))
+            self._shards = live
+            _merge(totals, list(self._retired.items()))
+            shards = [shard for _, shard in live]
+
+        # Copying a dict or list is atomic under the GIL, so writers need no lock
+        for shard in shards:
+            _merge(totals, list(shard.items()))
+        return totals
+
+    def reset(self):
+        """Forget everything recorded (a forked worker must not report its parent's samples)"""
+        self._local = threading.local()
+        self._shards = []
+        self._retired = {}
+        self._lock = threading.Lock()
+        self._exporter = None
+
+    def start_exporter(self):
+        """Start this process's thread that publishes its totals for the other workers"""
+        if self._exporter is not None and self._exporter.is_alive():
+            return
+        os.makedirs(self.metrics_dir, exist_ok=True)
+        self._exporter = threading.Thread(target=self._export_loop, name='aiscribe-metrics-exporter', daemon=True)
+        self._exporter.start()
+
+    def _export_loop(self):
+        while True:
+            try:
+                self.write_process_file()
+            except Exception as e:
+                logger.warning(f"⚠️ Could not write metrics file: {str(e)}")
+            time.sleep(self.flush_seconds)
+
+    def write_process_file(self):
+        """Atomically write this process's totals to <metrics_dir>/<pid>.json"""
+        path = os.path.join(self.metrics_dir, f"{os.getpid()}.json")
+        tmp_path = f"{path}.tmp"
+        entries = [[name, list(labels), values] for (name, labels), values in self.snapshot().items()]
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(entries, f)
+        os.replace(tmp_path, path)
+
+    def collect(self):
+        """Totals of this process plus the last published totals of the other live workers"""
+        totals = self.snapshot()
+        if not os.path.isdir(self.metrics_dir):
+            return totals
+
+        own_pid = os.getpid()
+        for path in glob.glob(os.path.join(self.metrics_dir, '*.json')):
+            try:
+                pid = int(os.path.basename(path)[:-len('.json')])
+            except ValueError:
+                continue
+            if pid == own_pid:
+                continue
+            if not _pid_alive(pid):
+                # A restarted worker's counters start over, which Prometheus treats as a reset
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+                continue
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    entries = json.load(f)
+            except (OSError, ValueError):
+                continue
+            _merge(totals, [((name, tuple(labels)), values) for name, labels, values in entries])
+        return totals
+
+    def render(self):
+        """
+        All metrics in the Prometheus text exposition format
+
+        Returns:
+            str: Exposition text (version 0.0.4)
+        """
+        totals = self.collect()
+        by_metric = {}
+        for (name, labels), values in totals.items():
+            by_metric.setdefault(name, []).append((labels, values))
+
+        lines = []
+        for name, metric in self.metrics.items():
+            lines.append(f"# HELP {name} {metric.help_text}")
+            lines.append(f"# TYPE {name} {metric.kind}")
+            for labels, values in sorted(by_metric.get(name, [])):
+                lines.extend(metric.render(labels, values))
+        return '\n'.join(lines) + '\n'
+
+
+class Counter:
+    """Counter with optional labels; inc() touches only the calling thread's shard"""
+
+    kind = 'counter'
+
+    def __init__(self, registry, name, help_text, labelnames):
+        self.registry = registry
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self.cell_size = 1
+
+    def inc(self, amount=1, **labels):
+        self.registry.cell(self, labels)[0] += amount
+
+    def render(self, labels, values):
+        return [f"{self.name}{_format_labels(self.labelnames, labels)} {_format_number(values[0])}"]
+
+
+class Histogram:
+    """
+    Histogram with optional labels
+
+    Per label set the cell holds one count per bucket (non-cumulative, the
+    last one is +Inf), then the sum and the count of observations.
+    """
+
+    kind = 'histogram'
+
+    def __init__(self, registry, name, help_text, labelnames, buckets):
+        self.registry = registry
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self.cell_size = len(self.buckets) + 3
+
+    def observe(self, value, **labels):
+        values = self.registry.cell(self, labels)
+        values[bisect_left(self.buckets, value)] += 1
+        values[-2] += value
+        values[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """
+        Observe the duration of a block, adding outcome="error" if it raises
+
+        The histogram must have an "outcome" label for the error case to be
+        distinguishable; other labels are passed through.
+        """
+        started = time.perf_counter()
+        outcome = 'success'
+        try:
+            yield
+        except Exception:
+            outcome = 'error'
+            raise
+        finally:
+            if 'outcome' in self.labelnames:
+                labels.setdefault('outcome', outcome)
+            self.observe(time.perf_counter() - started, **labels)
+
+    def render(self, labels, values):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float('inf'),), values):
+            cumulative += count
+            le = '+Inf' if bound == float('inf') else _format_number(bound)
+            lines.append(f"{self.name}_bucket{_format_labels(self.labelnames + ('le',), labels + (le,))} {cumulative}")
+        label_text = _format_labels(self.labelnames, labels)
+        lines.append(f"{self.name}_sum{label_text} {_format_number(values[-2])}")
+        lines.append(f"{self.name}_count{label_text} {values[-1]}")
+        return lines
+
+
+def _merge(totals, items):
+    """Add (key, number list) items into totals"""
+    for key, values in items:
+        existing = totals.get(key)
+        if existing is None:
+            totals[key] = list(values)
+        else:
+            for index, value in enumerate(values):
+                existing[index] += value
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        return True  # Exists but belongs to another user
+    return True
+
+
+def _format_labels(names, values):
+    if not names:
+        return ''
+    pairs = ','.join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+    return '{' + pairs + '}'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_number(value):
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+registry = MetricsRegistry()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=registry.reset)
+
+# Pipeline stages (process_audio jobs and the other job types)
+STAGE_SECONDS = registry.histogram(
+    'aiscribe_stage_duration_seconds', 'Duration of job pipeline stages', ('job_type', 'stage', 'outcome'))
+JOBS_TOTAL = registry.counter(
+    'aiscribe_jobs_total', 'Finished background jobs', ('job_type', 'outcome'))
+
+# OpenRouter calls
+LLM_ATTEMPT_SECONDS = registry.histogram(
+    'aiscribe_llm_attempt_duration_seconds', 'Duration of OpenRouter completion attempts', ('model', 'key', 'outcome'))
+LLM_ATTEMPTS_TOTAL = registry.counter(
+    'aiscribe_llm_attempts_total', 'OpenRouter attempts, including cache hits and circuit-open skips',
+    ('model', 'key', 'outcome'))
+LLM_FALLBACKS_TOTAL = registry.counter(
+    'aiscribe_llm_fallbacks_total', 'Attempts launched after the first one (hedges and failovers), by prompt template',
+    ('summary_type', 'reason'))
+
+# AssemblyAI polling
+TRANSCRIPT_POLL_SECONDS = registry.histogram(
+    'aiscribe_transcript_poll_duration_seconds', 'Duration of AssemblyAI transcript status checks', ('outcome',))
+TRANSCRIPT_POLLS_PER_TRANSCRIPT = registry.histogram(
+    'aiscribe_transcript_polls_per_transcript', 'Status checks needed per finished transcript', ('status',),
+    buckets=(1, 2, 3, 5, 8, 13, 21, 34, 55))
+
+# Email
+EMAIL_SECONDS = registry.histogram(
+    'aiscribe_email_operation_duration_seconds', 'Duration of SMTP sends and IMAP operations', ('operation', 'outcome'))
+
+# File I/O in the recording endpoints and pipeline
+FILE_IO_SECONDS = registry.histogram(
+    'aiscribe_file_io_duration_seconds', 'Duration of recording file reads, writes and deletes', ('operation', 'outcome'))
@@ -0,0 +1,173 @@
+"""Health tracking and circuit breaking for OpenRouter model endpoints"""
+
+import threading
+import time
+from collections import deque
+from logger_config import setup_logger
+from config import (
+    MODEL_CIRCUIT_FAILURE_THRESHOLD, MODEL_CIRCUIT_COOLDOWN_SECONDS,
+    MODEL_CIRCUIT_MAX_COOLDOWN_SECONDS, MODEL_LATENCY_WINDOW
+)
+
+logger = setup_logger()
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+# A half-open probe that never reports back (e.g. a cancelled hedge) stops blocking after this long
+PROBE_TIMEOUT_SECONDS = 120
+
+
+class EndpointHealth:
+    """Circuit state and latency samples for one (model, API key) pair"""
+
+    def __init__(self, model, api_key_type, latency_window):
+        self.model = model
+        self.api_key_type = api_key_type
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.total_successes = 0
+        self.total_failures = 0
+        self.latencies = deque(maxlen=latency_window)
+        self.opened_at = None
+        self.cooldown = None
+        self.probe_started_at = None
+        self.last_error = None
+        self.last_success_at = None
+
+    def to_dict(self, now):
+        latencies = sorted(self.latencies)
+        retry_in = None
+        if self.state == OPEN:
+            retry_in = round(max(0.0, self.opened_at + self.cooldown - now), 1)
+        return {
+            'model': self.model,
+            'api_key_type': self.api_key_type,
+            'state': self.state,
+            'consecutive_failures': self.consecutive_failures,
+            'total_successes': self.total_successes,
+            'total_failures': self.total_failures,
+            'latency_avg_seconds': round(sum(latencies) / len(latencies), 3) if latencies else None,
+            'latency_p95_seconds': round(latencies[int(0.95 * (len(latencies) - 1))], 3) if latencies else None,
+            'retry_in_seconds': retry_in,
+            'last_error': self.last_error
+        }
+
+
+class ModelHealthRegistry:
+    """
+    Circuit breaker per (model, API key) pair
+
+    After MODEL_CIRCUIT_FAILURE_THRESHOLD consecutive failures the circuit
+    opens and the endpoint is skipped. Once the cooldown passes, a single
+    half-open probe is let through: success closes the circuit, failure
+    reopens it with a doubled cooldown (up to MODEL_CIRCUIT_MAX_COOLDOWN_SECONDS).
+
+    State is kept per process; each gunicorn worker learns independently.
+    """
+
+    def __init__(self, failure_threshold=MODEL_CIRCUIT_FAILURE_THRESHOLD, cooldown=MODEL_CIRCUIT_COOLDOWN_SECONDS,
+                 max_cooldown=MODEL_CIRCUIT_MAX_COOLDOWN_SECONDS, latency_window=MODEL_LATENCY_WINDOW):
+        self.failure_threshold = failure_threshold
+        self.base_cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.latency_window = latency_window
+        self._endpoints = {}
+        self._lock = threading.Lock()
+
+    def is_available(self, model, api_key_type):
+        """
+        Whether a call to the endpoint would currently be let through (does not claim a probe)
+
+        Returns:
+            bool: True if the circuit is closed or a probe is due
+        """
+        with self._lock:
+            return self._available(self._get(model, api_key_type), time.monotonic())
+
+    def allow(self, model, api_key_type):
+        """
+        Decide whether to call the endpoint now, claiming the half-open probe if one is due
+
+        Returns:
+            bool: True if the caller should make the request
+        """
+        now = time.monotonic()
+        with self._lock:
+            endpoint = self._get(model, api_key_type)
+            if not self._available(endpoint, now):
+                return False
+
+            if endpoint.state != CLOSED:
+                endpoint.state = HALF_OPEN
+                endpoint.probe_started_at = now
+                logger.info(f"🩺 Probing {model} ({api_key_type}) after circuit cooldown")
+            return True
+
+    def record_success(self, model, api_key_type, latency):
+        """Record a successful call and close the circuit"""
+        with self._lock:
+            endpoint = self._get(model, api_key_type)
+            if endpoint.state != CLOSED:
+                logger.info(f"✅ Circuit closed for {model} ({api_key_type})")
+            endpoint.state = CLOSED
+            endpoint.consecutive_failures = 0
+            endpoint.total_successes += 1
+            endpoint.latencies.append(latency)
+            endpoint.cooldown = None
+            endpoint.probe_started_at = None
+            endpoint.last_success_at = time.time()
+
+    def record_failure(self, model, api_key_type, latency, error):
+        """Record a failed call, opening the circuit when the threshold is reached"""
+        now = time.monotonic()
+        with self._lock:
+            endpoint = self._get(model, api_key_type)
+            endpoint.consecutive_failures += 1
+            endpoint.total_failures += 1
+            endpoint.latencies.append(latency)
+            endpoint.last_error = error[:300]
+
+            if endpoint.state == HALF_OPEN:
+                # Failed probe: back off further before the next one
+                endpoint.cooldown = min((endpoint.cooldown or self.base_cooldown) * 2, self.max_cooldown)
+            elif endpoint.consecutive_failures >= self.failure_threshold:
+                endpoint.cooldown = self.base_cooldown
+            else:
+                return
+
+            endpoint.state = OPEN
+            endpoint.opened_at = now
+            endpoint.probe_started_at = None
+            logger.warning(
+                f"⛔ Circuit open for {model} ({api_key_type}) after {endpoint.consecutive_failures} "
+                f"consecutive failure(s), retrying in {endpoint.cooldown:.0f}s"
+            )
+
+    def status(self):
+        """
+        Snapshot of every tracked endpoint
+
+        Returns:
+            list: One dict per (model, API key) pair
+        """
+        now = time.monotonic()
+        with self._lock:
+            return [endpoint.to_dict(now) for endpoint in self._endpoints.values()]
+
+    def _get(self, model, api_key_type):
+        """Endpoint state, created on first use (caller holds the lock)"""
+        key = (model, api_key_type)
+        if key not in self._endpoints:
+            self._endpoints[key] = EndpointHealth(model, api_key_type, self.latency_window)
+        return self._endpoints[key]
+
+    def _available(self, endpoint, now):
+        """Circuit check without side effects (caller holds the lock)"""
+        if endpoint.state == CLOSED:
+            return True
+        if endpoint.state == OPEN:
+            return now - endpoint.opened_at >= endpoint.cooldown
+        # Half-open: only one probe at a time
+        return now - endpoint.probe_started_at >= PROBE_TIMEOUT_SECONDS
@@ -0,0 +1,293 @@
+"""SQLite catalog of processed recordings for fast dashboard listing"""
+
+import argparse
+import base64
+import json
+import os
+import sqlite3
+from contextlib import contextmanager
+from logger_config import setup_logger
+from config import CATALOG_DB_PATH, UPLOAD_FOLDER
+
+logger = setup_logger()
+
+RESULTS_SUFFIX = '_results.json'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS recordings (
+    id TEXT PRIMARY KEY,
+    patient_id TEXT NOT NULL,
+    timestamp TEXT NOT NULL,
+    title TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    recording_type TEXT,
+    duration REAL
+);
+CREATE INDEX IF NOT EXISTS idx_recordings_created_at ON recordings (created_at DESC);
+CREATE INDEX IF NOT EXISTS idx_recordings_patient ON recordings (patient_id, created_at DESC);
+CREATE TABLE IF NOT EXISTS catalog_meta (
+    key TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO catalog_meta (key, value) VALUES ('version', 0);
+"""
+
+# Patient listing orders: (ORDER BY clause, cursor comparison)
+PATIENT_SORTS = {
+    'newest': ('latest_created_at DESC, patient_id DESC', '(latest_created_at, patient_id) < (?, ?)'),
+    'oldest': ('latest_created_at ASC, patient_id ASC', '(latest_created_at, patient_id) > (?, ?)'),
+    'name': ('patient_id ASC', 'patient_id > ?')
+}
+
+
+class RecordingCatalog:
+    """Keep a small index row per recording so listings never open results files"""
+
+    def __init__(self, db_path=CATALOG_DB_PATH, upload_folder=UPLOAD_FOLDER, auto_rebuild=True):
+        self.db_path = db_path
+        self.upload_folder = upload_folder
+        is_new = not os.path.exists(db_path)
+
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+
+        logger.info(f"✓ RecordingCatalog initialized at {db_path}")
+
+        # First start against an existing uploads tree: index what is already there
+        if auto_rebuild and is_new and os.path.isdir(upload_folder):
+            self.rebuild()
+
+    @contextmanager
+    def _connect(self):
+        """Open a transaction on a fresh connection (safe across threads and gunicorn workers)"""
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        try:
+            conn.execute('PRAGMA journal_mode=WAL')
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def upsert_recording(self, patient_id, timestamp, results):
+        """
+        Add or replace the catalog entry for a recording
+
+        Args:
+            patient_id: Patient folder name
+            timestamp: Recording timestamp prefix (YYYYMMDD_HHMMSS)
+            results: The results dict saved to <timestamp>_results.json
+        """
+        row = self._build_row(patient_id, timestamp, results)
+        with self._connect() as conn:
+            conn.execute(
+                """INSERT OR REPLACE INTO recordings
+                   (id, patient_id, timestamp, title, created_at, recording_type, duration)
+                   VALUES (:id, :patient_id, :timestamp, :title, :created_at, :recording_type, :duration)""",
+                row
+            )
+            self._bump_version(conn)
+
+    def delete_recording(self, patient_id, timestamp):
+        """Remove a recording from the catalog"""
+        with self._connect() as conn:
+            conn.execute('DELETE FROM recordings WHERE id = ?', (f"{patient_id}/{timestamp}",))
+            self._bump_version(conn)
+
+    def list_recordings(self):
+        """
+        List all recordings, newest first
+
+        Returns:
+            list: Catalog rows as dicts
+        """
+        with self._connect() as conn:
+            rows = conn.execute(
+                'SELECT * FROM recordings ORDER BY created_at DESC'
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def list_patients(self, limit=20, cursor=None, sort='newest', search=None):
+        """
+        List patients with their recording counts, one page at a time
+
+        Args:
+            limit: Maximum number of patients to return
+            cursor: Opaque cursor from a previous page (None for the first page)
+            sort: 'newest' / 'oldest' (by latest visit) or 'name'
+            search: Optional case-insensitive substring of the patient id
+
+        Returns:
+            tuple: (list of patient dicts, next cursor or None)
+        """
+        order_by, cursor_clause = PATIENT_SORTS[sort]
+        where_sql = ''
+        having_sql = ''
+        params = []
+
+        if search:
+            escaped = search.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+            where_sql = "WHERE patient_id LIKE ? ESCAPE '\\'"
+            params.append(f"%{escaped}%")
+
+        if cursor:
+            having_sql = f"HAVING {cursor_clause}"
+            position = self._decode_cursor(cursor)
+            params.extend(position[-1:] if sort == 'name' else position)
+
+        with self._connect() as conn:
+            rows = conn.execute(
+                f"""SELECT patient_id, COUNT(*) AS recording_count, MAX(created_at) AS latest_created_at
+                    FROM recordings {where_sql}
+                    GROUP BY patient_id {having_sql}
+                    ORDER BY {order_by} LIMIT ?""",
+                params + [limit + 1]
+            ).fetchall()
+
+        patients = [dict(row) for row in rows[:limit]]
+        next_cursor = None
+        if len(rows) > limit:
+            last = patients[-1]
+            next_cursor = self._encode_cursor([last['latest_created_at'], last['patient_id']])
+
+        return patients, next_cursor
+
+    def list_patient_recordings(self, patient_id, limit=20, cursor=None):
+        """
+        List one patient's recordings, newest first, one page at a time
+
+        Args:
+            patient_id: Patient folder name
+            limit: Maximum number of recordings to return
+            cursor: Opaque cursor from a previous page (None for the first page)
+
+        Returns:
+            tuple: (list of catalog rows, next cursor or None)
+        """
+        cursor_sql = ''
+        params = [patient_id]
+
+        if cursor:
+            cursor_sql = 'AND (created_at, id) < (?, ?)'
+            params.extend(self._decode_cursor(cursor))
+
+        with self._connect() as conn:
+            rows = conn.execute(
+                f"""SELECT * FROM recordings
+                    WHERE patient_id = ? {cursor_sql}
+                    ORDER BY created_at DESC, id DESC LIMIT ?""",
+                params + [limit + 1]
+            ).fetchall()
+
+        recordings = [dict(row) for row in rows[:limit]]
+        next_cursor = None
+        if len(rows) > limit:
+            last = recordings[-1]
+            next_cursor = self._encode_cursor([last['created_at'], last['id']])
+
+        return recordings, next_cursor
+
+    def get_version(self):
+        """
+        Version number bumped on every catalog write (used for ETags)
+
+        Returns:
+            int: Current catalog version
+        """
+        with self._connect() as conn:
+            row = conn.execute("SELECT value FROM catalog_meta WHERE key = 'version'").fetchone()
+        return row['value'] if row else 0
+
+    def rebuild(self):
+        """
+        Reindex every *_results.json file under the upload folder
+
+        Returns:
+            int: Number of recordings indexed
+        """
+        logger.info(f"🔄 Rebuilding recording catalog from {self.upload_folder}")
+        rows = []
+
+        for patient_id in os.listdir(self.upload_folder):
+            patient_path = os.path.join(self.upload_folder, patient_id)
+
+            # Skip files and internal folders such as .jobs
+            if not os.path.isdir(patient_path) or patient_id.startswith('.'):
+                continue
+
+            for filename in os.listdir(patient_path):
+                if not filename.endswith(RESULTS_SUFFIX):
+                    continue
+
+                results_file = os.path.join(patient_path, filename)
+                try:
+                    with open(results_file, 'r', encoding='utf-8') as f:
+                        results = json.load(f)
+                    timestamp = filename[:-len(RESULTS_SUFFIX)]
+                    rows.append(self._build_row(patient_id, timestamp, results))
+                except Exception as e:
+                    logger.warning(f"Error indexing recording {results_file}: {str(e)}")
+                    continue
+
+        with self._connect() as conn:
+            conn.execute('DELETE FROM recordings')
+            conn.executemany(
+                """INSERT OR REPLACE INTO recordings
+                   (id, patient_id, timestamp, title, created_at, recording_type, duration)
+                   VALUES (:id, :patient_id, :timestamp, :title, :created_at, :recording_type, :duration)""",
+                rows
+            )
+            self._bump_version(conn)
+
+        logger.info(f"✓ Recording catalog rebuilt with {len(rows)} recording(s)")
+        return len(rows)
+
+    def _bump_version(self, conn):
+        """Record that the catalog changed (runs inside the writer's transaction)"""
+        conn.execute("UPDATE catalog_meta SET value = value + 1 WHERE key = 'version'")
+
+    def _encode_cursor(self, position):
+        """Encode a page position as an opaque URL-safe cursor"""
+        return base64.urlsafe_b64encode(json.dumps(position).encode('utf-8')).decode('ascii')
+
+    def _decode_cursor(self, cursor):
+        """Decode a cursor produced by _encode_cursor"""
+        try:
+            position = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        except Exception:
+            raise ValueError('Invalid cursor')
+        if not isinstance(position, list) or len(position) != 2:
+            raise ValueError('Invalid cursor')
+        return position
+
+    def _build_row(self, patient_id, timestamp, results):
+        """Extract the listing fields from a results dict"""
+        transcription = results.get('transcription') or {}
+        return {
+            'id': f"{patient_id}/{timestamp}",
+            'patient_id': patient_id,
+            'timestamp': timestamp,
+            'title': results.get('filename', patient_id).split('.')[0],
+            'created_at': results.get('timestamp', ''),
+            'recording_type': results.get('recording_type'),
+            'duration': transcription.get('duration')
+        }
+
+
+def main():
+    """Command line entry point: python recording_catalog.py rebuild"""
+    parser = argparse.ArgumentParser(description='Manage the AIscribe recording catalog')
+    parser.add_argument('command', choices=['rebuild'], help='rebuild: reindex an existing uploads tree')
+    parser.add_argument('--upload-folder', default=UPLOAD_FOLDER, help='Uploads tree to index')
+    parser.add_argument('--db', default=CATALOG_DB_PATH, help='Catalog database path')
+    args = parser.parse_args()
+
+    catalog = RecordingCatalog(db_path=args.db, upload_folder=args.upload_folder, auto_rebuild=False)
+    if args.command == 'rebuild':
+        count = catalog.rebuild()
+        print(f"Indexed {count} recording(s) into {args.db}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,155 @@
+"""Lazy per-process service providers and startup timing for AIscribe"""
+
+import os
+import sys
+import threading
+import time
+from importlib.abc import MetaPathFinder
+
+
+class StartupReport:
+    """
+    Record what a process spends booting
+
+    Import times are inclusive (a module's time includes the modules it
+    imports) and only top-level modules are listed, like python -X importtime
+    summarized. Service times are the constructor cost of each LazyService.
+    """
+
+    def __init__(self):
+        self.pid = os.getpid()
+        self.imports = {}
+        self.services = {}
+        self.app_import_seconds = None
+        self._import_started = None
+        self._finder = None
+        self._lock = threading.Lock()
+
+    def begin_import_timing(self):
+        """Start timing imports (call before the application's imports)"""
+        if self._finder is None:
+            self._import_started = time.perf_counter()
+            self._finder = ImportTimingFinder(self)
+            sys.meta_path.insert(0, self._finder)
+
+    def end_import_timing(self):
+        """Stop timing imports and record the total application import time"""
+        if self._finder is not None:
+            sys.meta_path.remove(self._finder)
+            self._finder = None
+            self.app_import_seconds = time.perf_counter() - self._import_started
+
+    def record_import(self, name, seconds):
+        with self._lock:
+            self.imports[name] = seconds
+
+    def record_service(self, name, seconds):
+        with self._lock:
+            self.services[name] = {'pid': os.getpid(), 'init_seconds': seconds}
+
+    def snapshot(self, limit=15):
+        """
+        Startup costs for the report endpoint
+
+        Args:
+            limit: Number of slowest imports to include
+
+        Returns:
+            dict: app import time, slowest imports and per-service init times
+        """
+        with self._lock:
+            imports = sorted(self.imports.items(), key=lambda item: item[1], reverse=True)[:limit]
+            services = {name: dict(info, init_seconds=round(info['init_seconds'], 4))
+                        for name, info in self.services.items()}
+        return {
+            'pid': os.getpid(),
+            'import_pid': self.pid,
+            'app_import_seconds': round(self.app_import_seconds, 4) if self.app_import_seconds else None,
+            'slowest_imports': [{'module': name, 'seconds': round(seconds, 4)} for name, seconds in imports],
+            'services': services
+        }
+
+    def summary(self, limit=3):
+        """One-line summary for the startup log"""
+        slowest = sorted(self.imports.items(), key=lambda item: item[1], reverse=True)[:limit]
+        slowest_text = ', '.join(f"{name} {seconds * 1000:.0f}ms" for name, seconds in slowest)
+        return f"App imported in {(self.app_import_seconds or 0) * 1000:.0f}ms (slowest: {slowest_text})"
+
+
+class TimedLoader:
+    """Loader wrapper that records how long a module takes to execute"""
+
+    def __init__(self, loader, report):
+        self._loader = loader
+        self._report = report
+
+    def create_module(self, spec):
+        return self._loader.create_module(spec)
+
+    def exec_module(self, module):
+        started = time.perf_counter()
+        try:
+            self._loader.exec_module(module)
+        finally:
+            self._report.record_import(module.__name__, time.perf_counter() - started)
+
+    def __getattr__(self, name):
+        return getattr(self._loader, name)
+
+
+class ImportTimingFinder(MetaPathFinder):
+    """Meta path hook that wraps the loaders of top-level modules in TimedLoader"""
+
+    def __init__(self, report):
+        self.report = report
+
+    def find_spec(self, fullname, path, target=None):
+        if '.' in fullname:
+            return None
+
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, 'find_spec'):
+                continue
+            spec = finder.find_spec(fullname, path, target)
+            if spec is None:
+                continue
+            if spec.loader is not None and hasattr(spec.loader, 'exec_module'):
+                spec.loader = TimedLoader(spec.loader, self.report)
+            return spec
+        return None
+
+
+startup_report = StartupReport()
+
+
+class LazyService:
+    """
+    Build a service on first use, once per process
+
+    Attribute access is forwarded to the real instance, so callers use the
+    provider exactly like the service. A process forked after the service was
+    built (e.g. gunicorn --preload) gets its own fresh instance rather than
+    sharing clients, sockets and threads with its parent.
+    """
+
+    def __init__(self, name, factory):
+        self._name = name
+        self._factory = factory
+        self._instance = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        """The service instance for this process, created if needed"""
+        pid = os.getpid()
+        if self._pid != pid:
+            with self._lock:
+                if self._pid != pid:
+                    started = time.perf_counter()
+                    self._instance = self._factory()
+                    self._pid = pid
+                    startup_report.record_service(self._name, time.perf_counter() - started)
+        return self._instance
+
+    def __getattr__(self, name):
+        return getattr(self.get(), name)
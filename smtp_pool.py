@@ -0,0 +1,218 @@
+# SMTP connection pool for AIscribe - reuse authenticated sessions across sends
+
+import smtplib
+import threading
+import time
+from contextlib import contextmanager
+from logger_config import setup_logger
+
+logger = setup_logger('EmailService')
+
+# Errors that mean the session is unusable and the send can be retried on a fresh one
+STALE_SESSION_ERRORS = (smtplib.SMTPServerDisconnected, ConnectionError, TimeoutError)
+
+
+class PooledConnection:
+    """An authenticated SMTP session plus its bookkeeping"""
+
+    def __init__(self, smtp):
+        self.smtp = smtp
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+        self.messages_sent = 0
+
+
+class SMTPConnectionPool:
+    """
+    Thread-safe pool of logged-in SMTP connections
+
+    Idle connections are checked with NOOP before reuse once they have been idle
+    for keepalive_after_seconds, closed after max_idle_seconds (by a reaper timer
+    that runs while anything is idle), and retired after
+    max_messages_per_connection sends. A send that hits a stale session is
+    retried once on a fresh connection.
+    """
+
+    def __init__(self, server, port, username, password, max_connections=2, max_idle_seconds=120,
+                 keepalive_after_seconds=15, max_messages_per_connection=50, timeout=30, starttls=True):
+        self.server = server
+        self.port = port
+        self.username = username
+        self.password = password
+        self.max_connections = max_connections
+        self.max_idle_seconds = max_idle_seconds
+        self.keepalive_after_seconds = keepalive_after_seconds
+        self.max_messages_per_connection = max_messages_per_connection
+        self.timeout = timeout
+        self.starttls = starttls
+        self._idle = []
+        self._reaper = None
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_connections)
+        self._stats = {'connections_opened': 0, 'connections_reused': 0, 'connections_closed': 0, 'reconnects': 0}
+
+    def send_message(self, message):
+        """
+        Send a message on a pooled connection
+
+        Args:
+            message: email.message.Message to send
+
+        Returns:
+            dict: Refused recipients, as returned by smtplib.SMTP.send_message
+        """
+        try:
+            with self.connection() as smtp:
+                return smtp.send_message(message)
+        except STALE_SESSION_ERRORS as e:
+            logger.warning(f"⚠️ SMTP session went stale ({str(e)}), retrying on a new connection")
+            self._count('reconnects')
+            with self.connection(fresh=True) as smtp:
+                return smtp.send_message(message)
+
+    @contextmanager
+    def connection(self, fresh=False):
+        """
+        Borrow a connection for the duration of the block
+
+        Connections are returned to the pool on success and closed if the block
+        raises, since the session state is then unknown.
+
+        Args:
+            fresh: Always open a new connection instead of reusing an idle one
+        """
+        self._slots.acquire()
+        try:
+            pooled = None if fresh else self._take_idle()
+            if pooled is None:
+                pooled = self._open()
+
+            try:
+                yield pooled.smtp
+            except BaseException:
+                self._close(pooled)
+                raise
+
+            pooled.messages_sent += 1
+            pooled.last_used = time.monotonic()
+            if pooled.messages_sent >= self.max_messages_per_connection:
+                logger.info(f"♻️ Retiring SMTP connection after {pooled.messages_sent} messages")
+                self._close(pooled)
+            else:
+                self.evict_idle()
+                with self._lock:
+                    self._idle.append(pooled)
+                self._schedule_reaper()
+        finally:
+            self._slots.release()
+
+    def close_all(self):
+        """Close every idle connection (e.g. at shutdown)"""
+        with self._lock:
+            idle, self._idle = self._idle, []
+            if self._reaper is not None:
+                self._reaper.cancel()
+                self._reaper = None
+        for pooled in idle:
+            self._close(pooled)
+
+    def evict_idle(self):
+        """
+        Close idle connections unused for longer than max_idle_seconds
+
+        Returns:
+            int: Number of connections closed
+        """
+        now = time.monotonic()
+        with self._lock:
+            expired = [pooled for pooled in self._idle if now - pooled.last_used > self.max_idle_seconds]
+            self._idle = [pooled for pooled in self._idle if pooled not in expired]
+        for pooled in expired:
+            self._close(pooled)
+        if expired:
+            logger.info(f"🧹 Closed {len(expired)} idle SMTP connection(s)")
+        return len(expired)
+
+    def stats(self):
+        """
+        Pool counters for this process
+
+        Returns:
+            dict: idle connection count plus open/reuse/close/reconnect counters
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats['idle'] = len(self._idle)
+        return stats
+
+    def _take_idle(self):
+        """Pop the most recently used healthy idle connection, discarding stale ones"""
+        while True:
+            with self._lock:
+                if not self._idle:
+                    return None
+                pooled = self._idle.pop()
+
+            idle_for = time.monotonic() - pooled.last_used
+            if idle_for > self.max_idle_seconds:
+                self._close(pooled)
+                continue
+
+            if idle_for > self.keepalive_after_seconds and not self._is_alive(pooled):
+                self._close(pooled)
+                continue
+
+            self._count('connections_reused')
+            return pooled
+
+    def _schedule_reaper(self):
+        """Arm a timer for when the oldest idle connection expires, unless one is pending"""
+        with self._lock:
+            if self._reaper is not None or not self._idle:
+                return
+            oldest = min(pooled.last_used for pooled in self._idle)
+            delay = max(oldest + self.max_idle_seconds - time.monotonic(), 0) + 0.1
+            self._reaper = threading.Timer(delay, self._reap)
+            self._reaper.daemon = True
+            self._reaper.start()
+
+    def _reap(self):
+        """Reaper timer: close expired sessions, then re-arm for the ones still idle"""
+        with self._lock:
+            self._reaper = None
+        self.evict_idle()
+        self._schedule_reaper()
+
+    def _is_alive(self, pooled):
+        """Keep-alive check: NOOP must answer 250"""
+        try:
+            return pooled.smtp.noop()[0] == 250
+        except (smtplib.SMTPException, OSError):
+            return False
+
+    def _open(self):
+        """Connect, upgrade to TLS and log in"""
+        smtp = smtplib.SMTP(self.server, self.port, timeout=self.timeout)
+        try:
+            if self.starttls:
+                smtp.starttls()  # Upgrade to secure connection
+            smtp.login(self.username, self.password)
+        except BaseException:
+            smtp.close()
+            raise
+
+        self._count('connections_opened')
+        logger.info(f"🔌 Opened SMTP connection to {self.server}:{self.port}")
+        return PooledConnection(smtp)
+
+    def _close(self, pooled):
+        """Politely end a session, ignoring servers that already hung up"""
+        try:
+            pooled.smtp.quit()
+        except (smtplib.SMTPException, OSError):
+            pooled.smtp.close()
+        self._count('connections_closed')
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
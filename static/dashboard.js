@@ -1,6 +1,15 @@
 // Dashboard JavaScript for Recordings
 
-let recordings = [];
+// Patient folders are loaded one page at a time; recordings load when a folder is expanded
+const PATIENTS_PAGE_SIZE = 20;
+const RECORDINGS_PAGE_SIZE = 20;
+let patientsCursor = null;
+let patientGroupCount = 0;
+let currentSort = 'newest';
+let currentSearch = '';
+let searchTimer = null;
+let patientRecordings = {};
+let inboxCheckedAt = {};  // Server time of the last inbox check per patient
 
 // Load recordings on page load
 document.addEventListener('DOMContentLoaded', () => {
@@ -132,6 +141,12 @@ function togglePatientGroup(index) {
         if (patientGroup.classList.contains('collapsed')) {
             patientGroup.classList.remove('collapsed');
             patientGroup.classList.add('expanded');
+            
+            // Lazily load this patient's recordings the first time the folder opens
+            const patientId = patientGroup.dataset.patientId;
+            if (!patientRecordings[patientId]) {
+                loadPatientRecordings(patientId, index);
+            }
         } else {
             patientGroup.classList.remove('expanded');
             patientGroup.classList.add('collapsed');
@@ -154,16 +169,30 @@ function startRecordingSession() {
     window.location.href = `/record/${encodeURIComponent(patientId)}?type=${recordingType}`;
 }
 
-async function loadRecordings() {
+async function loadRecordings(append = false) {
     const listContainer = document.getElementById('recordingsList');
     
+    if (!append) {
+        patientsCursor = null;
+        patientGroupCount = 0;
+        patientRecordings = {};
+    }
+    
     try {
-        const response = await fetch('/api/recordings');
+        const params = new URLSearchParams({ limit: PATIENTS_PAGE_SIZE, sort: currentSort });
+        if (currentSearch) {
+            params.set('search', currentSearch);
+        }
+        if (append && patientsCursor) {
+            params.set('cursor', patientsCursor);
+        }
+        
+        const response = await fetch(`/api/patients?${params}`);
         const data = await response.json();
         
         if (data.success) {
-            recordings = data.recordings;
-            renderRecordings(recordings);
+            patientsCursor = data.next_cursor;
+            renderPatientGroups(data.patients, append);
         } else {
             listContainer.innerHTML = '<div class="empty-message">No recordings found. Click START to begin!</div>';
         }
@@ -173,27 +202,28 @@ async function loadRecordings() {
     }
 }
 
-function renderRecordings(recordingsList) {
+function renderPatientGroups(patients, append) {
     const listContainer = document.getElementById('recordingsList');
     
-    if (!recordingsList || recordingsList.length === 0) {
-        listContainer.innerHTML = '<div class="empty-message">No recordings found. Click START to begin!</div>';
+    if (!append && (!patients || patients.length === 0)) {
+        listContainer.innerHTML = currentSearch
+            ? renderNoResults(currentSearch)
+            : '<div class="empty-message">No recordings found. Click START to begin!</div>';
         return;
     }
-
-    // Group recordings by patient (folder structure)
-    const groupedRecordings = groupByPatient(recordingsList);
     
     let html = '';
-    let index = 0;
-    for (const [patientId, items] of Object.entries(groupedRecordings)) {
+    for (const patient of patients) {
+        const patientId = patient.patient_id;
+        const count = patient.recording_count;
+        const index = patientGroupCount++;
         html += `
             <div class="patient-group collapsed" data-patient-index="${index}" data-patient-id="${patientId}">
                 <div class="patient-group-header">
                     <div class="patient-group-icon">📁</div>
                     <div class="patient-group-info" onclick="togglePatientGroup(${index})">
                         <h3 class="patient-group-name">${patientId}</h3>
-                        <p class="patient-group-count">${items.length} recording${items.length > 1 ? 's' : ''}</p>
+                        <p class="patient-group-count">${count} recording${count > 1 ? 's' : ''}</p>
                     </div>
                     <button class="summary-icon-btn" onclick="event.stopPropagation(); openPatientSummary('${patientId}')" title="Patient Health Summary">
                         <svg viewBox="0 0 24 24" fill="none">
@@ -208,14 +238,68 @@ function renderRecordings(recordingsList) {
                     <div class="patient-group-toggle" onclick="togglePatientGroup(${index})">▼</div>
                 </div>
                 <div class="patient-recordings">
-                    ${items.map(recording => renderRecordingItem(recording)).join('')}
+                    <div class="loading-message">Loading recordings...</div>
                 </div>
             </div>
         `;
-        index++;
     }
     
-    listContainer.innerHTML = html;
+    const existingLoadMore = listContainer.querySelector('.load-more-patients');
+    if (existingLoadMore) {
+        existingLoadMore.remove();
+    }
+    
+    if (append) {
+        listContainer.insertAdjacentHTML('beforeend', html);
+    } else {
+        listContainer.innerHTML = html;
+    }
+    
+    if (patientsCursor) {
+        listContainer.insertAdjacentHTML('beforeend', `
+            <button class="btn-modal-primary load-more-patients" onclick="loadRecordings(true)">
+                Load more patients
+            </button>
+        `);
+    }
+}
+
+async function loadPatientRecordings(patientId, index) {
+    const patientGroup = document.querySelector(`[data-patient-index="${index}"]`);
+    const container = patientGroup.querySelector('.patient-recordings');
+    const state = patientRecordings[patientId] || { items: [], cursor: null };
+    patientRecordings[patientId] = state;
+    
+    try {
+        const params = new URLSearchParams({ limit: RECORDINGS_PAGE_SIZE });
+        if (state.cursor) {
+            params.set('cursor', state.cursor);
+        }
+        
+        const response = await fetch(`/api/patients/${encodeURIComponent(patientId)}/recordings?${params}`);
+        const data = await response.json();
+        
+        if (!data.success) {
+            throw new Error(data.error || 'Failed to load recordings');
+        }
+        
+        state.items = state.items.concat(data.recordings);
+        state.cursor = data.next_cursor;
+        
+        let html = state.items.map(recording => renderRecordingItem(recording)).join('');
+        if (state.cursor) {
+            html += `
+                <button class="btn-modal-primary load-more-recordings" onclick="loadPatientRecordings('${patientId}', ${index})">
+                    Load more recordings
+                </button>
+            `;
+        }
+        container.innerHTML = html;
+    } catch (error) {
+        console.error(`Error loading recordings for ${patientId}:`, error);
+        delete patientRecordings[patientId];
+        container.innerHTML = '<div class="empty-message">Error loading recordings. Please try again.</div>';
+    }
 }
 
 function renderRecordingItem(recording) {
@@ -248,20 +332,6 @@ function renderRecordingItem(recording) {
     `;
 }
 
-function groupByPatient(recordingsList) {
-    const grouped = {};
-    
-    recordingsList.forEach(recording => {
-        const patientId = recording.patient_id || 'Unknown Patient';
-        if (!grouped[patientId]) {
-            grouped[patientId] = [];
-        }
-        grouped[patientId].push(recording);
-    });
-    
-    return grouped;
-}
-
 function groupByDate(recordingsList) {
     const grouped = {};
     
@@ -277,21 +347,9 @@ function groupByDate(recordingsList) {
 }
 
 function sortRecordings(sortBy) {
-    let sorted = [...recordings];
-    
-    switch (sortBy) {
-        case 'newest':
-            sorted.sort((a, b) => new Date(b.created_at) - new Date(a.created_at));
-            break;
-        case 'oldest':
-            sorted.sort((a, b) => new Date(a.created_at) - new Date(b.created_at));
-            break;
-        case 'name':
-            sorted.sort((a, b) => (a.title || '').localeCompare(b.title || ''));
-            break;
-    }
-    
-    renderRecordings(sorted);
+    // Patients are ordered server-side so pagination stays consistent
+    currentSort = sortBy;
+    loadRecordings();
 }
 
 function viewRecording(id) {
@@ -386,7 +444,12 @@ function renderEmailItem(email) {
     const directionIcon = isInbound ? '📩' : '📤';
     const directionText = isInbound ? 'Received from' : 'Sent to';
     const emailAddress = isInbound ? (email.from || 'Unknown') : (email.to || 'Unknown');
-    const sentStatus = email.sent === false ? ' <span style="color: #f59e0b;">(Not sent)</span>' : '';
+    let sentStatus = '';
+    if (email.sent === false) {
+        sentStatus = email.queued
+            ? ' <span style="color: #6b7280;">(Sending...)</span>'
+            : ' <span style="color: #f59e0b;">(Not sent)</span>';
+    }
     
     return `
         <div class="email-item ${isInbound ? 'email-inbound' : 'email-outbound'}">
@@ -419,7 +482,9 @@ async function refreshPatientInbox(patientId) {
         
         // Fetch inbox
         const response = await fetch(`/api/patient/${encodeURIComponent(patientId)}/fetch-inbox`, {
-            method: 'POST'
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ since: inboxCheckedAt[patientId] || null })
         });
         
         const data = await response.json();
@@ -451,6 +516,10 @@ async function loadEmailsForPatient(patientId) {
         const response = await fetch(`/api/patient/${encodeURIComponent(patientId)}/emails`);
         const data = await response.json();
         
+        if (data.checked_at) {
+            inboxCheckedAt[patientId] = data.checked_at;
+        }
+        
         const container = document.getElementById('emailThreadContainer');
         
         if (data.success && data.emails && data.emails.length > 0) {
@@ -550,7 +619,7 @@ async function sendReplyEmail(patientId, patientEmail) {
         const data = await response.json();
         
         if (data.success) {
-            alert('✅ Email sent successfully!');
+            alert('✅ Email queued for delivery!');
             // Clear compose form
             document.getElementById('composeBody').value = '';
             // Reload emails to show sent reply
@@ -569,58 +638,25 @@ async function sendReplyEmail(patientId, patientEmail) {
 }
 
 function filterPatients(searchTerm) {
-    const patientGroups = document.querySelectorAll('.patient-group');
-    let visibleCount = 0;
-    
-    if (!searchTerm) {
-        // Show all patient groups
-        patientGroups.forEach(group => {
-            group.style.display = 'block';
-            visibleCount++;
-        });
-    } else {
-        // Filter patient groups by name
-        const searchLower = searchTerm.toLowerCase();
-        
-        patientGroups.forEach(group => {
-            const patientNameElement = group.querySelector('.patient-group-name');
-            if (patientNameElement) {
-                const patientName = patientNameElement.textContent.toLowerCase();
-                
-                if (patientName.includes(searchLower)) {
-                    group.style.display = 'block';
-                    // Keep collapsed - don't auto-expand
-                    visibleCount++;
-                } else {
-                    group.style.display = 'none';
-                }
-            }
-        });
-    }
-    
-    // Show "no results" message if no matches
-    const listContainer = document.getElementById('recordingsList');
-    const existingNoResults = listContainer.querySelector('.no-results');
-    
-    if (visibleCount === 0 && searchTerm) {
-        if (!existingNoResults) {
-            const noResults = document.createElement('div');
-            noResults.className = 'no-results';
-            noResults.innerHTML = `
-                <svg viewBox="0 0 24 24" fill="none">
-                    <circle cx="11" cy="11" r="8" stroke="currentColor" stroke-width="2"/>
-                    <path d="M21 21l-4.35-4.35" stroke="currentColor" stroke-width="2" stroke-linecap="round"/>
-                </svg>
-                <h3>No patients found</h3>
-                <p>No patients match "${searchTerm}". Try a different search term.</p>
-            `;
-            listContainer.appendChild(noResults);
-        }
-    } else {
-        if (existingNoResults) {
-            existingNoResults.remove();
-        }
-    }
+    // Search runs server-side so patients on pages that are not loaded yet are found too
+    clearTimeout(searchTimer);
+    searchTimer = setTimeout(() => {
+        currentSearch = searchTerm;
+        loadRecordings();
+    }, 250);
+}
+
+function renderNoResults(searchTerm) {
+    return `
+        <div class="no-results">
+            <svg viewBox="0 0 24 24" fill="none">
+                <circle cx="11" cy="11" r="8" stroke="currentColor" stroke-width="2"/>
+                <path d="M21 21l-4.35-4.35" stroke="currentColor" stroke-width="2" stroke-linecap="round"/>
+            </svg>
+            <h3>No patients found</h3>
+            <p>No patients match "${searchTerm}". Try a different search term.</p>
+        </div>
+    `;
 }
 
 async function openPatientSummary(patientId) {
@@ -672,7 +708,7 @@ async function openPatientSummary(patientId) {
                         </div>
                         <div class="meta-item">
                             <span class="meta-label">Generated:</span>
-                            <span class="meta-value">${new Date().toLocaleString()}</span>
+                            <span class="meta-value">${new Date(data.generated_at || Date.now()).toLocaleString()}</span>
                         </div>
                         <div class="meta-item">
                             <span class="meta-label">Model:</span>
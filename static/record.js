@@ -208,19 +208,15 @@ async function submitRecording() {
             body: formData
         });
 
-        const result = await response.json();
+        const queued = await response.json();
 
-        if (!result.success) {
-            throw new Error(result.error || 'Processing failed');
+        if (!queued.success) {
+            throw new Error(queued.error || 'Processing failed');
         }
 
-        // Update processing steps
-        document.getElementById('processingStep').textContent = 'Transcription complete!';
-        await sleep(500);
-        document.getElementById('processingStep').textContent = 'Generating clinical summary...';
-        await sleep(500);
-        document.getElementById('processingStep').textContent = 'Generating MDM summary...';
-        await sleep(500);
+        // Processing continues in the background; follow the job until it finishes
+        document.getElementById('processingStep').textContent = 'Upload complete! Waiting for transcription...';
+        const result = await waitForJob(queued.job_id);
 
         // Display results
         displayResults(result);
@@ -232,6 +228,7 @@ async function submitRecording() {
         // Show recording section again
         document.getElementById('recordingSection').style.display = 'flex';
         document.getElementById('processingSection').style.display = 'none';
+        document.getElementById('resultsSection').style.display = 'none';
     }
 }
 
@@ -268,6 +265,133 @@ function saveAndReturn() {
     window.location.href = '/';
 }
 
+const STAGE_MESSAGES = {
+    transcription: 'Transcribing audio...',
+    clinical_summary: 'Generating clinical summary...',
+    mdm_summary: 'Generating MDM summary...',
+    email: 'Sending patient email...',
+    save_results: 'Saving results...'
+};
+
+function waitForJob(jobId) {
+    if (!window.EventSource) {
+        return pollJob(jobId);
+    }
+
+    // Stream progress events; fall back to polling if the stream drops
+    return new Promise((resolve, reject) => {
+        let source = null;
+        let lastEventId = 0;
+        let settled = false;
+
+        const finish = (callback) => {
+            settled = true;
+            source.close();
+            callback();
+        };
+
+        const connect = () => {
+            // Streams are capped server-side: each one resumes after the last event received
+            source = new EventSource(`/api/jobs/${jobId}/events?last_event_id=${lastEventId}`);
+
+            const track = (handler) => (e) => {
+                lastEventId = Number(e.lastEventId) || lastEventId;
+                handler(JSON.parse(e.data));
+            };
+
+            source.addEventListener('stage_started', track((event) => {
+                if (STAGE_MESSAGES[event.stage]) {
+                    document.getElementById('processingStep').textContent = STAGE_MESSAGES[event.stage];
+                }
+            }));
+
+            source.addEventListener('progress', track((event) => {
+                if (event.stage === 'transcription') {
+                    const elapsed = Math.round(event.elapsed_seconds || 0);
+                    document.getElementById('processingStep').textContent =
+                        `Transcribing audio... (${event.data.status}, ${elapsed}s)`;
+                }
+            }));
+
+            source.addEventListener('partial_result', track((event) => {
+                displayPartialResult(event.data);
+            }));
+
+            ['stage_completed', 'stage_failed', 'job_waiting', 'job_resumed'].forEach((name) => {
+                source.addEventListener(name, track(() => {}));
+            });
+
+            source.addEventListener('job_completed', track((event) => {
+                finish(() => resolve(event.data.result));
+            }));
+
+            source.addEventListener('job_failed', track((event) => {
+                finish(() => reject(new Error(event.data.error || 'Processing failed')));
+            }));
+
+            source.addEventListener('reconnect', () => {
+                source.close();
+                connect();
+            });
+
+            source.onerror = () => {
+                if (!settled) {
+                    finish(() => pollJob(jobId).then(resolve, reject));
+                }
+            };
+        };
+
+        connect();
+    });
+}
+
+async function pollJob(jobId) {
+    while (true) {
+        const response = await fetch(`/api/jobs/${jobId}`);
+        const data = await response.json();
+
+        if (!data.success) {
+            throw new Error(data.error || 'Unable to check processing status');
+        }
+
+        const job = data.job;
+
+        if (job.status === 'completed') {
+            return job.result;
+        }
+
+        if (job.status === 'failed') {
+            throw new Error(job.error || 'Processing failed');
+        }
+
+        if (job.stage && STAGE_MESSAGES[job.stage]) {
+            document.getElementById('processingStep').textContent = STAGE_MESSAGES[job.stage];
+        }
+
+        await sleep(2000);
+    }
+}
+
+function displayPartialResult(partial) {
+    // Show each section as soon as it exists while the rest keeps processing
+    document.getElementById('resultsSection').style.display = 'block';
+
+    if (partial.conversation_text !== undefined) {
+        document.getElementById('transcriptContent').textContent = partial.conversation_text || 'N/A';
+    }
+
+    if (partial.clinical_summary) {
+        const clinical = partial.clinical_summary;
+        document.getElementById('chiefComplaint').textContent = clinical.chief_complaint || 'N/A';
+        document.getElementById('historyPresentIllness').textContent = clinical.history_of_present_illness || 'N/A';
+        document.getElementById('assessmentPlan').textContent = clinical.assessment_plan || 'N/A';
+    }
+
+    if (partial.mdm_summary) {
+        document.getElementById('mdmContent').textContent = partial.mdm_summary.mdm_summary || 'N/A';
+    }
+}
+
 function sleep(ms) {
     return new Promise(resolve => setTimeout(resolve, ms));
 }
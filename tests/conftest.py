@@ -0,0 +1,54 @@
+"""Shared test setup: isolated storage and dummy API keys, set before config is imported"""
+
+import os
+import pytest
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+_storage = tempfile.mkdtemp(prefix='aiscribe-tests-')
+
+os.environ.setdefault('OPENROUTER_API_KEY', 'test-openrouter-key')
+os.environ.setdefault('OPENROUTER_API_KEY_BACKUP', 'test-openrouter-backup-key')
+os.environ.setdefault('OPENAI_API_KEY', 'test-openai-key')
+os.environ.setdefault('ASSEMBLYAI_API_KEY', 'test-assemblyai-key')
+os.environ.setdefault('UPLOAD_FOLDER', os.path.join(_storage, 'uploads'))
+os.environ.setdefault('USERS_DB_PATH', os.path.join(_storage, 'users.db'))
+os.environ.setdefault('LOG_FILE', os.path.join(_storage, 'aiscribe.log'))
+os.environ.setdefault('INBOX_SYNC_ENABLED', 'false')
+os.environ.setdefault('LOG_LEVEL', 'WARNING')
+
+
+@pytest.fixture
+def fake_assemblyai():
+    """Local AssemblyAI fake with the SDK pointed at it"""
+    import assemblyai as aai
+    from fake_assemblyai import FakeAssemblyAI
+
+    fake = FakeAssemblyAI(processing_seconds=1.0).start()
+    previous = (aai.settings.api_key, aai.settings.base_url)
+    aai.settings.api_key = 'test-assemblyai-key'
+    aai.settings.base_url = fake.url
+    yield fake
+    aai.settings.api_key, aai.settings.base_url = previous
+    fake.stop()
+
+
+@pytest.fixture
+def wait_for_job():
+    """Wait until a job on the app's queue reaches a status, and return its data"""
+    import app
+
+    def wait(job_id, status, timeout=5):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            job = app.job_queue.get_job(job_id)
+            if job and job['status'] == status:
+                return job
+            time.sleep(0.05)
+        raise AssertionError(f"job {job_id} never reached {status}")
+
+    return wait
@@ -0,0 +1,50 @@
+"""Model fallback chain metrics in AISummarizationService"""
+
+import pytest
+from ai_summarization_service import AISummarizationService
+from metrics import registry, LLM_ATTEMPTS_TOTAL, LLM_FALLBACKS_TOTAL
+
+
+def counter_value(metric, **labels):
+    key = (metric.name, tuple(str(labels.get(name, '')) for name in metric.labelnames))
+    return registry.snapshot().get(key, [0])[0]
+
+
+@pytest.fixture
+def service():
+    service = AISummarizationService()
+    service.hedge_enabled = False
+    return service
+
+
+def test_failover_counts_a_fallback_per_extra_attempt(service, monkeypatch):
+    outcomes = iter([False, False, True])
+
+    def call_openrouter(prompt, model, client, api_key_type, **options):
+        if next(outcomes):
+            return {'success': True, 'response': 'findings', 'model': model, 'model_used': model}
+        return {'success': False, 'error': 'rate limited', 'model': model}
+
+    monkeypatch.setattr(service, '_call_openrouter', call_openrouter)
+    labels = {'summary_type': 'transcript_chunk_findings', 'reason': 'failure'}
+    before = counter_value(LLM_FALLBACKS_TOTAL, **labels)
+
+    result = service._call_ai_with_fallback(
+        'prompt', 'Transcript Findings 3/7', template='transcript_chunk_findings', use_cache=False
+    )
+
+    assert result['success']
+    assert counter_value(LLM_FALLBACKS_TOTAL, **labels) - before == 2
+    assert counter_value(LLM_FALLBACKS_TOTAL, summary_type='Transcript Findings 3/7', reason='failure') == 0
+
+
+def test_cache_hit_before_any_attempt_is_counted(service, monkeypatch):
+    monkeypatch.setattr(service, '_call_openrouter', lambda *args, **kwargs: pytest.fail('cache hit must not call the API'))
+    service._store_cached_completion('cached prompt', service.fallback_model, None, 'clinical_summary', 'summary', service.fallback_model)
+    labels = {'model': service.fallback_model, 'key': 'Primary API', 'outcome': 'cache_hit'}
+    before = counter_value(LLM_ATTEMPTS_TOTAL, **labels)
+
+    result = service._call_ai_with_fallback('cached prompt', 'Clinical Summary', template='clinical_summary')
+
+    assert result['cached']
+    assert counter_value(LLM_ATTEMPTS_TOTAL, **labels) - before == 1
@@ -0,0 +1,52 @@
+"""process_transcription outcomes once the transcript is available"""
+
+import json
+import app
+
+TRANSCRIPTION = {
+    'success': True,
+    'full_text': 'Sore throat for three days.',
+    'dialogue': [{'speaker': 'Patient', 'text': 'Sore throat for three days.'}],
+    'confidence': 0.95,
+    'duration': 4.0,
+    'is_diarized': True
+}
+
+
+class FailingMDMService:
+    """Clinical summary succeeds, MDM generation fails"""
+
+    def generate_clinical_summary(self, conversation_text):
+        return {'success': True, 'chief_complaint': 'Sore throat', 'model_used': 'Clinical AI'}
+
+    def generate_medical_decision_making(self, conversation_text, clinical_summary):
+        return {'success': False, 'error': 'All 4 attempts failed'}
+
+
+def test_mdm_failure_still_saves_the_recording(monkeypatch, wait_for_job, tmp_path):
+    monkeypatch.setattr(app, 'ai_service', FailingMDMService())
+    patient_folder = tmp_path / 'patient-7'
+    patient_folder.mkdir()
+    params = {
+        'transcription_result': TRANSCRIPTION,
+        'filename': 'visit.wav',
+        'timestamp': '20261018_100000',
+        'patient_id': 'patient-7',
+        'patient_email': '',
+        'recording_type': 'conversation',
+        'patient_folder': str(patient_folder)
+    }
+
+    queued = app.job_queue.enqueue('process_audio', app.process_transcription, params)
+    result = wait_for_job(queued['job']['id'], 'completed')['result']
+
+    assert result['recording_id'] == 'patient-7/20261018_100000'
+    assert result['warning'] == 'MDM summary could not be generated'
+
+    saved = json.loads((patient_folder / '20261018_100000_results.json').read_text(encoding='utf-8'))
+    assert saved['clinical_summary']['chief_complaint'] == 'Sore throat'
+    assert saved['mdm_summary'] == {'success': False, 'error': 'MDM generation failed'}
+    assert not (patient_folder / '20261018_100000_email.json').exists()
+
+    recording_ids = [row['id'] for row in app.recording_catalog.list_recordings()]
+    assert 'patient-7/20261018_100000' in recording_ids
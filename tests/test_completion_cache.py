@@ -0,0 +1,47 @@
+"""CompletionCache lookups and hit/miss accounting"""
+
+import pytest
+from completion_cache import CompletionCache, make_cache_key
+
+
+def key(model):
+    return make_cache_key(model, 'prompt', 'system', None, 'clinical_summary', 1)
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return CompletionCache(db_path=str(tmp_path / 'completions.db'))
+
+
+def test_multi_key_lookup_counts_one_miss(cache):
+    assert cache.get_first([key('primary'), key('fallback')]) == (None, None)
+
+    stats = cache.stats()
+    assert stats['misses'] == 1
+    assert stats['hit_rate'] == 0
+
+
+def test_multi_key_lookup_prefers_earlier_keys(cache):
+    cache.put(key('fallback'), 'fallback answer', 'fallback', 'clinical_summary', 1)
+    cache.put(key('primary'), 'primary answer', 'primary', 'clinical_summary', 1)
+
+    found, entry = cache.get_first([key('primary'), key('fallback')])
+
+    assert found == key('primary')
+    assert entry['response'] == 'primary answer'
+    assert cache.stats()['memory_hits'] == 1
+
+
+def test_multi_key_lookup_reads_disk_once_and_counts_one_hit(tmp_path):
+    db_path = str(tmp_path / 'completions.db')
+    CompletionCache(db_path=db_path).put(key('fallback'), 'fallback answer', 'fallback', 'clinical_summary', 1)
+    cache = CompletionCache(db_path=db_path)
+
+    found, entry = cache.get_first([key('primary'), key('fallback')])
+
+    assert found == key('fallback')
+    assert entry == {'response': 'fallback answer', 'model_used': 'fallback', 'expires_at': entry['expires_at']}
+    stats = cache.stats()
+    assert (stats['disk_hits'], stats['misses'], stats['hit_rate']) == (1, 0, 1.0)
+    assert cache.get(key('fallback'))['response'] == 'fallback answer'
+    assert cache.stats()['memory_hits'] == 1
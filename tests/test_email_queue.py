@@ -0,0 +1,55 @@
+"""OutboundEmailQueue claims: each message is sent by exactly one dispatcher"""
+
+import threading
+import pytest
+from email_queue import OutboundEmailQueue
+
+
+@pytest.fixture
+def queues(tmp_path, monkeypatch):
+    """Queues sharing one database, like the dispatchers of several gunicorn workers"""
+    # Claims are driven by the tests, not by dispatcher threads
+    monkeypatch.setattr(OutboundEmailQueue, 'start', lambda self: None)
+    db_path = str(tmp_path / 'email_queue.db')
+    return [OutboundEmailQueue(email_service=None, db_path=db_path) for _ in range(4)]
+
+
+def enqueue(queue, index):
+    return queue.enqueue(f'patient{index}@example.com', 'Visit summary', '<p>Summary</p>', f'patient-{index}')
+
+
+def test_claimed_message_is_not_claimed_again(queues):
+    message_id = enqueue(queues[0], 1)
+
+    claimed = queues[0]._claim_next()
+
+    assert claimed['id'] == message_id
+    assert queues[1]._claim_next() is None
+    with queues[1]._connect() as conn:
+        row = conn.execute('SELECT status, claimed_at FROM outbound_emails WHERE id = ?', (message_id,)).fetchone()
+    assert row['status'] == 'sending'
+    assert row['claimed_at'] is not None
+
+
+def test_concurrent_dispatchers_claim_each_message_once(queues):
+    message_ids = [enqueue(queues[0], index) for index in range(30)]
+    claimed = []
+    claimed_lock = threading.Lock()
+    start = threading.Barrier(len(queues))
+
+    def dispatch(queue):
+        start.wait()
+        while True:
+            message = queue._claim_next()
+            if message is None:
+                return
+            with claimed_lock:
+                claimed.append(message['id'])
+
+    threads = [threading.Thread(target=dispatch, args=(queue,)) for queue in queues]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=30)
+
+    assert sorted(claimed) == sorted(message_ids)
@@ -0,0 +1,72 @@
+"""SMTPConnectionPool reuse and idle eviction"""
+
+import time
+import pytest
+from smtp_pool import PooledConnection, SMTPConnectionPool
+
+
+class FakeSMTP:
+    def __init__(self):
+        self.closed = False
+        self.sent = []
+
+    def send_message(self, message):
+        self.sent.append(message)
+        return {}
+
+    def noop(self):
+        return (250, b'OK')
+
+    def quit(self):
+        self.closed = True
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    pool = SMTPConnectionPool('smtp.example.com', 587, 'user', 'secret', max_connections=2, max_idle_seconds=0.2)
+    opened = []
+
+    def open_connection():
+        opened.append(FakeSMTP())
+        return PooledConnection(opened[-1])
+
+    monkeypatch.setattr(pool, '_open', open_connection)
+    pool.opened = opened
+    yield pool
+    pool.close_all()
+
+
+def test_idle_connection_is_reused(pool):
+    pool.send_message('first')
+    pool.send_message('second')
+
+    assert len(pool.opened) == 1
+    assert pool.opened[0].sent == ['first', 'second']
+    assert pool.stats()['connections_reused'] == 1
+
+
+def test_release_evicts_expired_idle_connections(pool):
+    with pool.connection():
+        with pool.connection():
+            pass
+    stale = pool.opened[1]
+    pool._idle[0].last_used -= 1
+
+    with pool.connection():
+        pass
+
+    assert stale.closed
+    assert pool.stats()['idle'] == 1
+
+
+def test_reaper_closes_idle_connections_without_further_sends(pool):
+    pool.send_message('only')
+
+    time.sleep(0.5)
+
+    assert pool.opened[0].closed
+    assert pool.stats()['idle'] == 0
+    assert pool.stats()['connections_closed'] == 1
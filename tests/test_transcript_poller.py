@@ -0,0 +1,54 @@
+"""TranscriptPoller against the local AssemblyAI fake"""
+
+import time
+import assemblyai as aai
+from transcript_poller import TranscriptPoller, fetch_transcript
+
+AUDIO = {'audio_url': 'http://127.0.0.1/uploads/visit.wav'}
+
+
+def test_fetch_transcript_returns_without_waiting(fake_assemblyai):
+    transcript_id = fake_assemblyai.create_transcript(AUDIO, processing_seconds=30)['id']
+
+    transcript = fetch_transcript(transcript_id)
+
+    assert transcript.id == transcript_id
+    assert transcript.status == aai.TranscriptStatus.queued
+    assert fake_assemblyai.stats['status_requests'] == 1
+
+
+def test_short_transcript_resolves_before_long_one(fake_assemblyai):
+    poller = TranscriptPoller(min_interval=0.05, max_interval=0.1, jitter=0.1)
+    long_id = fake_assemblyai.create_transcript(AUDIO, processing_seconds=3.0)['id']
+    short_id = fake_assemblyai.create_transcript(AUDIO, processing_seconds=1.0)['id']
+    finished = []
+    progress = {long_id: [], short_id: []}
+    futures = {}
+
+    for transcript_id in (long_id, short_id):
+        futures[transcript_id] = poller.watch(transcript_id, progress_callback=progress[transcript_id].append)
+        futures[transcript_id].add_done_callback(lambda f, transcript_id=transcript_id: finished.append(transcript_id))
+
+    long = futures[long_id].result(timeout=10)
+    short = futures[short_id].result(timeout=10)
+    time.sleep(0.05)  # done callbacks run just after the result is set
+
+    assert finished == [short_id, long_id]
+    assert short.status == aai.TranscriptStatus.completed
+    assert short.text
+    assert long.status == aai.TranscriptStatus.completed
+
+    for statuses in progress.values():
+        assert statuses[0] == 'queued'
+        assert 'processing' in statuses
+        assert set(statuses) <= {'queued', 'processing'}
+
+
+def test_errored_transcript_resolves_with_error_status(fake_assemblyai):
+    fake_assemblyai.error_rate = 1.0
+    transcript_id = fake_assemblyai.create_transcript(AUDIO, processing_seconds=0.2)['id']
+
+    transcript = TranscriptPoller(min_interval=0.05, max_interval=0.1).watch(transcript_id).result(timeout=5)
+
+    assert transcript.status == aai.TranscriptStatus.error
+    assert transcript.error == 'Simulated transcription failure'
@@ -0,0 +1,47 @@
+"""Resuming audio jobs from a submitted transcript (webhook and polling paths)"""
+
+import time
+import assemblyai as aai
+import app
+from transcription_service import TranscriptionService
+
+AUDIO = {'audio_url': 'http://127.0.0.1/uploads/visit.wav'}
+
+
+def test_get_transcription_result_is_none_until_finished(fake_assemblyai):
+    service = TranscriptionService()
+    transcript_id = fake_assemblyai.create_transcript(dict(AUDIO, speaker_labels=True), processing_seconds=0.3)['id']
+
+    started = time.monotonic()
+    assert service.get_transcription_result(transcript_id) is None
+    assert time.monotonic() - started < 0.3
+
+    time.sleep(0.5)
+    result = service.get_transcription_result(transcript_id)
+    assert result['success']
+    assert result['full_text']
+    assert result['dialogue']
+    assert aai.settings.base_url == fake_assemblyai.url
+
+
+def test_resume_before_transcript_finishes_suspends_again(fake_assemblyai, wait_for_job, tmp_path):
+    transcript_id = fake_assemblyai.create_transcript(AUDIO, processing_seconds=30)['id']
+    params = {
+        'transcript_id': transcript_id,
+        'filepath': str(tmp_path / 'visit.wav'),
+        'filename': 'visit.wav',
+        'timestamp': '20261018_090000',
+        'patient_id': 'patient-1',
+        'patient_email': 'patient@example.com',
+        'recording_type': 'conversation',
+        'patient_folder': str(tmp_path)
+    }
+
+    queued = app.job_queue.enqueue('process_audio', app.resume_audio_pipeline, params)
+    job = wait_for_job(queued['job']['id'], 'waiting')
+
+    assert job['waiting_for'] == 'transcription'
+    assert job['transcript_id'] == transcript_id
+    assert job['suspensions'] == 1
+    assert fake_assemblyai.stats['status_requests'] == 1
+    assert transcript_id in app.transcription_service.poller._watches
@@ -0,0 +1,217 @@
+"""Shared background poller for outstanding AssemblyAI transcripts"""
+
+import contextvars
+import heapq
+import random
+import threading
+import time
+from concurrent.futures import Future
+import assemblyai as aai
+from logger_config import setup_logger
+from metrics import TRANSCRIPT_POLL_SECONDS, TRANSCRIPT_POLLS_PER_TRANSCRIPT
+from config import (
+    TRANSCRIPT_POLL_MIN_SECONDS, TRANSCRIPT_POLL_MAX_SECONDS, TRANSCRIPT_POLL_JITTER,
+    TRANSCRIPT_POLL_MAX_ERRORS
+)
+
+logger = setup_logger()
+
+# AssemblyAI usually returns a transcript within this fraction of the audio length
+EXPECTED_PROCESSING_RATIO = 0.15
+
+FINAL_STATUSES = ('completed', 'error')
+
+
+def fetch_transcript(transcript_id):
+    """
+    Fetch the current state of a transcript with a single status request
+
+    Unlike aai.Transcript.get_by_id, this does not wait for the transcript to
+    finish, so callers can check queued or processing transcripts and move on.
+
+    Args:
+        transcript_id: AssemblyAI transcript id
+
+    Returns:
+        aai.Transcript: Transcript in whatever status AssemblyAI reports now
+    """
+    client = aai.Client.get_default()
+    response = aai.api.get_transcript(client.http_client, transcript_id)
+    return aai.Transcript.from_response(client=client, response=response)
+
+
+class TranscriptWatch:
+    """Polling state for one transcript id"""
+
+    def __init__(self, transcript_id, audio_duration, progress_callback, min_interval):
+        self.transcript_id = transcript_id
+        self.audio_duration = audio_duration
+        self.progress_callback = progress_callback
+        self.min_interval = min_interval
+        self.started = time.monotonic()
+        self.errors = 0
+        self.polls = 0
+        self.future = Future()
+        # Polls run on the poller thread but log under the requesting job's correlation id
+        self.context = contextvars.copy_context()
+
+
+class TranscriptPoller:
+    """
+    Poll every outstanding transcript from one background thread
+
+    Callers get a Future that resolves to the finished AssemblyAI transcript.
+    Each transcript is checked on its own schedule: sparsely while it is
+    expected to still be processing (based on the audio duration), then at an
+    interval that grows with the time already waited, always with jitter so
+    many transcripts submitted together do not poll in lockstep.
+    """
+
+    def __init__(self, fetch=None, min_interval=TRANSCRIPT_POLL_MIN_SECONDS,
+                 max_interval=TRANSCRIPT_POLL_MAX_SECONDS, jitter=TRANSCRIPT_POLL_JITTER,
+                 max_errors=TRANSCRIPT_POLL_MAX_ERRORS):
+        self._fetch = fetch or fetch_transcript
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.jitter = jitter
+        self.max_errors = max_errors
+        self._watches = {}
+        self._schedule = []
+        self._condition = threading.Condition()
+        self._thread = None
+
+    def watch(self, transcript_id, audio_duration=None, progress_callback=None, min_interval=None):
+        """
+        Start tracking a submitted transcript
+
+        Watching an id that is already tracked returns the existing future.
+
+        Args:
+            transcript_id: AssemblyAI transcript id
+            audio_duration: Audio length in seconds, if known or estimated
+            progress_callback: Optional callable invoked with the status on every poll
+            min_interval: Optional lower bound on the polling interval for this transcript
+
+        Returns:
+            Future: Resolves to the transcript once it is completed or errored
+        """
+        with self._condition:
+            existing = self._watches.get(transcript_id)
+            if existing is not None:
+                return existing.future
+
+            watch = TranscriptWatch(transcript_id, audio_duration, progress_callback, min_interval)
+            self._watches[transcript_id] = watch
+            heapq.heappush(self._schedule, (watch.started + self._next_interval(watch), transcript_id))
+
+            # Start lazily so each gunicorn worker gets its own thread after fork
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='aiscribe-transcript-poller', daemon=True)
+                self._thread.start()
+
+            self._condition.notify()
+
+        logger.info(f"👀 Watching transcript {transcript_id} ({len(self._watches)} outstanding)")
+        return watch.future
+
+    def stats(self):
+        """
+        Outstanding transcripts for this process
+
+        Returns:
+            dict: outstanding count and the oldest wait in seconds
+        """
+        with self._condition:
+            started = [watch.started for watch in self._watches.values()]
+        return {
+            'outstanding': len(started),
+            'oldest_wait_seconds': round(time.monotonic() - min(started), 1) if started else None
+        }
+
+    def _run(self):
+        """Poller thread: sleep until the next transcript is due, then check it"""
+        while True:
+            with self._condition:
+                while not self._schedule:
+                    self._condition.wait()
+
+                due_at, transcript_id = self._schedule[0]
+                delay = due_at - time.monotonic()
+                if delay > 0:
+                    # Woken early by watch() when a sooner check is scheduled
+                    self._condition.wait(delay)
+                    continue
+
+                heapq.heappop(self._schedule)
+                watch = self._watches.get(transcript_id)
+
+            if watch is not None:
+                watch.context.run(self._poll, watch)
+
+    def _poll(self, watch):
+        """Check one transcript and either resolve its future or reschedule it"""
+        watch.polls += 1
+
+        try:
+            with TRANSCRIPT_POLL_SECONDS.time():
+                transcript = self._fetch(watch.transcript_id)
+        except Exception as e:
+            watch.errors += 1
+            if watch.errors >= self.max_errors:
+                logger.error(f"❌ Giving up on transcript {watch.transcript_id} after {watch.errors} errors: {str(e)}")
+                self._finish(watch, error=e)
+            else:
+                logger.warning(f"⚠️ Error checking transcript {watch.transcript_id}: {str(e)}")
+                self._reschedule(watch)
+            return
+
+        watch.errors = 0
+        status = transcript.status.value
+
+        if status in FINAL_STATUSES:
+            logger.info(f"✓ Transcript {watch.transcript_id} {status} after {watch.polls} poll(s)")
+            TRANSCRIPT_POLLS_PER_TRANSCRIPT.observe(watch.polls, status=status)
+            self._finish(watch, transcript=transcript)
+            return
+
+        logger.info(f"⏳ Transcript {watch.transcript_id} {status}...")
+        if watch.progress_callback:
+            try:
+                watch.progress_callback(status)
+            except Exception as e:
+                logger.warning(f"⚠️ Transcript progress callback failed: {str(e)}")
+        self._reschedule(watch)
+
+    def _reschedule(self, watch):
+        with self._condition:
+            heapq.heappush(self._schedule, (time.monotonic() + self._next_interval(watch), watch.transcript_id))
+
+    def _finish(self, watch, transcript=None, error=None):
+        """Stop tracking a transcript and wake whoever waits on it"""
+        with self._condition:
+            self._watches.pop(watch.transcript_id, None)
+
+        if error is not None:
+            watch.future.set_exception(error)
+        else:
+            watch.future.set_result(transcript)
+
+    def _next_interval(self, watch):
+        """
+        Seconds until the next check of a transcript
+
+        Until the expected processing time has passed, wait for the remainder of
+        it; afterwards poll at 10% of the time already waited. The result is
+        clamped to [min_interval, max_interval] and jittered.
+        """
+        elapsed = time.monotonic() - watch.started
+        expected = (watch.audio_duration or 0) * EXPECTED_PROCESSING_RATIO
+
+        if elapsed < expected:
+            interval = expected - elapsed
+        else:
+            interval = elapsed * 0.1
+
+        interval = min(interval, self.max_interval)
+        interval = max(interval, watch.min_interval or self.min_interval)
+        return interval * random.uniform(1 - self.jitter, 1 + self.jitter)
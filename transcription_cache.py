@@ -0,0 +1,146 @@
+"""Content-addressed on-disk cache of transcription results"""
+
+import json
+import os
+import re
+import threading
+import time
+from logger_config import setup_logger
+from config import (
+    TRANSCRIPTION_CACHE_FOLDER, TRANSCRIPTION_CACHE_MAX_ENTRIES,
+    TRANSCRIPTION_CACHE_MAX_BYTES, TRANSCRIPTION_CACHE_MAX_AGE_DAYS
+)
+
+logger = setup_logger()
+
+DIGEST_PATTERN = re.compile(r'^[0-9a-f]{64}$')
+
+
+class TranscriptionCache:
+    """Store transcribe_audio results keyed by audio digest and diarization flag"""
+
+    def __init__(self, cache_folder=TRANSCRIPTION_CACHE_FOLDER, max_entries=TRANSCRIPTION_CACHE_MAX_ENTRIES,
+                 max_bytes=TRANSCRIPTION_CACHE_MAX_BYTES, max_age_days=TRANSCRIPTION_CACHE_MAX_AGE_DAYS):
+        self.cache_folder = cache_folder
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_days * 24 * 3600
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'stores': 0, 'evictions': 0}
+        os.makedirs(self.cache_folder, exist_ok=True)
+        logger.info(f"✓ TranscriptionCache initialized at {cache_folder}")
+
+    def get(self, audio_digest, enable_diarization):
+        """
+        Look up a cached transcription
+
+        Args:
+            audio_digest: SHA-256 hex digest of the audio bytes
+            enable_diarization: Diarization flag the result was produced with
+
+        Returns:
+            dict or None: Cached transcribe_audio result
+        """
+        path = self._path(audio_digest, enable_diarization)
+
+        try:
+            if time.time() - os.path.getmtime(path) > self.max_age_seconds:
+                self._remove(path)
+                self._count('misses')
+                return None
+
+            with open(path, 'r', encoding='utf-8') as f:
+                result = json.load(f)
+
+            # Touch the entry so eviction drops the least recently used first
+            os.utime(path, None)
+        except (FileNotFoundError, ValueError):
+            self._count('misses')
+            return None
+
+        self._count('hits')
+        return result
+
+    def put(self, audio_digest, enable_diarization, result):
+        """
+        Store a successful transcription and evict old entries
+
+        Args:
+            audio_digest: SHA-256 hex digest of the audio bytes
+            enable_diarization: Diarization flag the result was produced with
+            result: transcribe_audio result dict
+        """
+        path = self._path(audio_digest, enable_diarization)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+        self._count('stores')
+        self._evict()
+
+    def stats(self):
+        """
+        Cache counters for this process plus current disk usage
+
+        Returns:
+            dict: hits, misses, stores, evictions, hit_rate, entries, bytes
+        """
+        entries = self._entries()
+        with self._lock:
+            stats = dict(self._stats)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = round(stats['hits'] / lookups, 3) if lookups else None
+        stats['entries'] = len(entries)
+        stats['bytes'] = sum(size for _, _, size in entries)
+        return stats
+
+    def _path(self, audio_digest, enable_diarization):
+        """Cache file for a digest (validated so it can never escape the cache folder)"""
+        if not DIGEST_PATTERN.match(audio_digest or ''):
+            raise ValueError(f'Invalid audio digest: {audio_digest}')
+        suffix = 'diarized' if enable_diarization else 'notes'
+        return os.path.join(self.cache_folder, f"{audio_digest}_{suffix}.json")
+
+    def _entries(self):
+        """List (path, mtime, size) for every cache file"""
+        entries = []
+        for filename in os.listdir(self.cache_folder):
+            if not filename.endswith('.json'):
+                continue
+            path = os.path.join(self.cache_folder, filename)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((path, stat.st_mtime, stat.st_size))
+        return entries
+
+    def _evict(self):
+        """Drop expired entries, then least recently used ones beyond the size limits"""
+        entries = sorted(self._entries(), key=lambda entry: entry[1])
+        now = time.time()
+        total_bytes = sum(size for _, _, size in entries)
+        remaining = len(entries)
+
+        for path, mtime, size in entries:
+            expired = now - mtime > self.max_age_seconds
+            over_limit = remaining > self.max_entries or total_bytes > self.max_bytes
+            if not expired and not over_limit:
+                break
+            self._remove(path)
+            remaining -= 1
+            total_bytes -= size
+
+    def _remove(self, path):
+        """Delete a cache entry, ignoring races with other workers"""
+        try:
+            os.remove(path)
+            self._count('evictions')
+        except FileNotFoundError:
+            pass
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
@@ -1,30 +1,84 @@
 """AssemblyAI transcription service with speaker diarization"""
 
 import assemblyai as aai
-import time
+import os
+import wave
 from logger_config import setup_logger
-from config import ASSEMBLYAI_API_KEY
+from config import ASSEMBLYAI_API_KEY, ASSEMBLYAI_BASE_URL, TRANSCRIPTION_CACHE_ENABLED, AUDIO_BYTES_PER_SECOND_ESTIMATE
+from transcription_cache import TranscriptionCache
+from transcript_poller import TranscriptPoller, fetch_transcript
 
 logger = setup_logger()
 
+WEBHOOK_AUTH_HEADER = 'X-AIScribe-Webhook-Token'
+
 class TranscriptionService:
     """Handle audio transcription with speaker diarization using AssemblyAI"""
     
     def __init__(self):
         aai.settings.api_key = ASSEMBLYAI_API_KEY
+        if ASSEMBLYAI_BASE_URL:
+            aai.settings.base_url = ASSEMBLYAI_BASE_URL
+        self.cache = TranscriptionCache() if TRANSCRIPTION_CACHE_ENABLED else None
+        self.poller = TranscriptPoller()
         logger.info("✓ TranscriptionService initialized with AssemblyAI")
     
-    def transcribe_audio(self, audio_file_path, enable_diarization=True):
+    def transcribe_audio(self, audio_file_path, enable_diarization=True, progress_callback=None, audio_digest=None):
         """
         Transcribe audio file with optional speaker diarization
         
         Args:
             audio_file_path: Path to the audio file
             enable_diarization: Whether to enable speaker diarization (default: True)
+            progress_callback: Optional callable invoked with the transcript status on every poll
+            audio_digest: Optional SHA-256 of the audio bytes; enables the transcription cache
             
         Returns:
             dict: Contains transcript, speaker-labeled dialogue (if diarization enabled), and metadata
         """
+        cached = self.get_cached_transcription(audio_digest, enable_diarization)
+        if cached is not None:
+            return cached
+        
+        result = self._transcribe(audio_file_path, enable_diarization, progress_callback)
+        
+        if self.cache and audio_digest and result['success']:
+            self.cache.put(audio_digest, enable_diarization, result)
+        
+        return result
+    
+    def get_cached_transcription(self, audio_digest, enable_diarization=True):
+        """
+        Look up a previous transcription of the same audio
+        
+        Args:
+            audio_digest: SHA-256 of the audio bytes (None skips the cache)
+            enable_diarization: Diarization flag of the requested transcription
+            
+        Returns:
+            dict or None: Cached transcribe_audio result
+        """
+        if not (self.cache and audio_digest):
+            return None
+        
+        cached = self.cache.get(audio_digest, enable_diarization)
+        if cached is not None:
+            logger.info(f"♻️ Transcription cache hit for {audio_digest[:12]}, skipping AssemblyAI")
+        return cached
+    
+    def submit_transcription(self, audio_file_path, enable_diarization=True, webhook_url=None, webhook_secret=None):
+        """
+        Upload audio and queue it for transcription without waiting for the result
+        
+        Args:
+            audio_file_path: Path to the audio file
+            enable_diarization: Whether to enable speaker diarization
+            webhook_url: Optional URL AssemblyAI calls when the transcript is done
+            webhook_secret: Optional value sent in the webhook auth header
+            
+        Returns:
+            dict: Contains success flag and the AssemblyAI transcript_id
+        """
         try:
             logger.info(f"📤 Uploading audio file: {audio_file_path}")
             
@@ -41,46 +95,79 @@ class TranscriptionService:
                     speaker_labels=False
                 )
             
-            transcriber = aai.Transcriber()
-            transcript = transcriber.transcribe(audio_file_path, config=config)
-            
-            # Wait for transcription to complete
-            while transcript.status not in [aai.TranscriptStatus.completed, aai.TranscriptStatus.error]:
-                logger.info("⏳ Transcription in progress...")
-                time.sleep(3)
-                transcript = transcriber.get_transcript(transcript.id)
+            if webhook_url:
+                config.set_webhook(
+                    webhook_url,
+                    WEBHOOK_AUTH_HEADER if webhook_secret else None,
+                    webhook_secret or None
+                )
             
-            if transcript.status == aai.TranscriptStatus.error:
-                logger.error(f"❌ Transcription failed: {transcript.error}")
-                return {
-                    'success': False,
-                    'error': transcript.error
-                }
+            transcriber = aai.Transcriber()
+            transcript = transcriber.submit(audio_file_path, config=config)
             
-            logger.info("✓ Transcription completed successfully")
+            return {
+                'success': True,
+                'transcript_id': transcript.id,
+                'status': transcript.status.value
+            }
             
-            # Format the dialogue
-            if enable_diarization:
-                # Format with speaker labels
-                dialogue = self._format_dialogue(transcript)
-                logger.info(f"📝 Generated dialogue with {len(dialogue)} exchanges")
-            else:
-                # For summary notes, create a single entry with the full text
-                dialogue = [{
-                    'speaker': 'Doctor Notes',
-                    'text': transcript.text,
-                    'confidence': transcript.confidence if hasattr(transcript, 'confidence') else None
-                }]
-                logger.info(f"📝 Generated summary notes ({len(transcript.text)} characters)")
+        except Exception as e:
+            logger.error(f"❌ Error submitting transcription: {str(e)}")
+            return {
+                'success': False,
+                'error': str(e)
+            }
+    
+    def get_transcription_result(self, transcript_id, enable_diarization=True, audio_digest=None):
+        """
+        Fetch and format a submitted transcript
+        
+        Args:
+            transcript_id: AssemblyAI transcript id from submit_transcription
+            enable_diarization: Diarization flag the transcript was submitted with
+            audio_digest: Optional SHA-256 of the audio bytes; stores the result in the cache
             
+        Returns:
+            dict or None: Same shape as transcribe_audio, or None while still in progress
+        """
+        try:
+            # A single status check: a transcript that is still running returns None
+            transcript = fetch_transcript(transcript_id)
+        except Exception as e:
+            logger.error(f"❌ Error fetching transcript {transcript_id}: {str(e)}")
             return {
-                'success': True,
-                'full_text': transcript.text,
-                'dialogue': dialogue,
-                'confidence': transcript.confidence if hasattr(transcript, 'confidence') else None,
-                'duration': transcript.audio_duration if hasattr(transcript, 'audio_duration') else None,
-                'is_diarized': enable_diarization
+                'success': False,
+                'error': str(e)
             }
+        
+        if transcript.status not in [aai.TranscriptStatus.completed, aai.TranscriptStatus.error]:
+            return None
+        
+        result = self._build_result(transcript, enable_diarization)
+        
+        if self.cache and audio_digest and result['success']:
+            self.cache.put(audio_digest, enable_diarization, result)
+        
+        return result
+    
+    def _transcribe(self, audio_file_path, enable_diarization, progress_callback):
+        """Run the AssemblyAI transcription (see transcribe_audio)"""
+        submitted = self.submit_transcription(audio_file_path, enable_diarization)
+        if not submitted['success']:
+            return submitted
+        
+        if progress_callback:
+            progress_callback(submitted['status'])
+        
+        try:
+            # Wait for the shared poller to see the transcript finish
+            transcript = self.poller.watch(
+                submitted['transcript_id'],
+                audio_duration=self.estimate_audio_duration(audio_file_path),
+                progress_callback=progress_callback
+            ).result()
+            
+            return self._build_result(transcript, enable_diarization)
             
         except Exception as e:
             logger.error(f"❌ Error during transcription: {str(e)}")
@@ -89,6 +176,62 @@ class TranscriptionService:
                 'error': str(e)
             }
     
+    def estimate_audio_duration(self, audio_file_path):
+        """
+        Estimate the audio length in seconds (used to pace transcript polling)
+        
+        WAV files are measured exactly; other formats are estimated from the
+        file size at AUDIO_BYTES_PER_SECOND_ESTIMATE.
+        
+        Returns:
+            float or None: Estimated duration, or None if the file cannot be read
+        """
+        if audio_file_path.lower().endswith('.wav'):
+            try:
+                with wave.open(audio_file_path, 'rb') as audio:
+                    return audio.getnframes() / float(audio.getframerate())
+            except (OSError, EOFError, wave.Error):
+                pass  # Not a plain PCM WAV: fall back to the size estimate
+        
+        try:
+            return os.path.getsize(audio_file_path) / AUDIO_BYTES_PER_SECOND_ESTIMATE
+        except OSError:
+            return None
+    
+    def _build_result(self, transcript, enable_diarization):
+        """Turn a finished AssemblyAI transcript into the transcribe_audio result dict"""
+        if transcript.status == aai.TranscriptStatus.error:
+            logger.error(f"❌ Transcription failed: {transcript.error}")
+            return {
+                'success': False,
+                'error': transcript.error
+            }
+        
+        logger.info("✓ Transcription completed successfully")
+        
+        # Format the dialogue
+        if enable_diarization:
+            # Format with speaker labels
+            dialogue = self._format_dialogue(transcript)
+            logger.info(f"📝 Generated dialogue with {len(dialogue)} exchanges")
+        else:
+            # For summary notes, create a single entry with the full text
+            dialogue = [{
+                'speaker': 'Doctor Notes',
+                'text': transcript.text,
+                'confidence': transcript.confidence if hasattr(transcript, 'confidence') else None
+            }]
+            logger.info(f"📝 Generated summary notes ({len(transcript.text)} characters)")
+        
+        return {
+            'success': True,
+            'full_text': transcript.text,
+            'dialogue': dialogue,
+            'confidence': transcript.confidence if hasattr(transcript, 'confidence') else None,
+            'duration': transcript.audio_duration if hasattr(transcript, 'audio_duration') else None,
+            'is_diarized': enable_diarization
+        }
+    
     def _format_dialogue(self, transcript):
         """
         Format the transcript into speaker-labeled dialogue